@@ -0,0 +1,225 @@
+"""
+Archivo histórico comprimido de los registros importados.
+
+Reemplaza las copias completas de waze_events.json en processed_events/. En
+cada pasada solo se archivan los registros nuevos o cambiados, como un
+miembro gzip más al final del segmento activo (una línea JSON
+`[epoch, registro]` por registro). Los segmentos rotan por tamaño o
+antigüedad y un manifiesto lleva su rango de tiempo y cantidad de registros.
+
+Al vencer la retención, los segmentos viejos se pliegan en una base (el
+estado acumulado hasta ese momento) antes de borrarse, así `reconstruct`
+puede rearmar el estado en cualquier instante posterior a la base.
+
+Uso: python event_archive.py [--at 2024-05-01T12:00:00] [--output estado.json]
+"""
+
+import os
+import gzip
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "/app/data/archive")
+ARCHIVE_SEGMENT_BYTES = int(os.getenv("ARCHIVE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+ARCHIVE_SEGMENT_SECONDS = int(os.getenv("ARCHIVE_SEGMENT_SECONDS", "86400"))
+# 0 conserva todos los segmentos
+ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", "30"))
+
+MANIFEST_NAME = "manifest.json"
+BASE_NAME = "base.jsonl.gz"
+
+
+def segment_name(number):
+    return f"archive-{number:012d}.jsonl.gz"
+
+
+def apply_record(state, record):
+    """Aplica un registro sobre el estado igual que el importer ($set por event_id)."""
+    event_id = record.get("event_id")
+    if not event_id:
+        return
+    fields = {k: v for k, v in record.items() if k != "change"}
+    state.setdefault(event_id, {}).update(fields)
+
+
+def read_gzip_lines(path):
+    """Líneas JSON de un archivo gzip; un miembro final cortado (caída a mitad de escritura) se ignora."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    except (EOFError, gzip.BadGzipFile, ValueError) as e:
+        logger.warning(f"Fin inesperado en {path} ({e}), se usa lo leído hasta ahí")
+
+
+class EventArchive:
+    """Segmentos gzip de registros con manifiesto, retención y base compactada."""
+
+    def __init__(self, directory=ARCHIVE_DIR, segment_bytes=ARCHIVE_SEGMENT_BYTES,
+                 segment_seconds=ARCHIVE_SEGMENT_SECONDS, retention_days=ARCHIVE_RETENTION_DAYS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.retention_seconds = retention_days * 86400
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = self._load_manifest()
+        self._remove_orphans()
+        # Tras un reinicio se abre un segmento nuevo: nunca se escribe detrás de un miembro gzip cortado
+        self.resumed = bool(self.manifest["segments"])
+
+    # --- Manifiesto ---
+
+    def _load_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"base": None, "segments": []}
+
+    def _remove_orphans(self):
+        """Borra los segmentos ya plegados en la base que quedaron en disco por una caída tras guardar el manifiesto."""
+        segments = self.manifest["segments"]
+        if not self.manifest["base"] or not segments:
+            return
+        first = segments[0]["number"]
+        for name in os.listdir(self.directory):
+            if name.startswith("archive-") and name.endswith(".jsonl.gz") and int(name[8:20]) < first:
+                os.remove(os.path.join(self.directory, name))
+                logger.info(f"Archivo: segmento {name} ya plegado en la base, borrado")
+
+    def _save_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, path)
+
+    # --- Escritura ---
+
+    def _active_segment(self, now):
+        segments = self.manifest["segments"]
+        if segments and not self.resumed:
+            last = segments[-1]
+            if last["bytes"] < self.segment_bytes and now - last["created_at"] < self.segment_seconds:
+                return last
+        self.resumed = False
+        number = segments[-1]["number"] + 1 if segments else 1
+        segment = {"number": number, "file": segment_name(number), "created_at": now,
+                   "first_at": None, "last_at": None, "records": 0, "bytes": 0}
+        segments.append(segment)
+        return segment
+
+    def append(self, records, now=None):
+        """Archiva los registros como un miembro gzip nuevo del segmento activo."""
+        if not records:
+            return
+        now = time.time() if now is None else now
+        segment = self._active_segment(now)
+        path = os.path.join(self.directory, segment["file"])
+        lines = "".join(json.dumps([now, r], ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+                        for r in records)
+        with open(path, "ab") as f:
+            f.write(gzip.compress(lines.encode("utf-8")))
+            f.flush()
+            os.fsync(f.fileno())
+        if segment["first_at"] is None:
+            segment["first_at"] = now
+        segment["last_at"] = now
+        segment["records"] += len(records)
+        segment["bytes"] = os.path.getsize(path)
+        self.apply_retention(now)
+        self._save_manifest()
+
+    # --- Retención ---
+
+    def apply_retention(self, now=None):
+        """Pliega en la base los segmentos cerrados más viejos que la retención y los borra."""
+        if not self.retention_seconds:
+            return
+        now = time.time() if now is None else now
+        segments = self.manifest["segments"]
+        expired = [s for s in segments[:-1] if s["last_at"] is not None and now - s["last_at"] > self.retention_seconds]
+        if not expired:
+            return
+        state = self._load_base()
+        for segment in expired:
+            for _, record in read_gzip_lines(os.path.join(self.directory, segment["file"])):
+                apply_record(state, record)
+        self._write_base(state, expired[-1]["last_at"])
+        # El manifiesto deja de listarlos antes de borrarlos: una caída entre medio solo deja archivos
+        # sueltos (los limpia _remove_orphans), nunca un manifiesto que apunte a segmentos borrados
+        for segment in expired:
+            segments.remove(segment)
+        self._save_manifest()
+        for segment in expired:
+            os.remove(os.path.join(self.directory, segment["file"]))
+        logger.info(f"Archivo: {len(expired)} segmentos vencidos plegados en la base ({len(state)} eventos)")
+
+    def _load_base(self):
+        state = {}
+        if self.manifest["base"]:
+            for record in read_gzip_lines(os.path.join(self.directory, BASE_NAME)):
+                state[record["event_id"]] = record
+        return state
+
+    def _write_base(self, state, until):
+        path = os.path.join(self.directory, BASE_NAME)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for doc in state.values():
+                f.write(json.dumps(doc, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+        os.replace(tmp_path, path)
+        self.manifest["base"] = {"until": until, "events": len(state)}
+
+    # --- Lectura ---
+
+    def reconstruct(self, at=None):
+        """Estado {event_id: documento} tal como quedó en el instante `at` (epoch; None = ahora)."""
+        base = self.manifest["base"]
+        if at is not None and base and at < base["until"]:
+            raise ValueError(f"El archivo solo permite reconstruir desde {datetime.fromtimestamp(base['until']).isoformat()}")
+        state = self._load_base()
+        for segment in self.manifest["segments"]:
+            if at is not None and segment["first_at"] is not None and segment["first_at"] > at:
+                break
+            for archived_at, record in read_gzip_lines(os.path.join(self.directory, segment["file"])):
+                if at is not None and archived_at > at:
+                    break
+                apply_record(state, record)
+        return state
+
+    def stats(self):
+        segments = self.manifest["segments"]
+        return {
+            "segments": len(segments),
+            "records": sum(s["records"] for s in segments),
+            "bytes": sum(s["bytes"] for s in segments),
+            "base_events": self.manifest["base"]["events"] if self.manifest["base"] else 0,
+        }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Reconstruye el estado de los eventos desde el archivo histórico")
+    parser.add_argument("--directory", default=ARCHIVE_DIR)
+    parser.add_argument("--at", help="Instante ISO 8601 a reconstruir (por defecto, el último)")
+    parser.add_argument("--output", help="Escribe el estado reconstruido como JSON")
+    args = parser.parse_args()
+
+    archive = EventArchive(args.directory, retention_days=0)
+    at = datetime.fromisoformat(args.at).timestamp() if args.at else None
+    state = archive.reconstruct(at)
+    logger.info(f"Archivo: {archive.stats()}; estado reconstruido con {len(state)} eventos")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(list(state.values()), f, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,57 @@ import os
 import sys
 import time
 import logging
-import shutil
+import socket
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pymongo
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo.errors import ConnectionFailure
 import pymongo.errors
+import redis
+from redis.exceptions import ConnectionError as RedisConnectionError, ResponseError
+
+from event_log import read_from, Cursor, START
+from event_archive import EventArchive
+from mongo_layout import ensure_indexes, derived_fields, parse_time
+from json_stream import iter_records, iter_batches
+from metrics import Counter, Gauge, Histogram, LAG_BUCKETS, start_http_server
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger(__name__)
 
 MONGO_HOST = os.getenv('MONGO_HOST', 'storage_db')
 JSON_FILE_PATH = '/app/data/waze_events.json'
-PROCESSED_FILE_DIR = os.path.join(os.path.dirname(JSON_FILE_PATH), "processed_events")
+EVENT_LOG_DIR = os.getenv('EVENT_LOG_DIR', '/app/data/events')
 CHECK_INTERVAL_SECONDS = 15
+# Hasta dónde se importó: cursor del log segmentado e identidad del último waze_events.json procesado
+CHECKPOINT_PATH = os.getenv('IMPORT_CHECKPOINT_PATH', '/app/data/importer_checkpoint.json')
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '5000'))
+# Escrituras a Mongo: tamaño de cada bulk_write y cuántos escritores en paralelo
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+IMPORT_WRITERS = int(os.getenv('IMPORT_WRITERS', '1'))
+# Huellas de contenido recordadas para saltar escrituras que no cambian nada
+FINGERPRINT_CAPACITY = int(os.getenv('FINGERPRINT_CAPACITY', '1000000'))
+
+# EVENT_TRANSPORT=stream: consumir el Redis Stream que publica el scraper en lugar de leer archivos
+EVENT_TRANSPORT = os.getenv('EVENT_TRANSPORT', 'file')
+REDIS_HOST = os.getenv('REDIS_HOST', 'cache')
+EVENT_STREAM_KEY = os.getenv('EVENT_STREAM_KEY', 'waze:events')
+EVENT_STREAM_GROUP = os.getenv('EVENT_STREAM_GROUP', 'importer')
+EVENT_STREAM_CONSUMER = os.getenv('EVENT_STREAM_CONSUMER', socket.gethostname())
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '500'))
+STREAM_BATCH_MS = int(os.getenv('STREAM_BATCH_MS', '200'))
 
-os.makedirs(PROCESSED_FILE_DIR, exist_ok=True)
+EVENTS_READ = Counter('waze_importer_events_read_total', 'Registros leídos por origen', labels=('source',))
+WRITES = Counter('waze_importer_writes_total', 'Escrituras a Mongo por resultado (written, skipped, failed)', labels=('result',))
+PARSE_SECONDS = Histogram('waze_importer_parse_seconds', 'Tiempo en leer y decodificar un lote', labels=('source',))
+BULK_WRITE_SECONDS = Histogram('waze_importer_bulk_write_seconds', 'Latencia de cada bulk_write')
+INGEST_LAG = Histogram('waze_importer_ingest_lag_seconds', 'Ahora menos scrape_timestamp de cada registro escrito', buckets=LAG_BUCKETS)
+DOCUMENTS = Gauge('waze_importer_documents', 'Documentos en la colección (estimado desde los metadatos)')
+LAST_PASS = Gauge('waze_importer_last_pass_timestamp_seconds', 'Fin de la última pasada del importer (con stream, del último lote confirmado)')
 
 def connect_to_mongodb():
     for attempt in range(12):
@@ -33,52 +68,358 @@ def connect_to_mongodb():
             time.sleep(CHECK_INTERVAL_SECONDS)
     return None
 
-def ensure_mongo_index(collection):
+def connect_to_redis():
+    for attempt in range(12):
+        try:
+            client = redis.Redis(host=REDIS_HOST, port=6379, db=0)
+            client.ping()
+            logger.info("Conexión a Redis exitosa.")
+            return client
+        except RedisConnectionError as e:
+            logger.warning(f"Fallo de conexión a Redis: {e}. Reintentando...")
+            time.sleep(CHECK_INTERVAL_SECONDS)
+    return None
+
+def to_update(event):
+    # Los registros de cambio del scraper (updated/expired) solo traen los campos que cambiaron
+    fields = {k: v for k, v in event.items() if k != 'change'}
+    # Fechas, punto GeoJSON y comuna para las lecturas por tiempo, tipo y zona (ver mongo_layout)
+    fields.update(derived_fields(fields))
+    # ingested_at con la hora del servidor al escribir: la marca de agua del sondeo de export_mongo_to_elasticsearch
+    return pymongo.UpdateOne({'event_id': event.get('event_id')},
+                             {'$set': fields, '$currentDate': {'ingested_at': True}}, upsert=True)
+
+# hash64(event_id) -> hash64(registro) de lo último escrito, en orden LRU
+fingerprints = OrderedDict()
+fingerprints_lock = threading.Lock()
+write_stats = {'skipped': 0, 'written': 0, 'failed': 0, 'chunk_latencies': []}
+
+def hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+def fingerprint(event):
+    """Huella de 64 bits del registro normalizado (claves ordenadas, sin separadores extra)."""
+    return hash64(json.dumps(event, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8'))
+
+def remember(key, digest):
+    with fingerprints_lock:
+        fingerprints[key] = digest
+        fingerprints.move_to_end(key)
+        if len(fingerprints) > FINGERPRINT_CAPACITY:
+            fingerprints.popitem(last=False)
+
+def write_chunk(collection, chunk):
+    """Escribe un lote de (clave, huella, operación); devuelve (nuevos, actualizados, fallidos)."""
+    started = time.monotonic()
+    failed_indexes = set()
     try:
-        collection.create_index([("event_id", pymongo.ASCENDING)], unique=True)
-    except OperationFailure:
-        logger.info("El índice 'event_id' ya existe.")
+        result = collection.bulk_write([op for _, _, op in chunk], ordered=False)
+        imported, updated = result.upserted_count, result.modified_count
+    except pymongo.errors.BulkWriteError as bwe:
+        imported, updated = bwe.details.get('nUpserted', 0), bwe.details.get('nModified', 0)
+        failed_indexes = {error['index'] for error in bwe.details.get('writeErrors', [])}
+    except pymongo.errors.PyMongoError as e:
+        logger.error(f"Error escribiendo lote de {len(chunk)} operaciones: {e}")
+        imported, updated = 0, 0
+        failed_indexes = set(range(len(chunk)))
+    # Solo se recuerda la huella de lo que quedó escrito: al reintentar el lote, lo ya escrito se salta
+    for i, (key, digest, _) in enumerate(chunk):
+        if i not in failed_indexes:
+            remember(key, digest)
+    elapsed = time.monotonic() - started
+    write_stats['chunk_latencies'].append(elapsed)
+    BULK_WRITE_SECONDS.observe(elapsed)
+    WRITES.inc(len(chunk) - len(failed_indexes), result='written')
+    WRITES.inc(len(failed_indexes), result='failed')
+    return imported, updated, len(failed_indexes)
+
+def write_partition(collection, operations):
+    imported = updated = failed = 0
+    for start in range(0, len(operations), IMPORT_CHUNK_SIZE):
+        i, u, f = write_chunk(collection, operations[start:start + IMPORT_CHUNK_SIZE])
+        imported, updated, failed = imported + i, updated + u, failed + f
+    return imported, updated, failed
+
+class WriteFailed(Exception):
+    """Alguna escritura del lote falló: el llamador no debe avanzar su checkpoint ni confirmar el lote."""
 
 def import_events(collection, events):
-    if not events: return 0, 0
-    operations = [pymongo.UpdateOne({'event_id': e.get('event_id')}, {'$set': e}, upsert=True) for e in events if e.get('event_id')]
-    if not operations: return 0, 0
+    """Escribe los registros que cambiaron; devuelve (nuevos, actualizados, registros_cambiados).
+    Lanza WriteFailed si alguna escritura falla."""
+    if not events: return 0, 0, []
+    pending = {}
+    changed = []
+    partitions = [[] for _ in range(max(1, IMPORT_WRITERS))]
+    for e in events:
+        if not e.get('event_id'): continue
+        key = hash64(e['event_id'].encode('utf-8'))
+        digest = fingerprint(e)
+        if pending.get(key, fingerprints.get(key)) == digest:
+            write_stats['skipped'] += 1
+            WRITES.inc(result='skipped')
+            continue
+        pending[key] = digest
+        changed.append(e)
+        observe_lag(e)
+        # Un mismo event_id siempre cae en la misma partición, así sus cambios se aplican en orden
+        partitions[key % len(partitions)].append((key, digest, to_update(e)))
+    partitions = [p for p in partitions if p]
+    if not partitions: return 0, 0, []
+    if len(partitions) == 1:
+        results = [write_partition(collection, partitions[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(partitions)) as pool:
+            results = list(pool.map(lambda p: write_partition(collection, p), partitions))
+    imported = sum(r[0] for r in results)
+    updated = sum(r[1] for r in results)
+    failed = sum(r[2] for r in results)
+    write_stats['written'] += sum(len(p) for p in partitions) - failed
+    write_stats['failed'] += failed
+    if failed:
+        raise WriteFailed(f"{failed} de {len(changed)} escrituras fallaron")
+    return imported, updated, changed
+
+def observe_lag(event):
+    # scrape_timestamp lo escribe el scraper en UTC; los registros de cambio traen last_seen
+    scraped = parse_time(event.get('scrape_timestamp') or event.get('last_seen'))
+    if scraped is not None:
+        INGEST_LAG.observe(max(0.0, (datetime.utcnow() - scraped).total_seconds()))
+
+def log_write_stats():
+    latencies = sorted(write_stats['chunk_latencies'])
+    if latencies:
+        latency = f"{len(latencies)} lotes, latencia p50={latencies[len(latencies) // 2] * 1000:.0f}ms max={latencies[-1] * 1000:.0f}ms"
+    else:
+        latency = "sin lotes"
+    logger.info(f"Escrituras -> Saltadas (sin cambios): {write_stats['skipped']}, Escritas: {write_stats['written']}, "
+                f"Fallidas: {write_stats['failed']}; {latency}. Huellas en memoria: {len(fingerprints)}.")
+    write_stats.update(skipped=0, written=0, failed=0, chunk_latencies=[])
+
+def observe_pass(collection):
+    """Actualiza los gauges de documentos y de última pasada; devuelve el conteo."""
+    # Conteo desde los metadatos de la colección, no un recorrido completo en cada pasada
+    documents = collection.estimated_document_count()
+    DOCUMENTS.set(documents)
+    LAST_PASS.set(time.time())
+    return documents
+
+def load_checkpoint():
+    if not os.path.exists(CHECKPOINT_PATH):
+        return {'cursor': START, 'legacy_file': None}
     try:
-        result = collection.bulk_write(operations, ordered=False)
-        return result.upserted_count, result.modified_count
-    except pymongo.errors.BulkWriteError as bwe:
-        return bwe.details.get('nUpserted', 0), bwe.details.get('nModified', 0)
-    return 0, 0
+        with open(CHECKPOINT_PATH, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        checkpoint = {'cursor': Cursor(*state['cursor']), 'legacy_file': state.get('legacy_file')}
+        logger.info(f"Checkpoint cargado: log en {checkpoint['cursor']}.")
+        return checkpoint
+    except (ValueError, KeyError, TypeError, IOError) as e:
+        logger.warning(f"Checkpoint ilegible ({e}), se importa desde el principio.")
+        return {'cursor': START, 'legacy_file': None}
 
-def process_file(collection):
+def save_checkpoint(checkpoint):
+    tmp_path = f"{CHECKPOINT_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'cursor': list(checkpoint['cursor']), 'legacy_file': checkpoint['legacy_file']}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+def file_identity(path):
+    st = os.stat(path)
+    return [st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns]
+
+def process_file(collection, checkpoint, archive):
     if not os.path.exists(JSON_FILE_PATH): return
+    identity = file_identity(JSON_FILE_PATH)
+    # Mismo archivo (dispositivo, inodo, tamaño, mtime) que la pasada anterior: no hay nada nuevo
+    if identity == checkpoint['legacy_file']: return
     logger.info(f"Archivo JSON encontrado. Procesando...")
+    # Lectura incremental: en memoria solo queda un lote, sin importar el tamaño del archivo
+    total = imported = updated = 0
     try:
         with open(JSON_FILE_PATH, 'r', encoding='utf-8') as f:
-            events = json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
+            started = time.monotonic()
+            for batch in iter_batches(iter_records(f), IMPORT_BATCH_SIZE):
+                PARSE_SECONDS.observe(time.monotonic() - started, source='file')
+                EVENTS_READ.inc(len(batch), source='file')
+                try:
+                    batch_imported, batch_updated, changed = import_events(collection, batch)
+                except WriteFailed as e:
+                    # Sin marcar el archivo como leído: la próxima pasada lo relee y salta lo ya escrito
+                    logger.error(f"Archivo JSON: {e}; se reintenta en la próxima pasada.")
+                    return
+                # Solo lo que cambió va al archivo histórico, no una copia completa del archivo
+                archive.append(changed)
+                total, imported, updated = total + len(batch), imported + batch_imported, updated + batch_updated
+                started = time.monotonic()
+    except (ValueError, IOError) as e:
+        logger.error(f"Archivo JSON corrupto tras {total} eventos: {e}")
         os.rename(JSON_FILE_PATH, f"{JSON_FILE_PATH}.corrupt_{int(time.time())}")
         return
-    
-    if events:
-        imported, updated = import_events(collection, events)
-        logger.info(f"Resultado -> Nuevos: {imported}, Actualizados: {updated}.")
-    
-    # CAMBIO: Copiar en lugar de mover para preservar el archivo original
-    processed_path = os.path.join(PROCESSED_FILE_DIR, f"waze_events.{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-    shutil.copy2(JSON_FILE_PATH, processed_path)
-    logger.info(f"Archivo copiado como backup en {processed_path}.")
+    logger.info(f"Archivo JSON: {total} eventos. Resultado -> Nuevos: {imported}, Actualizados: {updated}.")
+    checkpoint['legacy_file'] = identity
+    save_checkpoint(checkpoint)
+
+def process_event_log(collection, checkpoint, archive):
+    """Importa en lotes los registros agregados al log desde el checkpoint y lo avanza tras cada lote."""
+    while True:
+        events = []
+        cursor = checkpoint['cursor']
+        started = time.monotonic()
+        for event, next_cursor in read_from(cursor, EVENT_LOG_DIR, limit=IMPORT_BATCH_SIZE):
+            events.append(event)
+            cursor = next_cursor
+        if not events:
+            return
+        PARSE_SECONDS.observe(time.monotonic() - started, source='log')
+        EVENTS_READ.inc(len(events), source='log')
+        try:
+            imported, updated, changed = import_events(collection, events)
+        except WriteFailed as e:
+            logger.error(f"Log de eventos: {e}; el checkpoint queda en {checkpoint['cursor']} y el lote se reintenta en la próxima pasada.")
+            return
+        archive.append(changed)
+        logger.info(f"Log de eventos: {len(events)} registros nuevos hasta {cursor}. Resultado -> Nuevos: {imported}, Actualizados: {updated}.")
+        checkpoint['cursor'] = cursor
+        save_checkpoint(checkpoint)
+        if len(events) < IMPORT_BATCH_SIZE:
+            return
+
+def ensure_stream_group(r_client):
+    try:
+        r_client.xgroup_create(EVENT_STREAM_KEY, EVENT_STREAM_GROUP, id='0', mkstream=True)
+        logger.info(f"Grupo '{EVENT_STREAM_GROUP}' creado en el stream '{EVENT_STREAM_KEY}'.")
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e): raise
+
+def parse_cursor(value):
+    if value is None: return None
+    segment, offset = value.decode().split(':')
+    return Cursor(int(segment), int(offset))
+
+def read_stream_batch(r_client, start_id):
+    """Junta mensajes hasta STREAM_BATCH_SIZE o hasta que pasen STREAM_BATCH_MS.
+    Devuelve los ids y (registro, cursor de inicio, cursor de fin) de cada mensaje válido."""
+    ids, entries = [], []
+    deadline = time.monotonic() + STREAM_BATCH_MS / 1000
+    while len(ids) < STREAM_BATCH_SIZE:
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0: break
+        response = r_client.xreadgroup(EVENT_STREAM_GROUP, EVENT_STREAM_CONSUMER, {EVENT_STREAM_KEY: start_id},
+                                       count=STREAM_BATCH_SIZE - len(ids), block=remaining_ms)
+        if not response or not response[0][1]: break
+        for message_id, fields in response[0][1]:
+            ids.append(message_id)
+            try:
+                # Los mensajes de scrapers anteriores no traen cursores
+                entries.append((json.loads(fields[b'data']), parse_cursor(fields.get(b'start')), parse_cursor(fields.get(b'end'))))
+            except (KeyError, ValueError):
+                logger.warning(f"Mensaje {message_id} mal formado en el stream, se descarta.")
+        # Los pendientes ('0') se leen de una vez; solo los mensajes nuevos ('>') esperan al lote
+        if start_id != '>': break
+    return ids, entries
+
+def catch_up(collection, checkpoint, archive, until):
+    """Importa del log, en lotes, los registros entre el checkpoint y `until` (los que no llegaron por el stream)."""
+    filled = 0
+    while checkpoint['cursor'] < until:
+        events, cursor = [], checkpoint['cursor']
+        for event, next_cursor in read_from(cursor, EVENT_LOG_DIR, limit=IMPORT_BATCH_SIZE):
+            if next_cursor > until: break
+            events.append(event)
+            cursor = next_cursor
+        if not events: break
+        _, _, changed = import_events(collection, events)
+        archive.append(changed)
+        checkpoint['cursor'] = cursor
+        save_checkpoint(checkpoint)
+        filled += len(events)
+    return filled
+
+def import_stream_entries(collection, checkpoint, archive, entries):
+    """Importa los registros de un lote del stream en el orden del log; devuelve (nuevos, actualizados).
+    Si el inicio de un registro no coincide con el cursor esperado, lo que falta se lee del log antes."""
+    imported = updated = 0
+    events, expected = [], checkpoint['cursor']
+    for event, start, end in entries + [(None, None, None)]:
+        if event is not None and end is not None and end <= expected:
+            continue  # Ya importado (desde el log o antes de un reinicio)
+        gap = event is not None and start is not None and start != expected
+        if event is None or gap:
+            if events:
+                i, u, changed = import_events(collection, events)
+                archive.append(changed)
+                imported, updated, events = imported + i, updated + u, []
+            if expected > checkpoint['cursor']:
+                checkpoint['cursor'] = expected
+                save_checkpoint(checkpoint)
+            if event is None: break
+            filled = catch_up(collection, checkpoint, archive, start)
+            if filled:
+                logger.warning(f"Stream: {filled} registros que no llegaron por el stream se importaron desde el log (hasta {start}).")
+            expected = max(expected, start)
+        events.append(event)
+        if end is not None: expected = end
+    return imported, updated
+
+def consume_stream(collection, r_client, archive):
+    """Importa del stream en micro-lotes y confirma (XACK) después de cada bulk_write.
+
+    El checkpoint del log avanza con los cursores de los mensajes: si falta un tramo (publicación
+    fallida en el scraper o entradas recortadas por MAXLEN), se importa desde el log antes de seguir.
+    Supone un solo consumidor en el grupo."""
+    ensure_stream_group(r_client)
+    checkpoint = load_checkpoint()
+    # Primero los mensajes entregados a este consumidor y no confirmados antes de un reinicio
+    start_id = '0'
+    observed = 0.0
+    while True:
+        ids, entries = read_stream_batch(r_client, start_id)
+        if start_id == '0' and not ids:
+            start_id = '>'
+            continue
+        if entries:
+            EVENTS_READ.inc(len(entries), source='stream')
+            started = time.monotonic()
+            try:
+                imported, updated = import_stream_entries(collection, checkpoint, archive, entries)
+            except WriteFailed as e:
+                # Sin XACK: los mensajes siguen pendientes y se vuelven a leer con '0'
+                logger.error(f"Stream: {e}; se reintenta el lote en {CHECK_INTERVAL_SECONDS}s.")
+                log_write_stats()
+                time.sleep(CHECK_INTERVAL_SECONDS)
+                start_id = '0'
+                continue
+            logger.info(f"Stream: lote de {len(entries)} registros en {time.monotonic() - started:.3f}s. Resultado -> Nuevos: {imported}, Actualizados: {updated}.")
+            log_write_stats()
+        if ids:
+            r_client.xack(EVENT_STREAM_KEY, EVENT_STREAM_GROUP, *ids)
+        # El bucle no termina: los gauges de la pasada se actualizan aquí, a lo más cada CHECK_INTERVAL_SECONDS
+        if time.monotonic() - observed >= CHECK_INTERVAL_SECONDS:
+            observe_pass(collection)
+            observed = time.monotonic()
 
 def main():
     mongo_client = connect_to_mongodb()
     if not mongo_client: sys.exit(1)
     db = mongo_client.waze_data
     collection = db.events
-    ensure_mongo_index(collection)
+    ensure_indexes(collection)
+    archive = EventArchive()
+    start_http_server()
     try:
+        if EVENT_TRANSPORT == 'stream':
+            r_client = connect_to_redis()
+            if not r_client: sys.exit(1)
+            logger.info(f"Consumiendo stream '{EVENT_STREAM_KEY}' como '{EVENT_STREAM_CONSUMER}'.")
+            consume_stream(collection, r_client, archive)
+        checkpoint = load_checkpoint()
         while True:
-            process_file(collection)
-            logger.info(f"Total de eventos en DB: {collection.count_documents({})}. Esperando...")
+            process_file(collection, checkpoint, archive)
+            process_event_log(collection, checkpoint, archive)
+            log_write_stats()
+            documents = observe_pass(collection)
+            logger.info(f"Total de eventos en DB (estimado): {documents}. Esperando...")
             time.sleep(CHECK_INTERVAL_SECONDS)
     except KeyboardInterrupt:
         logger.info("Interrupción manual.")
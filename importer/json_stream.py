@@ -0,0 +1,151 @@
+"""
+Lectura incremental de archivos de eventos grandes.
+
+`iter_records` entrega los eventos de a uno desde un arreglo JSON
+(`[{...}, {...}]`, como waze_events.json) o desde JSON Lines, leyendo el
+archivo en bloques de tamaño fijo. En memoria solo queda el bloque actual
+más el registro que se está decodificando, así que el consumo no depende
+del tamaño del archivo.
+
+Uso: python json_stream.py --benchmark [--events 200000] [archivo.json]
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+JSON_STREAM_CHUNK_CHARS = int(os.getenv("JSON_STREAM_CHUNK_CHARS", str(64 * 1024)))
+# Un registro más grande que esto se considera un archivo corrupto
+JSON_STREAM_MAX_RECORD_CHARS = int(os.getenv("JSON_STREAM_MAX_RECORD_CHARS", str(16 * 1024 * 1024)))
+
+SEPARATORS = re.compile(r"[\s,]*")
+
+
+def _iter_array(f, buffer, chunk_chars, max_record_chars):
+    decoder = json.JSONDecoder()
+    pos = 1  # después del '['
+    eof = False
+    while True:
+        # Saltar espacios y la coma entre elementos
+        while True:
+            pos = SEPARATORS.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = f.read(chunk_chars), 0
+            eof = not buffer
+        if pos >= len(buffer):
+            raise ValueError("arreglo JSON sin cerrar")
+        if buffer[pos] == "]":
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Registro incompleto: se descarta lo ya consumido y se agrega el bloque siguiente
+            chunk = f.read(chunk_chars)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            if len(buffer) > max_record_chars:
+                raise ValueError(f"registro de más de {max_record_chars} caracteres")
+            continue
+        yield record
+        pos = end
+
+
+def iter_records(f, chunk_chars=JSON_STREAM_CHUNK_CHARS, max_record_chars=JSON_STREAM_MAX_RECORD_CHARS):
+    """Eventos de un archivo de texto abierto, sea arreglo JSON o JSON Lines. Lanza ValueError si está corrupto."""
+    buffer = f.read(chunk_chars)
+    pos = 0
+    while True:
+        pos = len(buffer) - len(buffer.lstrip())
+        if pos < len(buffer):
+            break
+        buffer, pos = f.read(chunk_chars), 0
+        if not buffer:
+            return
+    if buffer[pos] == "[":
+        yield from _iter_array(f, buffer[pos:], chunk_chars, max_record_chars)
+        return
+    # JSON Lines: el bloque ya leído se completa hasta el final de su última línea
+    for line in (buffer[pos:] + f.readline()).splitlines():
+        if line.strip():
+            yield json.loads(line)
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def benchmark(path, events):
+    """Compara el pico de memoria (tracemalloc) de json.load y de iter_records sobre el mismo archivo."""
+    created = None
+    if path is None:
+        fd, created = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("[\n")
+            for i in range(events):
+                f.write(("," if i else "") + json.dumps({
+                    "event_id": f"ACCIDENT--33.{i:06d}--70.6-{1700000000000 + i}", "type": "ACCIDENT",
+                    "address": "Av. Libertador Bernardo O'Higgins 1234, Santiago", "latitude": -33.45,
+                    "longitude": -70.65, "report_time": "2024-05-01 12:00:00", "reporter": "Anónimo",
+                    "city": "Santiago", "scrape_timestamp": "2024-05-01T12:00:00"}, ensure_ascii=False) + "\n")
+            f.write("]\n")
+        path = created
+    try:
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        results = {}
+        for label in ("json.load", "streaming"):
+            tracemalloc.start()
+            started = time.perf_counter()
+            with open(path, "r", encoding="utf-8") as f:
+                if label == "json.load":
+                    count = len(json.load(f))
+                else:
+                    count = sum(len(batch) for batch in iter_batches(iter_records(f), 5000))
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[label] = (count, peak, elapsed)
+        logger.info(f"Archivo de {size_mb:.1f} MiB:")
+        for label, (count, peak, elapsed) in results.items():
+            logger.info(f"  {label:10s} {count} eventos, pico {peak / 1024 / 1024:.1f} MiB, {elapsed:.2f}s")
+    finally:
+        if created:
+            os.remove(created)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s", handlers=[logging.StreamHandler(sys.stdout)])
+    parser = argparse.ArgumentParser(description="Lectura incremental de archivos de eventos")
+    parser.add_argument("path", nargs="?", help="Archivo a medir (por defecto se genera uno sintético)")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--events", type=int, default=200000)
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.path, args.events)
+    elif args.path:
+        with open(args.path, "r", encoding="utf-8") as f:
+            logger.info(f"{sum(1 for _ in iter_records(f))} eventos en {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Esquema de almacenamiento de waze_data.events.
+
+Además de los campos que manda el scraper, cada documento lleva campos
+derivados para consultar por tiempo, tipo y zona con índices en lugar de
+recorrer la colección:
+
+    scrape_ts, report_ts, last_seen_ts   fechas (BSON date) de los textos ISO
+    location                             punto GeoJSON [lon, lat] (índice 2dsphere)
+    commune                              comuna, tomada de `city`
+
+El importer marca además ingested_at (hora del servidor) en cada escritura
+que cambia el documento; es la marca de agua del sondeo que sincroniza con
+Elasticsearch.
+
+La colección es normal y no time-series: el importer hace upserts por
+event_id con índice único, y eso no lo admiten las colecciones time-series.
+Las lecturas por rango de tiempo usan los índices compuestos sobre scrape_ts.
+Con EVENT_TTL_DAYS > 0 Mongo borra los eventos que no se ven hace más de ese
+plazo; el historial completo queda en el archivo del importer.
+
+Uso: python mongo_layout.py {indexes,migrate,explain}
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+import pymongo
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+MONGO_HOST = os.getenv("MONGO_HOST", "storage_db")
+EVENT_TTL_DAYS = float(os.getenv("EVENT_TTL_DAYS", "0"))
+MIGRATE_BATCH_SIZE = int(os.getenv("MIGRATE_BATCH_SIZE", "1000"))
+
+# Índices del layout: nombre -> (claves, opciones)
+INDEXES = {
+    "event_id_1": ([("event_id", pymongo.ASCENDING)], {"unique": True}),
+    "scrape_ts": ([("scrape_ts", pymongo.ASCENDING)], {}),
+    "type_scrape_ts": ([("type", pymongo.ASCENDING), ("scrape_ts", pymongo.ASCENDING)], {}),
+    "commune_scrape_ts": ([("commune", pymongo.ASCENDING), ("scrape_ts", pymongo.ASCENDING)], {}),
+    "location_2dsphere": ([("location", pymongo.GEOSPHERE)], {}),
+}
+TTL_INDEX = "last_seen_ts_ttl"
+
+# Campo de texto -> campo fecha derivado
+DATE_FIELDS = {"scrape_timestamp": "scrape_ts", "report_time": "report_ts", "last_seen": "last_seen_ts"}
+
+
+def parse_time(value):
+    """Fecha de un texto ISO ('2024-05-01T12:00:00' o '2024-05-01 12:00:00'); None si no se puede."""
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def derived_fields(fields):
+    """Campos del layout que se pueden calcular a partir de `fields` (puede ser un registro parcial)."""
+    derived = {}
+    for source, target in DATE_FIELDS.items():
+        moment = parse_time(fields.get(source))
+        if moment is not None:
+            derived[target] = moment
+    lat, lon = fields.get("latitude"), fields.get("longitude")
+    if isinstance(lat, (int, float)) and isinstance(lon, (int, float)) and -90 <= lat <= 90 and -180 <= lon <= 180:
+        derived["location"] = {"type": "Point", "coordinates": [lon, lat]}
+    if fields.get("city"):
+        derived["commune"] = fields["city"].strip()
+    return derived
+
+
+def ensure_indexes(collection, ttl_days=EVENT_TTL_DAYS):
+    for name, (keys, options) in INDEXES.items():
+        try:
+            collection.create_index(keys, name=name, **options)
+        except OperationFailure as e:
+            # Mismo índice ya creado con otro nombre u opciones: se deja como está
+            logger.info(f"Índice '{name}' no creado: {e}")
+    existing = collection.index_information()
+    if ttl_days > 0:
+        seconds = int(ttl_days * 86400)
+        if TTL_INDEX in existing and existing[TTL_INDEX].get("expireAfterSeconds") != seconds:
+            collection.database.command("collMod", collection.name,
+                                        index={"name": TTL_INDEX, "expireAfterSeconds": seconds})
+        elif TTL_INDEX not in existing:
+            collection.create_index([("last_seen_ts", pymongo.ASCENDING)], name=TTL_INDEX, expireAfterSeconds=seconds)
+        logger.info(f"TTL de eventos: {ttl_days} días sin verse")
+    elif TTL_INDEX in existing:
+        collection.drop_index(TTL_INDEX)
+        logger.info("TTL de eventos desactivado")
+
+
+def migrate(collection, batch_size=MIGRATE_BATCH_SIZE):
+    """Agrega los campos derivados a los documentos que no los tienen, en lotes por _id."""
+    query = {"scrape_ts": {"$exists": False}}
+    projection = {"_id": 1, **{f: 1 for f in ("scrape_timestamp", "report_time", "last_seen", "latitude", "longitude", "city")}}
+    migrated = 0
+    last_id = None
+    started = time.monotonic()
+    while True:
+        page = dict(query, **({"_id": {"$gt": last_id}} if last_id is not None else {}))
+        docs = list(collection.find(page, projection).sort("_id", pymongo.ASCENDING).limit(batch_size))
+        if not docs:
+            break
+        operations = []
+        for doc in docs:
+            derived = derived_fields(doc)
+            if derived:
+                operations.append(pymongo.UpdateOne({"_id": doc["_id"]}, {"$set": derived}))
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        migrated += len(operations)
+        last_id = docs[-1]["_id"]
+        logger.info(f"Migración: {migrated} documentos actualizados...")
+    logger.info(f"Migración completada: {migrated} documentos en {time.monotonic() - started:.1f}s")
+    return migrated
+
+
+def explain(collection):
+    """Muestra el plan ganador de las lecturas típicas, para confirmar que usan índices."""
+    since = datetime.utcnow() - timedelta(hours=24)
+    queries = {
+        "rango de tiempo": {"scrape_ts": {"$gte": since}},
+        "tipo + tiempo": {"type": "ACCIDENT", "scrape_ts": {"$gte": since}},
+        "comuna + tiempo": {"commune": "Santiago", "scrape_ts": {"$gte": since}},
+        "zona": {"location": {"$geoWithin": {"$centerSphere": [[-70.65, -33.45], 2 / 6378.1]}}},
+    }
+    for label, query in queries.items():
+        plan = collection.find(query).explain()["queryPlanner"]["winningPlan"]
+        stages = []
+        while plan:
+            stages.append(plan.get("stage") + (f"({plan['indexName']})" if "indexName" in plan else ""))
+            plan = plan.get("inputStage")
+        logger.info(f"{label}: {' <- '.join(stages)}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    parser = argparse.ArgumentParser(description="Índices y migración del layout de waze_data.events")
+    parser.add_argument("command", choices=["indexes", "migrate", "explain"])
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(MONGO_HOST, 27017, serverSelectionTimeoutMS=5000)
+    collection = client.waze_data.events
+    try:
+        if args.command in ("indexes", "migrate"):
+            ensure_indexes(collection)
+        if args.command == "migrate":
+            migrate(collection)
+        if args.command == "explain":
+            explain(collection)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Cuadrícula adaptativa (quadtree) para el scraper.
+
+Parte de teselas gruesas sobre el área objetivo. Una tesela cuya respuesta
+parece saturada (cantidad de alertas cerca del tope de georss) se divide en
+cuatro hijas, que se consultan de inmediato. Cuatro hermanas que siguen
+vacías varias visitas se vuelven a fusionar en su padre. Con qué frecuencia
+se visita cada tesela lo decide el planificador (cell_scheduler). La
+teselación aprendida se guarda en disco y se reutiliza tras un reinicio.
+"""
+
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_GRID_STATE_PATH = os.getenv("ADAPTIVE_GRID_STATE_PATH", "data/adaptive_grid.json")
+ADAPTIVE_ROOT_TILE_DEGREES = float(os.getenv("ADAPTIVE_ROOT_TILE_DEGREES", "0.08"))
+ADAPTIVE_MIN_TILE_DEGREES = float(os.getenv("ADAPTIVE_MIN_TILE_DEGREES", "0.01"))
+GEORSS_ALERT_CAP = int(os.getenv("GEORSS_ALERT_CAP", "200"))
+ADAPTIVE_SATURATION_RATIO = float(os.getenv("ADAPTIVE_SATURATION_RATIO", "0.9"))
+ADAPTIVE_EMPTY_CYCLES = int(os.getenv("ADAPTIVE_EMPTY_CYCLES", "3"))
+
+
+class AdaptiveGrid:
+    """Teselación quadtree del área; solo se guardan las hojas."""
+
+    def __init__(self, area, path=ADAPTIVE_GRID_STATE_PATH, root_degrees=ADAPTIVE_ROOT_TILE_DEGREES,
+                 min_degrees=ADAPTIVE_MIN_TILE_DEGREES, alert_cap=GEORSS_ALERT_CAP,
+                 saturation_ratio=ADAPTIVE_SATURATION_RATIO, empty_cycles=ADAPTIVE_EMPTY_CYCLES):
+        self.area = area
+        self.path = path
+        self.root_degrees = root_degrees
+        self.min_degrees = min_degrees
+        self.saturation_threshold = max(1, int(alert_cap * saturation_ratio))
+        self.empty_cycles = empty_cycles
+
+        self.tiles = {}  # id -> {"bbox": [lat_min, lat_max, lon_min, lon_max], "empty_streak": int, "last_count": int}
+        self.cycle = 0
+        self.cycle_requests = 0
+        self.cycle_alerts = 0
+        self.cycle_splits = 0
+
+        if not self.load():
+            self.tiles = self._root_tiles()
+            logger.info(f"Cuadrícula adaptativa inicial: {len(self.tiles)} teselas de {self.root_degrees}°")
+
+    # --- Persistencia ---
+
+    def _signature(self):
+        return {"area": self.area, "root_degrees": self.root_degrees}
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("signature") != self._signature():
+                logger.info("Configuración de la cuadrícula cambió; se descarta la teselación guardada")
+                return False
+            self.tiles = state["tiles"]
+            self.cycle = state.get("cycle", 0)
+            logger.info(f"Cuadrícula adaptativa cargada: {len(self.tiles)} teselas (ciclo {self.cycle})")
+            return True
+        except (ValueError, KeyError, IOError) as e:
+            logger.warning(f"No se pudo cargar la cuadrícula adaptativa: {e}")
+            return False
+
+    def save(self):
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"signature": self._signature(), "cycle": self.cycle, "tiles": self.tiles}, f)
+        os.replace(tmp_path, self.path)
+
+    # --- Teselación ---
+
+    def _root_tiles(self):
+        tiles = {}
+        row = 0
+        lat = self.area["lat_min"]
+        while lat < self.area["lat_max"]:
+            col = 0
+            lon = self.area["lon_min"]
+            while lon < self.area["lon_max"]:
+                bbox = [lat, min(lat + self.root_degrees, self.area["lat_max"]),
+                        lon, min(lon + self.root_degrees, self.area["lon_max"])]
+                tiles[f"r{row}c{col}"] = self._new_tile(bbox)
+                lon += self.root_degrees
+                col += 1
+            lat += self.root_degrees
+            row += 1
+        return tiles
+
+    @staticmethod
+    def _new_tile(bbox):
+        return {"bbox": bbox, "empty_streak": 0, "last_count": 0}
+
+    @staticmethod
+    def to_cell(tile_id, tile):
+        lat_min, lat_max, lon_min, lon_max = tile["bbox"]
+        return {"tile_id": tile_id, "lat_max": lat_max, "lat_min": lat_min, "lon_min": lon_min, "lon_max": lon_max}
+
+    def _split(self, tile_id):
+        lat_min, lat_max, lon_min, lon_max = self.tiles.pop(tile_id)["bbox"]
+        lat_mid = (lat_min + lat_max) / 2
+        lon_mid = (lon_min + lon_max) / 2
+        quadrants = [
+            [lat_min, lat_mid, lon_min, lon_mid],
+            [lat_min, lat_mid, lon_mid, lon_max],
+            [lat_mid, lat_max, lon_min, lon_mid],
+            [lat_mid, lat_max, lon_mid, lon_max],
+        ]
+        children = []
+        for q, bbox in enumerate(quadrants):
+            child_id = f"{tile_id}.{q}"
+            self.tiles[child_id] = self._new_tile(bbox)
+            children.append(self.to_cell(child_id, self.tiles[child_id]))
+        self.cycle_splits += 1
+        return children
+
+    def _merge_empty_siblings(self):
+        """Fusiona en su padre los grupos de cuatro hermanas que siguen vacías."""
+        merged = 0
+        changed = True
+        while changed:
+            changed = False
+            parents = {}
+            for tile_id in self.tiles:
+                if "." in tile_id:
+                    parents.setdefault(tile_id.rsplit(".", 1)[0], []).append(tile_id)
+            for parent_id, children in parents.items():
+                if len(children) != 4:
+                    continue
+                if any(self.tiles[c]["empty_streak"] < self.empty_cycles for c in children):
+                    continue
+                boxes = [self.tiles.pop(c)["bbox"] for c in children]
+                bbox = [min(b[0] for b in boxes), max(b[1] for b in boxes),
+                        min(b[2] for b in boxes), max(b[3] for b in boxes)]
+                self.tiles[parent_id] = self._new_tile(bbox)
+                self.tiles[parent_id]["empty_streak"] = self.empty_cycles
+                merged += 1
+                changed = True
+        return merged
+
+    # --- Ciclo ---
+
+    def cells(self):
+        return [self.to_cell(tile_id, tile) for tile_id, tile in self.tiles.items()]
+
+    def start_cycle(self):
+        """Comienza un periodo de métricas y devuelve todas las teselas actuales."""
+        self.cycle += 1
+        self.cycle_requests = 0
+        self.cycle_alerts = 0
+        self.cycle_splits = 0
+        return self.cells()
+
+    def record(self, cell, alert_count):
+        """Registra la respuesta de una celda; devuelve las celdas hijas a consultar si estaba saturada."""
+        tile_id = cell["tile_id"]
+        self.cycle_requests += 1
+        self.cycle_alerts += alert_count
+        tile = self.tiles.get(tile_id)
+        if tile is None:
+            return []
+        tile["last_count"] = alert_count
+        tile["empty_streak"] = tile["empty_streak"] + 1 if alert_count == 0 else 0
+
+        lat_min, lat_max, lon_min, lon_max = tile["bbox"]
+        can_split = min(lat_max - lat_min, lon_max - lon_min) / 2 >= self.min_degrees
+        if alert_count >= self.saturation_threshold and can_split:
+            logger.info(f"Tesela {tile_id} saturada ({alert_count} alertas), dividiendo")
+            return self._split(tile_id)
+        return []
+
+    def end_cycle(self):
+        """Cierra el ciclo: fusiona teselas vacías, guarda el estado y devuelve las métricas."""
+        merged = self._merge_empty_siblings()
+        self.save()
+        stats = {
+            "cycle": self.cycle,
+            "tiles": len(self.tiles),
+            "requests": self.cycle_requests,
+            "alerts": self.cycle_alerts,
+            "alerts_per_request": round(self.cycle_alerts / self.cycle_requests, 2) if self.cycle_requests else 0,
+            "splits": self.cycle_splits,
+            "merges": merged,
+        }
+        logger.info(f"Cuadrícula adaptativa ciclo {stats['cycle']}: {stats['requests']} requests, "
+                    f"{stats['alerts']} alertas ({stats['alerts_per_request']} alertas/request), "
+                    f"divisiones={stats['splits']}, fusiones={stats['merges']}, teselas={stats['tiles']}")
+        return stats
@@ -0,0 +1,135 @@
+"""
+Seguimiento del ciclo de vida de las alertas entre ciclos de scraping.
+
+Compara lo que devuelve cada celda con las alertas activas conocidas y
+clasifica cada alerta como nueva, actualizada (cambió nThumbsUp, reliability
+o confidence) o expirada (estaba dentro de la celda y ya no aparece). En vez
+de documentos completos se emiten registros de cambio compactos con
+`first_seen` y `last_seen`, así la duración de un incidente sale gratis.
+
+La expiración se decide por ubicación y no por id de celda, para que siga
+funcionando cuando la cuadrícula adaptativa divide o fusiona teselas.
+"""
+
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+
+from adaptive_grid import GEORSS_ALERT_CAP, ADAPTIVE_SATURATION_RATIO
+
+logger = logging.getLogger(__name__)
+
+ALERT_LIFECYCLE_STATE_PATH = os.getenv("ALERT_LIFECYCLE_STATE_PATH", "data/alert_lifecycle.json")
+ALERT_STALE_SECONDS = int(os.getenv("ALERT_STALE_SECONDS", "7200"))
+
+# Atributos de la alerta cuyo cambio genera un registro "updated" (campo georss -> campo del evento)
+TRACKED_FIELDS = {"nThumbsUp": "thumbs_up", "reliability": "reliability", "confidence": "confidence"}
+
+
+def _iso(moment):
+    return moment.isoformat()
+
+
+class AlertLifecycleTracker:
+    """Estado de las alertas activas y diff por celda."""
+
+    def __init__(self, path=ALERT_LIFECYCLE_STATE_PATH, stale_seconds=ALERT_STALE_SECONDS,
+                 saturation_threshold=int(GEORSS_ALERT_CAP * ADAPTIVE_SATURATION_RATIO)):
+        self.path = path
+        self.stale_seconds = stale_seconds
+        self.saturation_threshold = max(1, saturation_threshold)
+        self.active = {}  # clave -> {"event_id", "lat", "lon", "first_seen", "last_seen", campos seguidos}
+        self.counts = {"new": 0, "updated": 0, "expired": 0}
+
+    # --- Persistencia ---
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.active = json.load(f)
+            logger.info(f"Ciclo de vida: {len(self.active)} alertas activas cargadas")
+            return True
+        except (ValueError, IOError) as e:
+            logger.warning(f"No se pudo cargar el estado de ciclo de vida: {e}")
+            return False
+
+    def save(self):
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.active, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    # --- Diff ---
+
+    def observe(self, key, event_id, alert, lat, lon, now):
+        """
+        Registra una alerta vista ahora. Devuelve ("new", None) si no estaba activa,
+        ("updated", registro) si cambió algún campo seguido, o ("unchanged", None).
+        """
+        current = {field: alert.get(source, 0) for source, field in TRACKED_FIELDS.items()}
+        state = self.active.get(key)
+        if state is None:
+            self.active[key] = {"event_id": event_id, "lat": lat, "lon": lon,
+                                "first_seen": _iso(now), "last_seen": _iso(now), **current}
+            self.counts["new"] += 1
+            return "new", None
+
+        state["last_seen"] = _iso(now)
+        state["lat"], state["lon"] = lat, lon
+        changed = {field: value for field, value in current.items() if state.get(field) != value}
+        if not changed:
+            return "unchanged", None
+        state.update(changed)
+        self.counts["updated"] += 1
+        return "updated", {"event_id": state["event_id"], "change": "updated", "last_seen": state["last_seen"], **changed}
+
+    def reactivated(self, key):
+        """Registro para una alerta ya emitida antes que vuelve a estar activa tras expirar o reiniciar."""
+        state = self.active[key]
+        fields = {field: state[field] for field in TRACKED_FIELDS.values()}
+        return {"event_id": state["event_id"], "change": "updated", "last_seen": state["last_seen"],
+                "expired_at": None, **fields}
+
+    def _expire(self, key, now):
+        state = self.active.pop(key)
+        first_seen = datetime.fromisoformat(state["first_seen"])
+        last_seen = datetime.fromisoformat(state["last_seen"])
+        self.counts["expired"] += 1
+        return {"event_id": state["event_id"], "change": "expired", "first_seen": state["first_seen"],
+                "last_seen": state["last_seen"], "expired_at": _iso(now),
+                "duration_seconds": int((last_seen - first_seen).total_seconds())}
+
+    def expire_missing(self, cell, seen_keys, now):
+        """Expira las alertas activas dentro de la celda que no vinieron en su respuesta."""
+        if len(seen_keys) >= self.saturation_threshold:
+            # Respuesta posiblemente truncada: que falte una alerta no prueba que terminó
+            return []
+        expired = []
+        for key, state in list(self.active.items()):
+            if key in seen_keys:
+                continue
+            # Bordes exclusivos: una alerta justo en el borde puede venir solo en la celda vecina
+            if (cell["lat_min"] < state["lat"] < cell["lat_max"] and
+                    cell["lon_min"] < state["lon"] < cell["lon_max"]):
+                expired.append(self._expire(key, now))
+        return expired
+
+    def expire_stale(self, now):
+        """Red de seguridad: expira lo que no se ha visto en `stale_seconds` (p.ej. alertas en bordes)."""
+        limit = _iso(now - timedelta(seconds=self.stale_seconds))
+        return [self._expire(key, now) for key, state in list(self.active.items()) if state["last_seen"] < limit]
+
+    def log_stats(self):
+        logger.info(f"Ciclo de vida: nuevas={self.counts['new']}, actualizadas={self.counts['updated']}, "
+                    f"expiradas={self.counts['expired']}, activas={len(self.active)}")
+
+    def reset_stats(self):
+        for name in self.counts:
+            self.counts[name] = 0
@@ -0,0 +1,161 @@
+"""
+Planificador de celdas para el scraper.
+
+Las celdas viven en una cola de prioridad compartida ordenada por su próxima
+visita. N workers sacan la celda vencida más urgente, la descargan y
+entregan el resultado al hilo principal. El intervalo de revisita de cada
+celda se interpola entre un mínimo y un máximo según su churn reciente
+(alertas nuevas, actualizadas o expiradas por visita, con media móvil
+exponencial): las celdas movidas se revisitan seguido y las tranquilas casi
+nunca. La frescura se reporta por celda como tiempo desde la última visita.
+"""
+
+import os
+import time
+import heapq
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CYCLE_PERIOD_SECONDS = int(os.getenv("CYCLE_PERIOD_SECONDS", "900"))
+CELL_MIN_REVISIT_SECONDS = int(os.getenv("CELL_MIN_REVISIT_SECONDS", "120"))
+CELL_MAX_REVISIT_SECONDS = int(os.getenv("CELL_MAX_REVISIT_SECONDS", "1800"))
+CELL_HOT_CHURN = float(os.getenv("CELL_HOT_CHURN", "10"))
+CELL_CHURN_ALPHA = float(os.getenv("CELL_CHURN_ALPHA", "0.3"))
+
+
+class CellScheduler:
+    """Cola de prioridad de celdas por próxima visita, con intervalos según churn."""
+
+    def __init__(self, min_revisit=CELL_MIN_REVISIT_SECONDS, max_revisit=CELL_MAX_REVISIT_SECONDS,
+                 hot_churn=CELL_HOT_CHURN, alpha=CELL_CHURN_ALPHA):
+        self.min_revisit = min_revisit
+        self.max_revisit = max(min_revisit, max_revisit)
+        self.hot_churn = hot_churn
+        self.alpha = alpha
+        self.cells = {}  # id -> {"cell", "churn", "last_visit", "next_due", "visits", "in_flight"}
+        self.heap = []   # (next_due, seq, id); las entradas obsoletas se descartan al sacarlas
+        self.seq = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    # --- Conjunto de celdas ---
+
+    def _push(self, cell_id, due):
+        self.seq += 1
+        self.cells[cell_id]["next_due"] = due
+        heapq.heappush(self.heap, (due, self.seq, cell_id))
+
+    def add(self, cell, due=None):
+        with self.condition:
+            cell_id = cell["tile_id"]
+            if cell_id in self.cells:
+                return
+            self.cells[cell_id] = {"cell": cell, "churn": 0.0, "last_visit": None, "next_due": None,
+                                   "visits": 0, "in_flight": False}
+            self._push(cell_id, time.monotonic() if due is None else due)
+            self.condition.notify()
+
+    def remove(self, cell_id):
+        with self.condition:
+            self.cells.pop(cell_id, None)
+
+    def sync(self, cells):
+        """Ajusta el conjunto al de la cuadrícula: agrega celdas nuevas y quita las que ya no existen."""
+        wanted = {cell["tile_id"]: cell for cell in cells}
+        with self.condition:
+            for cell_id in [c for c in self.cells if c not in wanted]:
+                del self.cells[cell_id]
+        for cell in wanted.values():
+            self.add(cell)
+
+    # --- Despacho ---
+
+    def interval(self, churn):
+        ratio = min(1.0, churn / self.hot_churn) if self.hot_churn > 0 else 1.0
+        return self.max_revisit - (self.max_revisit - self.min_revisit) * ratio
+
+    def next_cell(self):
+        """Bloquea hasta que haya una celda vencida; devuelve None si el planificador se detuvo."""
+        with self.condition:
+            while not self.stopped:
+                now = time.monotonic()
+                while self.heap:
+                    due, _, cell_id = self.heap[0]
+                    state = self.cells.get(cell_id)
+                    if state is None or state["in_flight"] or state["next_due"] != due:
+                        heapq.heappop(self.heap)
+                        continue
+                    break
+                if self.heap and self.heap[0][0] <= now:
+                    _, _, cell_id = heapq.heappop(self.heap)
+                    state = self.cells[cell_id]
+                    state["in_flight"] = True
+                    return state["cell"]
+                timeout = self.heap[0][0] - now if self.heap else None
+                self.condition.wait(timeout)
+            return None
+
+    def complete(self, cell_id, churn):
+        """Registra una visita terminada y reprograma la celda según su churn."""
+        with self.condition:
+            state = self.cells.get(cell_id)
+            if state is None:
+                return
+            now = time.monotonic()
+            state["churn"] = self.alpha * churn + (1 - self.alpha) * state["churn"]
+            state["last_visit"] = now
+            state["visits"] += 1
+            state["in_flight"] = False
+            self._push(cell_id, now + self.interval(state["churn"]))
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    # --- Frescura ---
+
+    def freshness(self):
+        """Segundos desde la última visita de cada celda (None si nunca se visitó)."""
+        now = time.monotonic()
+        with self.condition:
+            return {cell_id: (now - s["last_visit"]) if s["last_visit"] is not None else None
+                    for cell_id, s in self.cells.items()}
+
+    def log_freshness(self, top=5):
+        freshness = self.freshness()
+        ages = sorted(age for age in freshness.values() if age is not None)
+        never = sum(1 for age in freshness.values() if age is None)
+        if not ages:
+            logger.info(f"Frescura: {len(freshness)} celdas, ninguna visitada aún")
+            return
+        stalest = sorted(((age, cell_id) for cell_id, age in freshness.items() if age is not None), reverse=True)[:top]
+        with self.condition:
+            hot = sum(1 for s in self.cells.values() if self.interval(s["churn"]) <= (self.min_revisit + self.max_revisit) / 2)
+        logger.info(f"Frescura: {len(freshness)} celdas ({hot} calientes, {never} sin visitar), "
+                    f"antigüedad p50={ages[len(ages) // 2]:.0f}s max={ages[-1]:.0f}s; más antiguas: "
+                    + ", ".join(f"{cell_id}={age:.0f}s" for age, cell_id in stalest))
+
+
+def start_workers(scheduler, fetch, results, workers):
+    """Lanza `workers` hilos que descargan celdas vencidas y dejan (celda, datos) en `results`."""
+    def run():
+        while True:
+            cell = scheduler.next_cell()
+            if cell is None:
+                return
+            try:
+                data = fetch(cell)
+            except Exception as e:
+                logger.error(f"Error descargando celda {cell['tile_id']}: {e}")
+                data = None
+            results.put((cell, data))
+
+    threads = [threading.Thread(target=run, name=f"scraper-worker-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    logger.info(f"Planificador: {workers} workers iniciados")
+    return threads
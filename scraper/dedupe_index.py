@@ -0,0 +1,155 @@
+"""
+Índice de deduplicación acotado en el tiempo para las alertas scrapeadas.
+
+Cada alerta se identifica por su `uuid` de Waze, reducido a un hash de 64
+bits y guardado en un conjunto por hora. Solo se conservan las horas dentro
+de la ventana configurada, así que la memoria depende del tráfico reciente y
+no de todo el historial. Una alerta que sigue activa se renueva en la hora
+actual cada vez que se vuelve a ver. El índice se guarda como un snapshot
+binario compacto y se carga al reiniciar sin recorrer el log de eventos.
+"""
+
+import os
+import sys
+import time
+import struct
+import hashlib
+import logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_SNAPSHOT_PATH = os.getenv("DEDUPE_SNAPSHOT_PATH", "data/dedupe_index.bin")
+DEDUPE_WINDOW_HOURS = int(os.getenv("DEDUPE_WINDOW_HOURS", "48"))
+
+SNAPSHOT_MAGIC = b"WZDD0001"
+BUCKET_SECONDS = 3600
+
+
+def key_hash(key):
+    """Hash estable de 64 bits de una clave (uuid o event_id)."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class DedupeIndex:
+    """Conjuntos de hashes por hora dentro de una ventana deslizante."""
+
+    def __init__(self, path=DEDUPE_SNAPSHOT_PATH, window_hours=DEDUPE_WINDOW_HOURS):
+        self.path = path
+        self.window_hours = max(1, window_hours)
+        self.buckets = {}  # hora -> set de hashes
+        self.checks = 0
+        self.duplicates = 0
+
+    def _hour(self, now=None):
+        return int((now if now is not None else time.time()) // BUCKET_SECONDS)
+
+    def _current_bucket(self, now=None):
+        hour = self._hour(now)
+        bucket = self.buckets.get(hour)
+        if bucket is None:
+            bucket = self.buckets[hour] = set()
+            self.expire(now)
+        return bucket
+
+    def expire(self, now=None):
+        """Descarta las horas que quedaron fuera de la ventana."""
+        oldest = self._hour(now) - self.window_hours + 1
+        for hour in [h for h in self.buckets if h < oldest]:
+            del self.buckets[hour]
+
+    def contains(self, key):
+        h = key_hash(key)
+        return any(h in bucket for bucket in self.buckets.values())
+
+    def add(self, key, now=None):
+        self._current_bucket(now).add(key_hash(key))
+
+    def seen(self, key, now=None):
+        """True si la clave ya estaba en la ventana, y entonces la renueva en la hora actual.
+        Una clave nueva no se registra: el llamador la agrega con add() una vez escrito el evento,
+        así un evento que no se pudo escribir se vuelve a intentar en el próximo scrapeo."""
+        h = key_hash(key)
+        current = self._current_bucket(now)
+        self.checks += 1
+        duplicate = any(h in bucket for bucket in self.buckets.values())
+        if duplicate:
+            self.duplicates += 1
+            current.add(h)
+        return duplicate
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    # --- Snapshot ---
+
+    def save(self):
+        """Escribe el snapshot: cabecera, y por hora (hora, cantidad, hashes uint64)."""
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.expire()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack("<I", len(self.buckets)))
+            for hour, bucket in self.buckets.items():
+                f.write(struct.pack("<qQ", hour, len(bucket)))
+                values = array("Q", bucket)
+                if sys.byteorder != "little":
+                    values.byteswap()
+                f.write(values.tobytes())
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Carga el snapshot si existe; devuelve False si no hay uno válido."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                    raise ValueError("cabecera inválida")
+                (count,) = struct.unpack("<I", f.read(4))
+                buckets = {}
+                for _ in range(count):
+                    hour, size = struct.unpack("<qQ", f.read(16))
+                    values = array("Q")
+                    values.frombytes(f.read(8 * size))
+                    if sys.byteorder != "little":
+                        values.byteswap()
+                    buckets[hour] = set(values)
+            self.buckets = buckets
+            self.expire()
+            logger.info(f"Índice de deduplicación cargado: {len(self)} claves en {len(self.buckets)} horas")
+            return True
+        except (ValueError, struct.error, IOError) as e:
+            logger.warning(f"No se pudo cargar el snapshot de deduplicación: {e}")
+            return False
+
+    # --- Métricas ---
+
+    def memory_bytes(self):
+        """Estimación de la memoria ocupada por los conjuntos y sus enteros."""
+        int_size = sys.getsizeof(2 ** 63)
+        return sum(sys.getsizeof(bucket) + len(bucket) * int_size for bucket in self.buckets.values())
+
+    def stats(self):
+        return {
+            "keys": len(self),
+            "hours": len(self.buckets),
+            "checks": self.checks,
+            "duplicates": self.duplicates,
+            "dedupe_rate": round(self.duplicates / self.checks, 4) if self.checks else 0.0,
+            "memory_bytes": self.memory_bytes(),
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        logger.info(f"Deduplicación: {s['checks']} alertas revisadas, {s['duplicates']} repetidas "
+                    f"({s['dedupe_rate']:.1%}), {s['keys']} claves en {s['hours']} horas, "
+                    f"~{s['memory_bytes'] / 1024:.0f} KiB")
+
+    def reset_stats(self):
+        self.checks = 0
+        self.duplicates = 0
@@ -0,0 +1,174 @@
+"""
+Log de eventos segmentado, solo de escritura al final (JSON Lines).
+
+El scraper agrega cada evento como una línea JSON al segmento activo. El
+segmento rota por tamaño o antigüedad y el fsync se hace por lotes. Los
+lectores avanzan con un cursor (segmento, offset) y solo leen lo que se
+agregó desde la última vez; una línea incompleta al final del segmento
+activo no se entrega hasta que el escritor la termine.
+
+Este módulo lo comparten el scraper y el importer (montado en su contenedor).
+"""
+
+import os
+import json
+import time
+import logging
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "data/events")
+EVENT_LOG_SEGMENT_BYTES = int(os.getenv("EVENT_LOG_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+EVENT_LOG_SEGMENT_SECONDS = int(os.getenv("EVENT_LOG_SEGMENT_SECONDS", "3600"))
+EVENT_LOG_FSYNC_EVERY = int(os.getenv("EVENT_LOG_FSYNC_EVERY", "200"))
+EVENT_LOG_FSYNC_SECONDS = float(os.getenv("EVENT_LOG_FSYNC_SECONDS", "5"))
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+
+Cursor = namedtuple("Cursor", ["segment", "offset"])
+START = Cursor(0, 0)
+
+
+def segment_name(number):
+    return f"{SEGMENT_PREFIX}{number:012d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory=EVENT_LOG_DIR):
+    """Números de segmento presentes en el directorio, en orden."""
+    if not os.path.isdir(directory):
+        return []
+    numbers = []
+    for name in os.listdir(directory):
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+            try:
+                numbers.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+            except ValueError:
+                continue
+    return sorted(numbers)
+
+
+class EventLogWriter:
+    """Escritor del log: agrega eventos al segmento activo y rota cuando corresponde."""
+
+    def __init__(self, directory=EVENT_LOG_DIR, segment_bytes=EVENT_LOG_SEGMENT_BYTES,
+                 segment_seconds=EVENT_LOG_SEGMENT_SECONDS, fsync_every=EVENT_LOG_FSYNC_EVERY,
+                 fsync_seconds=EVENT_LOG_FSYNC_SECONDS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        segments = list_segments(directory)
+        # Siempre se abre un segmento nuevo: así nunca se escribe detrás de una línea cortada
+        self.segment = (segments[-1] + 1) if segments else 1
+        self.file = None
+        # Cursor donde empieza el último evento agregado (el stream lo publica junto al evento)
+        self.last_start = None
+        self.opened_at = 0.0
+        self.pending_sync = 0
+        self.last_sync = time.monotonic()
+        self._open_segment()
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, segment_name(self.segment))
+        self.file = open(path, "ab")
+        self.opened_at = time.monotonic()
+        logger.info(f"Segmento de log activo: {path}")
+
+    def _rotate(self):
+        self.sync()
+        self.file.close()
+        self.segment += 1
+        self._open_segment()
+
+    def append(self, event):
+        """Agrega un evento y devuelve el cursor justo después de él."""
+        if (self.file.tell() >= self.segment_bytes or
+                (self.file.tell() > 0 and time.monotonic() - self.opened_at >= self.segment_seconds)):
+            self._rotate()
+        self.last_start = Cursor(self.segment, self.file.tell())
+        line = json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        self.file.write(line)
+        self.pending_sync += 1
+        if (self.pending_sync >= self.fsync_every or
+                time.monotonic() - self.last_sync >= self.fsync_seconds):
+            self.sync()
+        return Cursor(self.segment, self.file.tell())
+
+    def flush(self):
+        """Deja los datos visibles para los lectores (sin forzar a disco)."""
+        self.file.flush()
+
+    def sync(self):
+        """Fuerza a disco lo escrito desde el último fsync."""
+        self.file.flush()
+        if self.pending_sync:
+            os.fsync(self.file.fileno())
+            self.pending_sync = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if self.file:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+
+def read_from(cursor=START, directory=EVENT_LOG_DIR, limit=None):
+    """Produce (evento, cursor_siguiente) para cada registro posterior a `cursor`."""
+    count = 0
+    for number in list_segments(directory):
+        if number < cursor.segment:
+            continue
+        offset = cursor.offset if number == cursor.segment else 0
+        path = os.path.join(directory, segment_name(number))
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            continue
+        with f:
+            if offset > os.fstat(f.fileno()).st_size:
+                # El segmento se truncó o se reemplazó: se relee desde el principio
+                logger.warning(f"{path} es más corto que el cursor (offset {offset}), se relee desde 0")
+                offset = 0
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Línea a medio escribir: se leerá en la próxima pasada
+                    break
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Línea corrupta en {path} (offset {offset - len(line)}), se omite")
+                    continue
+                yield event, Cursor(number, offset)
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+
+def tail(n, directory=EVENT_LOG_DIR):
+    """Últimos `n` eventos del log, leyendo solo los segmentos más recientes necesarios."""
+    segments = list_segments(directory)
+    first = None
+    lines = 0
+    for number in reversed(segments):
+        first = number
+        # Contar líneas es mucho más barato que parsearlas
+        with open(os.path.join(directory, segment_name(number)), "rb") as f:
+            lines += sum(1 for _ in f)
+        if lines >= n:
+            break
+    if first is None:
+        return []
+    window = deque(maxlen=n)
+    for event, _ in read_from(Cursor(first, 0), directory):
+        window.append(event)
+    return list(window)
@@ -0,0 +1,75 @@
+"""
+Publicación de eventos en un Redis Stream para el importer.
+
+Con EVENT_TRANSPORT=stream el scraper publica cada evento nuevo o registro de
+cambio en el stream (además de escribirlo en el log segmentado, que sigue
+siendo el registro durable). Los XADD se acumulan en un pipeline y se envían
+en cada flush, una vez por celda procesada.
+
+Cada mensaje lleva el cursor del log donde empieza y termina su registro. Un
+lote que no se pudo publicar, o entradas que el recorte por MAXLEN borró antes
+de que el importer las leyera, dejan un hueco entre el checkpoint del importer
+y el siguiente mensaje; el importer lo completa leyendo el log (ver
+consume_stream en import_to_mongo.py).
+"""
+
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+EVENT_TRANSPORT = os.getenv("EVENT_TRANSPORT", "file")
+REDIS_HOST = os.getenv("REDIS_HOST", "cache")
+EVENT_STREAM_KEY = os.getenv("EVENT_STREAM_KEY", "waze:events")
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "100000"))
+
+
+def connect_to_redis():
+    import redis
+    client = redis.Redis(host=REDIS_HOST, port=6379, db=0)
+    client.ping()
+    logger.info(f"Conexión a Redis en {REDIS_HOST} exitosa (stream '{EVENT_STREAM_KEY}').")
+    return client
+
+
+def format_cursor(cursor):
+    return f"{cursor.segment}:{cursor.offset}"
+
+
+class EventStreamPublisher:
+    """Agrega registros a un Redis Stream, recortado aproximadamente a `maxlen` entradas."""
+
+    def __init__(self, client, stream=EVENT_STREAM_KEY, maxlen=EVENT_STREAM_MAXLEN):
+        self.client = client
+        self.stream = stream
+        self.maxlen = maxlen
+        self.pipe = client.pipeline(transaction=False)
+        self.pending = 0
+        self.published = 0
+        self.failed = 0
+
+    def publish(self, record, start, end):
+        """Encola un registro con los cursores del log (inicio y fin) donde quedó escrito."""
+        data = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        self.pipe.xadd(self.stream, {"data": data, "start": format_cursor(start), "end": format_cursor(end)},
+                       maxlen=self.maxlen, approximate=True)
+        self.pending += 1
+
+    def flush(self):
+        if not self.pending:
+            return
+        try:
+            self.pipe.execute()
+            self.published += self.pending
+        except Exception as e:
+            # No se reintenta aquí: el importer ve el hueco de cursores y lee estos registros del log
+            self.failed += self.pending
+            logger.warning(f"Error publicando {self.pending} registros en el stream: {e}")
+            self.pipe.reset()
+        self.pending = 0
+
+    def log_stats(self):
+        logger.info(f"Stream '{self.stream}': publicados={self.published}, fallidos={self.failed}")
+        self.published = 0
+        self.failed = 0
@@ -0,0 +1,156 @@
+"""
+Caché persistente de geocodificación inversa.
+
+Las direcciones se guardan por lat/lon cuantizada en dos niveles: un LRU en
+memoria y una tabla SQLite en el volumen de datos, para que sobreviva a los
+reinicios del contenedor. Las entradas expiran por TTL, los fallos también se
+cachean (con un TTL más corto) y las consultas simultáneas a la misma clave
+se agrupan en una sola consulta remota.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "data/geocode_cache.sqlite")
+GEOCODE_CACHE_PRECISION = int(os.getenv("GEOCODE_CACHE_PRECISION", "4"))  # 4 decimales ~ 11 m
+GEOCODE_CACHE_MEMORY_SIZE = int(os.getenv("GEOCODE_CACHE_MEMORY_SIZE", "20000"))
+GEOCODE_CACHE_TTL_SECONDS = int(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+GEOCODE_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL_SECONDS", "3600"))
+
+
+class GeocodeCache:
+    """Caché de dos niveles (memoria LRU + SQLite) para direcciones por coordenada."""
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, precision=GEOCODE_CACHE_PRECISION,
+                 memory_size=GEOCODE_CACHE_MEMORY_SIZE, ttl=GEOCODE_CACHE_TTL_SECONDS,
+                 negative_ttl=GEOCODE_CACHE_NEGATIVE_TTL_SECONDS):
+        self.precision = precision
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self.memory = OrderedDict()  # clave -> (dirección o None, expira_en)
+        self.lock = threading.Lock()
+        self.in_flight = {}  # clave -> threading.Event
+
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0,
+                      "misses": 0, "coalesced": 0, "remote_lookups": 0, "remote_failures": 0}
+
+        self.db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS geocode (key TEXT PRIMARY KEY, address TEXT, expires_at REAL NOT NULL)"
+            )
+            self.db.commit()
+
+    def key(self, lat, lon):
+        return f"{lat:.{self.precision}f},{lon:.{self.precision}f}"
+
+    def _lookup(self, key, now):
+        """Busca en memoria y luego en disco. Devuelve (encontrado, dirección)."""
+        entry = self.memory.get(key)
+        if entry is not None:
+            address, expires_at = entry
+            if expires_at > now:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                if address is None:
+                    self.stats["negative_hits"] += 1
+                return True, address
+            del self.memory[key]
+
+        if self.db is not None:
+            row = self.db.execute("SELECT address, expires_at FROM geocode WHERE key = ?", (key,)).fetchone()
+            if row and row[1] > now:
+                self._remember(key, row[0], row[1])
+                self.stats["disk_hits"] += 1
+                if row[0] is None:
+                    self.stats["negative_hits"] += 1
+                return True, row[0]
+
+        return False, None
+
+    def _remember(self, key, address, expires_at):
+        self.memory[key] = (address, expires_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def _store(self, key, address):
+        expires_at = time.time() + (self.ttl if address is not None else self.negative_ttl)
+        self._remember(key, address, expires_at)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO geocode (key, address, expires_at) VALUES (?, ?, ?)",
+                            (key, address, expires_at))
+            self.db.commit()
+
+    def get_or_fetch(self, lat, lon, fetch):
+        """Devuelve la dirección cacheada o la obtiene con `fetch(lat, lon)` (None = fallo)."""
+        key = self.key(lat, lon)
+        while True:
+            with self.lock:
+                found, address = self._lookup(key, time.time())
+                if found:
+                    return address
+                waiter = self.in_flight.get(key)
+                if waiter is None:
+                    waiter = threading.Event()
+                    self.in_flight[key] = waiter
+                    self.stats["misses"] += 1
+                    break
+                self.stats["coalesced"] += 1
+            # Otra hebra ya está consultando esta clave: esperar su resultado
+            waiter.wait()
+
+        address = None
+        try:
+            self.stats["remote_lookups"] += 1
+            address = fetch(lat, lon)
+        finally:
+            with self.lock:
+                if address is None:
+                    self.stats["remote_failures"] += 1
+                self._store(key, address)
+                del self.in_flight[key]
+            waiter.set()
+        return address
+
+    def purge_expired(self):
+        """Elimina del disco las entradas vencidas."""
+        if self.db is None:
+            return 0
+        with self.lock:
+            cursor = self.db.execute("DELETE FROM geocode WHERE expires_at <= ?", (time.time(),))
+            self.db.commit()
+            return cursor.rowcount
+
+    def hit_ratio(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["coalesced"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def log_stats(self):
+        s = self.stats
+        logger.info(f"Caché de geocodificación: memoria={s['memory_hits']}, disco={s['disk_hits']}, "
+                    f"negativos={s['negative_hits']}, agrupadas={s['coalesced']}, misses={s['misses']}, "
+                    f"consultas remotas={s['remote_lookups']} (fallidas={s['remote_failures']}), "
+                    f"hit ratio={self.hit_ratio():.1%}, en memoria={len(self.memory)}")
+
+    def reset_stats(self):
+        for name in self.stats:
+            self.stats[name] = 0
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
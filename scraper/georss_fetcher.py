@@ -0,0 +1,208 @@
+"""
+Cliente HTTP concurrente para el endpoint georss de Waze.
+
+Descarga muchas celdas de la cuadrícula en paralelo reutilizando conexiones
+keep-alive, con un límite de concurrencia por host y un token bucket que
+acota la tasa de requests. Si Waze rechaza el request HTTP plano (403/429 o
+una respuesta que no es JSON) se delega en un fallback, normalmente el
+driver de Selenium.
+"""
+
+import os
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+GEORSS_BASE_URL = os.getenv("GEORSS_BASE_URL", "https://www.waze.com/live-map/api/georss")
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+FETCH_MAX_PER_HOST = int(os.getenv("FETCH_MAX_PER_HOST", "4"))
+FETCH_RATE_PER_SECOND = float(os.getenv("FETCH_RATE_PER_SECOND", "4"))
+FETCH_RATE_BURST = int(os.getenv("FETCH_RATE_BURST", "8"))
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "10"))
+
+# Códigos con los que Waze bloquea a clientes que no parecen un navegador
+REJECTED_STATUS_CODES = {401, 403, 429}
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "es-419,es;q=0.9",
+    "Referer": "https://www.waze.com/live-map/",
+}
+
+
+class RequestRejected(Exception):
+    """El servidor rechazó el request HTTP plano."""
+
+
+class TokenBucket:
+    """Limitador de tasa: `rate` tokens por segundo con ráfagas de hasta `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Bloquea hasta obtener un token."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchStats:
+    """Métricas de un barrido: celdas por segundo y latencia por celda."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.latencies = []
+        self.ok = 0
+        self.failed = 0
+        self.fallbacks = 0
+
+    def record(self, latency, ok, fallback=False):
+        with self.lock:
+            self.latencies.append(latency)
+            if ok:
+                self.ok += 1
+            else:
+                self.failed += 1
+            if fallback:
+                self.fallbacks += 1
+
+    def summary(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            latencies = sorted(self.latencies)
+            cells = len(latencies)
+
+            def percentile(p):
+                if not latencies:
+                    return 0.0
+                return latencies[min(cells - 1, int(p * cells))]
+
+            return {
+                "cells": cells,
+                "ok": self.ok,
+                "failed": self.failed,
+                "fallbacks": self.fallbacks,
+                "elapsed_seconds": round(elapsed, 2),
+                "cells_per_second": round(cells / elapsed, 2) if elapsed > 0 else 0,
+                "latency_p50": round(percentile(0.50), 3),
+                "latency_p95": round(percentile(0.95), 3),
+                "latency_max": round(latencies[-1], 3) if latencies else 0.0,
+            }
+
+
+class GeorssFetcher:
+    """Descarga celdas georss en paralelo sobre una sesión HTTP compartida."""
+
+    def __init__(self, base_url=GEORSS_BASE_URL, workers=FETCH_WORKERS, max_per_host=FETCH_MAX_PER_HOST,
+                 rate=FETCH_RATE_PER_SECOND, burst=FETCH_RATE_BURST, timeout=FETCH_TIMEOUT_SECONDS,
+                 fallback=None):
+        self.base_url = base_url
+        self.workers = max(1, workers)
+        self.max_per_host = max(1, max_per_host)
+        self.timeout = timeout
+        self.fallback = fallback
+        self.bucket = TokenBucket(rate, burst)
+        self.stats = FetchStats()
+
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+
+    def build_url(self, cell):
+        return (f"{self.base_url}?top={cell['lat_max']}&bottom={cell['lat_min']}"
+                f"&left={cell['lon_min']}&right={cell['lon_max']}&env=row&types=alerts,traffic,users")
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    def _get_json(self, url):
+        with self._host_slot(url):
+            response = self.session.get(url, timeout=self.timeout)
+        if response.status_code in REJECTED_STATUS_CODES:
+            raise RequestRejected(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        try:
+            return response.json()
+        except ValueError:
+            raise RequestRejected("respuesta no es JSON")
+
+    def fetch_cell(self, cell):
+        """Descarga una celda; devuelve el JSON georss o None."""
+        url = self.build_url(cell)
+        self.bucket.acquire()
+        start = time.monotonic()
+        used_fallback = False
+        data = None
+        try:
+            data = self._get_json(url)
+        except RequestRejected as e:
+            if self.fallback:
+                logger.info(f"Request HTTP rechazado ({e}), usando fallback para {url}")
+                used_fallback = True
+                try:
+                    data = self.fallback(url)
+                except Exception as fe:
+                    logger.error(f"Error en fallback para {url}: {fe}")
+            else:
+                logger.warning(f"Request HTTP rechazado ({e}) y sin fallback: {url}")
+        except requests.RequestException as e:
+            logger.error(f"Error obteniendo datos georss de {url}: {e}")
+
+        latency = time.monotonic() - start
+        self.stats.record(latency, data is not None, used_fallback)
+        logger.debug(f"Celda {url} descargada en {latency:.3f}s")
+        return data
+
+    def fetch_cells(self, cells):
+        """Descarga todas las celdas en paralelo; produce (celda, datos) a medida que terminan."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.fetch_cell, cell): cell for cell in cells}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def log_summary(self, label="Barrido"):
+        s = self.stats.summary()
+        logger.info(f"{label}: {s['cells']} celdas en {s['elapsed_seconds']}s "
+                    f"({s['cells_per_second']} celdas/s), ok={s['ok']}, fallidas={s['failed']}, "
+                    f"fallback={s['fallbacks']}, latencia p50={s['latency_p50']}s "
+                    f"p95={s['latency_p95']}s max={s['latency_max']}s")
+        return s
+
+    def close(self):
+        self.session.close()
+
@@ -0,0 +1,68 @@
+"""
+Geocodificación inversa con Nominatim (OpenStreetMap).
+
+Sin efectos al importarse: lo usan scrape_waze.py (detrás de GeocodeCache) y
+el benchmark de offline_geocoder.py, que no debe cargar el scraper completo.
+"""
+
+import time
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Pausa de cortesía después de cada consulta a la API pública
+NOMINATIM_PAUSE_SECONDS = 0.5
+
+
+def reverse_geocode_nominatim(lat, lon):
+    """Consulta Nominatim; devuelve la dirección o None si la consulta falla."""
+    try:
+        # API de Nominatim (OpenStreetMap) - Gratuita
+        url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}&addressdetails=1"
+        
+        headers = {
+            'User-Agent': 'WazeScraper/1.0 (Contact: admin@example.com)'  # Requerido por Nominatim
+        }
+        
+        response = requests.get(url, headers=headers, timeout=5)
+        
+        if response.status_code == 200:
+            data = response.json()
+            
+            # Extraer la dirección más relevante
+            address_parts = data.get('address', {})
+            
+            # Intentar obtener calle y número
+            street_number = address_parts.get('house_number', '')
+            street_name = address_parts.get('road', '')
+            
+            if street_name:
+                if street_number:
+                    full_address = f"{street_name} {street_number}"
+                else:
+                    full_address = street_name
+                
+                # Añadir comuna/barrio si está disponible
+                suburb = address_parts.get('suburb', '') or address_parts.get('neighbourhood', '')
+                if suburb:
+                    full_address += f", {suburb}"
+                
+                return full_address
+            else:
+                # Si no hay calle, usar el display_name completo pero más corto
+                display_name = data.get('display_name', '')
+                if display_name:
+                    # Tomar solo las primeras 2-3 partes de la dirección
+                    parts = display_name.split(',')[:3]
+                    return ', '.join(parts).strip()
+        
+        return None
+        
+    except Exception as e:
+        logger.warning(f"Error obteniendo dirección para {lat}, {lon}: {e}")
+        return None
+    finally:
+        # Pausa breve para no sobrecargar la API de geocodificación (solo en consultas remotas)
+        time.sleep(NOMINATIM_PAUSE_SECONDS)
@@ -0,0 +1,356 @@
+"""
+Geocodificador inverso offline para el área de Santiago.
+
+Carga un extracto GeoJSON derivado de OpenStreetMap (calles, números de casa y
+comunas/barrios) y construye un índice espacial de grilla uniforme sobre los
+segmentos de calle. Responde "calle número, barrio" en el mismo formato que
+la geocodificación con Nominatim del scraper, sin red y en microsegundos.
+
+El extracto se puede generar con:
+
+    python offline_geocoder.py --download data/santiago_streets.geojson
+
+y comparar contra Nominatim con:
+
+    python offline_geocoder.py data/santiago_streets.geojson --benchmark --http-samples 5
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+
+from scraper_config import TARGET_AREA
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_GEOCODER_PATH = os.getenv("OFFLINE_GEOCODER_PATH", "data/santiago_streets.geojson")
+OFFLINE_GRID_CELL_DEGREES = float(os.getenv("OFFLINE_GRID_CELL_DEGREES", "0.002"))  # ~200 m
+OFFLINE_MAX_ROAD_DISTANCE_M = float(os.getenv("OFFLINE_MAX_ROAD_DISTANCE_M", "150"))
+OFFLINE_MAX_HOUSE_DISTANCE_M = float(os.getenv("OFFLINE_MAX_HOUSE_DISTANCE_M", "30"))
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+SUBURB_PLACES = {"suburb", "neighbourhood", "quarter"}
+METERS_PER_DEGREE = 111320.0
+
+
+def _ring_area(ring):
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1])) / 2.0
+
+
+def _point_in_ring(x, y, ring):
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class UniformGrid:
+    """Grilla uniforme en grados; cada celda guarda los índices de los objetos que la tocan."""
+
+    def __init__(self, cell_degrees):
+        self.cell = cell_degrees
+        self.cells = {}
+
+    def cell_of(self, lon, lat):
+        return int(math.floor(lon / self.cell)), int(math.floor(lat / self.cell))
+
+    def insert_bbox(self, item, lon_min, lat_min, lon_max, lat_max):
+        cx0, cy0 = self.cell_of(lon_min, lat_min)
+        cx1, cy1 = self.cell_of(lon_max, lat_max)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.cells.setdefault((cx, cy), []).append(item)
+
+    def ring(self, cx, cy, r):
+        """Celdas a distancia de Chebyshev exactamente r de (cx, cy)."""
+        if r == 0:
+            yield self.cells.get((cx, cy), ())
+            return
+        for dx in range(-r, r + 1):
+            yield self.cells.get((cx + dx, cy - r), ())
+            yield self.cells.get((cx + dx, cy + r), ())
+        for dy in range(-r + 1, r):
+            yield self.cells.get((cx - r, cy + dy), ())
+            yield self.cells.get((cx + r, cy + dy), ())
+
+
+class OfflineGeocoder:
+    """Geocodificador inverso sobre un extracto local de OSM."""
+
+    def __init__(self, cell_degrees=OFFLINE_GRID_CELL_DEGREES, max_road_distance=OFFLINE_MAX_ROAD_DISTANCE_M,
+                 max_house_distance=OFFLINE_MAX_HOUSE_DISTANCE_M):
+        self.cell_degrees = cell_degrees
+        self.max_road_distance = max_road_distance
+        self.max_house_distance = max_house_distance
+
+        # Segmentos como tuplas planas (x1, y1, x2, y2, índice de calle)
+        self.segments = []
+        self.road_names = []
+        self.houses = []   # (lon, lat, número, calle)
+        self.suburb_points = []  # (lon, lat, nombre)
+        self.suburb_polygons = []  # (área, bbox, anillo exterior, nombre)
+
+        self.segment_grid = UniformGrid(cell_degrees)
+        self.house_grid = UniformGrid(cell_degrees)
+        self.suburb_grid = UniformGrid(cell_degrees * 10)
+        self.cos_lat = 1.0
+
+    @classmethod
+    def from_geojson(cls, path, **kwargs):
+        with open(path, "r", encoding="utf-8") as f:
+            collection = json.load(f)
+        geocoder = cls(**kwargs)
+        geocoder.load_features(collection.get("features", []))
+        return geocoder
+
+    # --- Construcción del índice ---
+
+    def load_features(self, features):
+        start = time.perf_counter()
+        road_ids = {}
+        for feature in features:
+            props = feature.get("properties") or {}
+            geometry = feature.get("geometry") or {}
+            gtype = geometry.get("type")
+            coords = geometry.get("coordinates")
+            if not coords:
+                continue
+
+            if props.get("place") in SUBURB_PLACES and props.get("name"):
+                self._add_suburb(props["name"], gtype, coords)
+            elif gtype in ("LineString", "MultiLineString") and props.get("name") and props.get("highway"):
+                name = props["name"]
+                if name not in road_ids:
+                    road_ids[name] = len(self.road_names)
+                    self.road_names.append(name)
+                lines = [coords] if gtype == "LineString" else coords
+                for line in lines:
+                    for (x1, y1), (x2, y2) in zip(line, line[1:]):
+                        self.segments.append((x1, y1, x2, y2, road_ids[name]))
+            elif gtype == "Point" and props.get("addr:housenumber"):
+                self.houses.append((coords[0], coords[1], str(props["addr:housenumber"]), props.get("addr:street", "")))
+
+        lats = [s[1] for s in self.segments] or [-33.45]
+        self.cos_lat = math.cos(math.radians(sum(lats) / len(lats)))
+
+        for i, (x1, y1, x2, y2, _) in enumerate(self.segments):
+            self.segment_grid.insert_bbox(i, min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        for i, (x, y, _, _) in enumerate(self.houses):
+            self.house_grid.insert_bbox(i, x, y, x, y)
+        for i, (_, (x0, y0, x1, y1), _, _) in enumerate(self.suburb_polygons):
+            self.suburb_grid.insert_bbox(i, x0, y0, x1, y1)
+
+        logger.info(f"Índice offline construido: {len(self.segments)} segmentos de {len(self.road_names)} calles, "
+                    f"{len(self.houses)} números, {len(self.suburb_polygons) + len(self.suburb_points)} barrios "
+                    f"en {time.perf_counter() - start:.2f}s")
+
+    def _add_suburb(self, name, gtype, coords):
+        if gtype == "Point":
+            self.suburb_points.append((coords[0], coords[1], name))
+            return
+        polygons = [coords] if gtype == "Polygon" else coords if gtype == "MultiPolygon" else []
+        for polygon in polygons:
+            ring = [tuple(p[:2]) for p in polygon[0]]
+            xs = [p[0] for p in ring]
+            ys = [p[1] for p in ring]
+            self.suburb_polygons.append((abs(_ring_area(ring)), (min(xs), min(ys), max(xs), max(ys)), ring, name))
+
+    # --- Consultas ---
+
+    def _nearest(self, grid, lon, lat, distance_sq, max_distance):
+        """Búsqueda por anillos crecientes hasta que ningún anillo pueda mejorar el mejor candidato."""
+        cx, cy = grid.cell_of(lon, lat)
+        cell_m = grid.cell * METERS_PER_DEGREE * self.cos_lat
+        max_rings = int(max_distance / cell_m) + 1
+        best, best_d = None, max_distance * max_distance
+        seen = set()
+        for r in range(max_rings + 1):
+            # Todo lo que está en el anillo r está al menos a (r - 1) celdas de distancia
+            if best is not None and ((r - 1) * cell_m) ** 2 > best_d:
+                break
+            for bucket in grid.ring(cx, cy, r):
+                for item in bucket:
+                    if item in seen:
+                        continue
+                    seen.add(item)
+                    d = distance_sq(item, lon, lat)
+                    if d <= best_d:
+                        best, best_d = item, d
+        return best, best_d
+
+    def _segment_distance_sq(self, i, lon, lat):
+        x1, y1, x2, y2, _ = self.segments[i]
+        k = self.cos_lat
+        ax, ay = (x1 - lon) * k, y1 - lat
+        bx, by = (x2 - lon) * k, y2 - lat
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+        t = 0.0 if length_sq == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length_sq))
+        px, py = ax + t * dx, ay + t * dy
+        return (px * px + py * py) * METERS_PER_DEGREE * METERS_PER_DEGREE
+
+    def _house_distance_sq(self, i, lon, lat):
+        x, y, _, _ = self.houses[i]
+        dx, dy = (x - lon) * self.cos_lat, y - lat
+        return (dx * dx + dy * dy) * METERS_PER_DEGREE * METERS_PER_DEGREE
+
+    def nearest_road(self, lat, lon):
+        i, d = self._nearest(self.segment_grid, lon, lat, self._segment_distance_sq, self.max_road_distance)
+        if i is None:
+            return None, None
+        return self.road_names[self.segments[i][4]], math.sqrt(d)
+
+    def house_number(self, lat, lon, road):
+        i, _ = self._nearest(self.house_grid, lon, lat, self._house_distance_sq, self.max_house_distance)
+        if i is None:
+            return ""
+        _, _, number, street = self.houses[i]
+        return number if not street or street == road else ""
+
+    def suburb(self, lat, lon):
+        cell = self.suburb_grid.cell_of(lon, lat)
+        best = None
+        for i in self.suburb_grid.cells.get(cell, ()):
+            area, (x0, y0, x1, y1), ring, name = self.suburb_polygons[i]
+            if x0 <= lon <= x1 and y0 <= lat <= y1 and _point_in_ring(lon, lat, ring):
+                # El polígono más pequeño que contiene al punto es el más específico
+                if best is None or area < best[0]:
+                    best = (area, name)
+        if best:
+            return best[1]
+        if self.suburb_points:
+            k = self.cos_lat
+            return min(self.suburb_points, key=lambda p: ((p[0] - lon) * k) ** 2 + (p[1] - lat) ** 2)[2]
+        return ""
+
+    def reverse(self, lat, lon):
+        """Devuelve "calle número, barrio" o None si no hay calle cercana."""
+        road, _ = self.nearest_road(lat, lon)
+        if not road:
+            return None
+        number = self.house_number(lat, lon, road)
+        full_address = f"{road} {number}" if number else road
+        suburb = self.suburb(lat, lon)
+        if suburb:
+            full_address += f", {suburb}"
+        return full_address
+
+    def reverse_batch(self, coordinates):
+        """Resuelve una lista de (lat, lon): un reverse() por punto distinto (redondeado a 1e-5°),
+        memorizado dentro de la llamada. No es vectorizado; ahorra solo las consultas repetidas."""
+        resolved = {}
+        results = []
+        for lat, lon in coordinates:
+            key = (round(lat, 5), round(lon, 5))
+            if key not in resolved:
+                resolved[key] = self.reverse(lat, lon)
+            results.append(resolved[key])
+        return results
+
+    def resolve_alerts(self, alerts):
+        """Direcciones para todas las alertas de una respuesta georss, en el mismo orden."""
+        coordinates = []
+        for alert in alerts:
+            location = alert.get("location", {})
+            coordinates.append((location.get("y", 0), location.get("x", 0)))
+        return self.reverse_batch(coordinates)
+
+
+# --- Construcción del extracto desde Overpass ---
+
+def download_extract(path, area):
+    """Descarga calles, números y barrios del área desde Overpass y los guarda como GeoJSON."""
+    import requests
+
+    bbox = f"{area['lat_min']},{area['lon_min']},{area['lat_max']},{area['lon_max']}"
+    query = f"""
+        [out:json][timeout:300];
+        (
+          way["highway"]["name"]({bbox});
+          node["addr:housenumber"]({bbox});
+          node["place"~"^(suburb|neighbourhood|quarter)$"]({bbox});
+          way["place"~"^(suburb|neighbourhood|quarter)$"]({bbox});
+        );
+        out geom;
+    """
+    response = requests.post(OVERPASS_URL, data={"data": query}, timeout=600)
+    response.raise_for_status()
+
+    features = []
+    for element in response.json().get("elements", []):
+        tags = element.get("tags", {})
+        if element["type"] == "node":
+            geometry = {"type": "Point", "coordinates": [element["lon"], element["lat"]]}
+        elif element["type"] == "way" and element.get("geometry"):
+            line = [[p["lon"], p["lat"]] for p in element["geometry"]]
+            if tags.get("place") and line[0] == line[-1]:
+                geometry = {"type": "Polygon", "coordinates": [line]}
+            else:
+                geometry = {"type": "LineString", "coordinates": line}
+        else:
+            continue
+        props = {k: tags[k] for k in ("name", "highway", "place", "addr:housenumber", "addr:street") if k in tags}
+        features.append({"type": "Feature", "properties": props, "geometry": geometry})
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False)
+    logger.info(f"Extracto guardado en {path}: {len(features)} elementos")
+
+
+# --- Benchmark ---
+
+def benchmark(geocoder, area, samples=20000, http_samples=0):
+    """Compara el geocodificador offline (escalar y batch) con el camino HTTP de Nominatim."""
+    rng = random.Random(42)
+    coordinates = [(rng.uniform(area["lat_min"], area["lat_max"]), rng.uniform(area["lon_min"], area["lon_max"]))
+                   for _ in range(samples)]
+
+    start = time.perf_counter()
+    resolved = sum(1 for lat, lon in coordinates if geocoder.reverse(lat, lon))
+    scalar = time.perf_counter() - start
+    logger.info(f"Offline escalar: {samples} consultas en {scalar:.3f}s "
+                f"({scalar / samples * 1e6:.1f} µs/consulta, {resolved} con calle)")
+
+    start = time.perf_counter()
+    geocoder.reverse_batch(coordinates)
+    batch = time.perf_counter() - start
+    logger.info(f"Offline batch: {samples} consultas en {batch:.3f}s ({batch / samples * 1e6:.1f} µs/consulta)")
+
+    if http_samples:
+        from nominatim import reverse_geocode_nominatim
+        start = time.perf_counter()
+        for lat, lon in coordinates[:http_samples]:
+            offline = geocoder.reverse(lat, lon)
+            remote = reverse_geocode_nominatim(lat, lon)
+            logger.info(f"  ({lat:.5f}, {lon:.5f}) offline={offline!r} nominatim={remote!r}")
+        http = time.perf_counter() - start
+        logger.info(f"Nominatim HTTP: {http_samples} consultas en {http:.2f}s "
+                    f"({http / http_samples * 1e3:.0f} ms/consulta, incluye la pausa de cortesía)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    parser = argparse.ArgumentParser(description="Geocodificador inverso offline")
+    parser.add_argument("path", nargs="?", default=OFFLINE_GEOCODER_PATH)
+    parser.add_argument("--download", action="store_true", help="descargar el extracto desde Overpass")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--http-samples", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.download:
+        download_extract(args.path, TARGET_AREA)
+    if args.benchmark:
+        benchmark(OfflineGeocoder.from_geojson(args.path), TARGET_AREA, args.samples, args.http_samples)
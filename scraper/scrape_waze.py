@@ -5,9 +5,22 @@ import json
 import sys
 import logging
 import os
-import requests  # AÑADIR ESTA IMPORTACIÓN
+import threading
+import queue
 from datetime import datetime
-from collections import defaultdict
+from collections import deque
+
+from adaptive_grid import AdaptiveGrid
+from cell_scheduler import CellScheduler, CYCLE_PERIOD_SECONDS, start_workers
+from alert_lifecycle import AlertLifecycleTracker
+from dedupe_index import DedupeIndex
+from event_log import EventLogWriter, EVENT_LOG_DIR, list_segments, tail
+from event_stream import EVENT_TRANSPORT, EventStreamPublisher, connect_to_redis
+from georss_fetcher import GeorssFetcher
+from geocode_cache import GeocodeCache
+from offline_geocoder import OfflineGeocoder, OFFLINE_GEOCODER_PATH
+from scraper_config import TARGET_AREA
+from nominatim import reverse_geocode_nominatim
 
 # Selenium imports
 try:
@@ -37,54 +50,105 @@ if not logger.handlers:
     logger.addHandler(log_handler_file)
     logger.addHandler(log_handler_console)
 
-# --- Configuración del Área de Santiago ---
-TARGET_AREA = {
-    "lat_max": -33.3503,  # Norte
-    "lat_min": -33.6106,  # Sur
-    "lon_min": -70.7778,  # Oeste
-    "lon_max": -70.4990   # Este
-}
+# GRID_MODE=fixed vuelve a la cuadrícula uniforme de create_grid
+GRID_MODE = os.getenv("GRID_MODE", "adaptive")
 
 # --- Almacenamiento ---
-scraped_events = []
-event_id_counts = defaultdict(int)
-output_filename = "data/waze_events.json"
+# En memoria solo queda una ventana de eventos recientes; el historial vive en el log segmentado
+RECENT_EVENTS_WINDOW = int(os.getenv("RECENT_EVENTS_WINDOW", "5000"))
+scraped_events = deque(maxlen=RECENT_EVENTS_WINDOW)
+output_filename = "data/waze_events.json"  # Formato anterior (JSON completo), solo se migra
+event_log = None
+# Con EVENT_TRANSPORT=stream además se publica cada registro en un Redis Stream
+event_publisher = None
+# Alertas ya vistas (por uuid de Waze) dentro de una ventana de tiempo acotada
+dedupe_index = DedupeIndex()
+# Alertas activas por ubicación, para detectar cambios y expiraciones entre ciclos
+alert_tracker = AlertLifecycleTracker()
+
+# --- Geocodificación inversa ---
+# ADDRESS_SOURCE=payload arma la dirección con street/city de georss y solo geocodifica si falta la calle;
+# ADDRESS_SOURCE=geocode geocodifica todas las alertas como antes.
+ADDRESS_SOURCE = os.getenv("ADDRESS_SOURCE", "payload")
+# GEOCODER_MODE=offline usa el extracto local de OSM en lugar de Nominatim
+GEOCODER_MODE = os.getenv("GEOCODER_MODE", "nominatim")
+geocode_cache = GeocodeCache()
+offline_geocoder = None
 
-def save_events():
-    """Guarda eventos en JSON."""
+# --- Navegador (solo se usa como fallback del fetcher HTTP) ---
+driver = None
+driver_lock = threading.Lock()
+
+def save_events(new_events=0):
+    """Deja visibles para el importer los registros agregados (log y, si está activo, stream)."""
     try:
-        os.makedirs(os.path.dirname(output_filename), exist_ok=True)
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(scraped_events, f, indent=4, ensure_ascii=False)
-        logger.info(f"Eventos guardados: {len(scraped_events)}")
+        event_log.flush()
+        if event_publisher:
+            event_publisher.flush()
+        if new_events:
+            logger.info(f"Eventos guardados en log (segmento {event_log.segment})")
     except Exception as e:
         logger.error(f"Error guardando eventos: {e}")
 
+def append_event(event_data):
+    """Agrega un evento al log y a la ventana de eventos recientes."""
+    end = event_log.append(event_data)
+    if event_publisher:
+        event_publisher.publish(event_data, event_log.last_start, end)
+    scraped_events.append(event_data)
+
+def emit_change(change):
+    """Agrega al log un registro de cambio compacto (updated / expired)."""
+    end = event_log.append(change)
+    if event_publisher:
+        event_publisher.publish(change, event_log.last_start, end)
+
+def dedupe_key(record):
+    """Clave de deduplicación: el uuid de Waze, o el event_id para eventos antiguos sin uuid."""
+    return record.get('uuid') or record.get('event_id')
+
+def migrate_legacy_events():
+    """Pasa el antiguo waze_events.json al log segmentado (una sola vez)."""
+    if not os.path.exists(output_filename):
+        return
+    try:
+        with open(output_filename, "r", encoding="utf-8") as f:
+            legacy_events = json.load(f)
+        for event in legacy_events:
+            event_log.append(event)
+        event_log.sync()
+        os.rename(output_filename, f"{output_filename}.migrated")
+        logger.info(f"Migrados {len(legacy_events)} eventos de {output_filename} al log segmentado")
+    except Exception as e:
+        logger.error(f"Error migrando {output_filename}: {e}")
+
 def load_events():
-    """Carga eventos previos."""
-    global scraped_events, event_id_counts
+    """Abre el log y carga la ventana de eventos recientes y el índice de deduplicación."""
+    global event_log
+    log_exists = bool(list_segments(EVENT_LOG_DIR))
+    event_log = EventLogWriter(EVENT_LOG_DIR)
+    if not log_exists:
+        migrate_legacy_events()
+    scraped_events.clear()
     try:
-        if os.path.exists(output_filename):
-            with open(output_filename, "r", encoding="utf-8") as f:
-                scraped_events = json.load(f)
-                event_id_counts.clear()
-                for event in scraped_events:
-                    event_id = event.get('event_id')
-                    if event_id:
-                        event_id_counts[event_id] += 1
-                logger.info(f"Cargados {len(scraped_events)} eventos previos")
-        else:
-            scraped_events = []
-            event_id_counts.clear()
+        scraped_events.extend(tail(RECENT_EVENTS_WINDOW, EVENT_LOG_DIR))
+        alert_tracker.load()
+        if not dedupe_index.load():
+            # Sin snapshot (primer arranque): sembrar el índice con los eventos recientes
+            for event in scraped_events:
+                if dedupe_key(event):
+                    dedupe_index.add(dedupe_key(event))
+        logger.info(f"Cargados {len(scraped_events)} eventos recientes, {len(dedupe_index)} claves de deduplicación")
     except Exception as e:
         logger.error(f"Error cargando eventos: {e}")
-        scraped_events = []
-        event_id_counts.clear()
 
 def get_georss_data(driver, lat_max, lat_min, lon_min, lon_max):
     """Obtiene datos del endpoint georss de Waze."""
     georss_url = f"https://www.waze.com/live-map/api/georss?top={lat_max}&bottom={lat_min}&left={lon_min}&right={lon_max}&env=row&types=alerts,traffic,users"
-    
+    return get_georss_data_from_url(driver, georss_url)
+
+def get_georss_data_from_url(driver, georss_url):
+    """Carga una URL georss en el navegador y extrae el JSON del elemento <pre>."""
     logger.info(f"Accediendo a: {georss_url}")
     
     try:
@@ -113,17 +177,34 @@ def get_georss_data(driver, lat_max, lat_min, lon_min, lon_max):
         logger.error(f"Error obteniendo datos georss: {e}")
         return None
 
-def process_alerts(alerts_data):
-    """Procesa las alertas del JSON de georss."""
-    if not alerts_data or 'alerts' not in alerts_data:
+def selenium_fallback(url):
+    """Fallback del fetcher HTTP: usa Chrome (iniciado solo si hace falta) y de a un request."""
+    global driver
+    with driver_lock:
+        if driver is None:
+            logger.info("Inicializando Chrome WebDriver para fallback...")
+            driver = get_driver()
+        return get_georss_data_from_url(driver, url)
+
+def process_alerts(alerts_data, cell=None):
+    """Procesa las alertas del JSON de georss y emite eventos nuevos y registros de cambio."""
+    if not alerts_data:
         logger.info("No hay alertas en los datos")
         return 0
     
     new_events = 0
-    alerts = alerts_data['alerts']
+    alerts = alerts_data.get('alerts', [])
     logger.info(f"Procesando {len(alerts)} alertas")
+    now = datetime.utcnow()
+    seen_keys = set()
+    
+    # En modo offline toda la respuesta se geocodifica en una sola llamada
+    # (con ADDRESS_SOURCE=payload solo se geocodifican las alertas sin calle, una a una)
+    offline_addresses = None
+    if offline_geocoder and ADDRESS_SOURCE != "payload":
+        offline_addresses = offline_geocoder.resolve_alerts(alerts)
     
-    for alert in alerts:
+    for i, alert in enumerate(alerts):
         try:
             # Extraer información del alert
             alert_type = alert.get('type', 'Desconocido')
@@ -131,44 +212,74 @@ def process_alerts(alerts_data):
             lat = location.get('y', 0)
             lon = location.get('x', 0)
             
-            # NUEVO: Obtener dirección real de la calle
-            logger.info(f"Obteniendo dirección para coordenadas {lat:.4f}, {lon:.4f}")
-            street_address = get_street_address(lat, lon)
-            
             # Información adicional
             report_time = alert.get('pubMillis', int(time.time() * 1000))
             report_time_str = datetime.fromtimestamp(report_time / 1000).strftime('%Y-%m-%d %H:%M:%S')
             
             # Crear ID único
             event_id = f"{alert_type}-{lat:.4f}-{lon:.4f}-{report_time}"
+            key = alert.get('uuid') or event_id
+            seen_keys.add(key)
             
-            # Verificar si ya existe
-            if event_id_counts[event_id] == 0:
-                event_data = {
-                    "event_id": event_id,
-                    "type": alert_type,
-                    "address": street_address,  # AHORA ES LA DIRECCIÓN REAL
-                    "latitude": lat,
-                    "longitude": lon,
-                    "report_time": report_time_str,
-                    "reporter": alert.get('reportBy', 'Desconocido'),
-                    "confidence": alert.get('confidence', 0),
-                    "scrape_timestamp": datetime.utcnow().isoformat()
-                }
-                
-                scraped_events.append(event_data)
-                event_id_counts[event_id] += 1
-                new_events += 1
-                
-                logger.info(f"NUEVO EVENTO: {alert_type} en {street_address}")
+            status, change = alert_tracker.observe(key, event_id, alert, lat, lon, now)
+            
+            # Verificar si ya existe (por uuid de Waze dentro de la ventana de deduplicación)
+            if dedupe_index.seen(key):
+                if status == "new":
+                    # Ya emitida antes (expiró o se perdió el estado): vuelve a estar activa
+                    change = alert_tracker.reactivated(key)
+                if change:
+                    emit_change(change)
+                continue
+            
+            # NUEVO: Obtener dirección real de la calle (solo para eventos nuevos)
+            street_address = payload_address(alert) if ADDRESS_SOURCE == "payload" else None
+            if street_address is None:
+                if offline_addresses is not None:
+                    street_address = offline_addresses[i] or f"Lat: {lat:.4f}, Lon: {lon:.4f}"
+                elif offline_geocoder:
+                    street_address = offline_geocoder.reverse(lat, lon) or f"Lat: {lat:.4f}, Lon: {lon:.4f}"
+                else:
+                    logger.info(f"Obteniendo dirección para coordenadas {lat:.4f}, {lon:.4f}")
+                    street_address = get_street_address(lat, lon)
+            
+            event_data = {
+                "event_id": event_id,
+                "uuid": alert.get('uuid'),
+                "type": alert_type,
+                "address": street_address,  # AHORA ES LA DIRECCIÓN REAL
+                "latitude": lat,
+                "longitude": lon,
+                "report_time": report_time_str,
+                "reporter": alert.get('reportBy', 'Desconocido'),
+                "confidence": alert.get('confidence', 0),
+                "reliability": alert.get('reliability', 0),
+                "thumbs_up": alert.get('nThumbsUp', 0),
+                "report_rating": alert.get('reportRating', 0),
+                "subtype": alert.get('subtype') or None,
+                "street": alert.get('street') or None,
+                "city": alert.get('city') or None,
+                "first_seen": now.isoformat(),
+                "last_seen": now.isoformat(),
+                "scrape_timestamp": now.isoformat()
+            }
             
-            # Pausa breve para no sobrecargar la API de geocodificación
-            time.sleep(0.5)
+            append_event(event_data)
+            # Recién con el evento escrito cuenta como visto
+            dedupe_index.add(key)
+            new_events += 1
+            
+            logger.info(f"NUEVO EVENTO: {alert_type} en {street_address}")
         
         except Exception as e:
             logger.error(f"Error procesando alerta individual: {e}")
             continue
     
+    # Alertas activas dentro de la celda que ya no vinieron en la respuesta
+    if cell:
+        for change in alert_tracker.expire_missing(cell, seen_keys, now):
+            emit_change(change)
+    
     return new_events
 
 
@@ -181,6 +292,7 @@ def create_grid(area, grid_size=0.02):
         lon = area["lon_min"]
         while lon <= area["lon_max"]:
             grid_points.append({
+                "tile_id": f"g{len(grid_points)}",
                 "lat_max": min(lat + grid_size, area["lat_max"]),
                 "lat_min": lat,
                 "lon_min": lon,
@@ -191,54 +303,21 @@ def create_grid(area, grid_size=0.02):
     
     return grid_points
 
+def payload_address(alert):
+    """Dirección "calle, comuna" con los campos que ya trae georss; None si la alerta no trae calle."""
+    street = (alert.get('street') or '').strip()
+    if not street:
+        return None
+    city = (alert.get('city') or '').strip()
+    return f"{street}, {city}" if city else street
+
 def get_street_address(lat, lon):
-    """Obtiene la dirección de la calle usando geocodificación inversa."""
-    try:
-        # API de Nominatim (OpenStreetMap) - Gratuita
-        url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}&addressdetails=1"
-        
-        headers = {
-            'User-Agent': 'WazeScraper/1.0 (Contact: admin@example.com)'  # Requerido por Nominatim
-        }
-        
-        response = requests.get(url, headers=headers, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Extraer la dirección más relevante
-            address_parts = data.get('address', {})
-            
-            # Intentar obtener calle y número
-            street_number = address_parts.get('house_number', '')
-            street_name = address_parts.get('road', '')
-            
-            if street_name:
-                if street_number:
-                    full_address = f"{street_name} {street_number}"
-                else:
-                    full_address = street_name
-                
-                # Añadir comuna/barrio si está disponible
-                suburb = address_parts.get('suburb', '') or address_parts.get('neighbourhood', '')
-                if suburb:
-                    full_address += f", {suburb}"
-                
-                return full_address
-            else:
-                # Si no hay calle, usar el display_name completo pero más corto
-                display_name = data.get('display_name', '')
-                if display_name:
-                    # Tomar solo las primeras 2-3 partes de la dirección
-                    parts = display_name.split(',')[:3]
-                    return ', '.join(parts).strip()
-        
-        # Si falla todo, devolver coordenadas
-        return f"Lat: {lat:.4f}, Lon: {lon:.4f}"
-        
-    except Exception as e:
-        logger.warning(f"Error obteniendo dirección para {lat}, {lon}: {e}")
-        return f"Lat: {lat:.4f}, Lon: {lon:.4f}"
+    """Obtiene la dirección de la calle usando geocodificación inversa (con caché)."""
+    street_address = geocode_cache.get_or_fetch(lat, lon, reverse_geocode_nominatim)
+    if street_address:
+        return street_address
+    # Si falla todo, devolver coordenadas
+    return f"Lat: {lat:.4f}, Lon: {lon:.4f}"
 
 def get_driver():
     """Inicializa el driver de Chrome."""
@@ -265,7 +344,9 @@ def get_driver():
 
 # --- Flujo Principal ---
 if __name__ == "__main__":
-    driver = None
+    fetcher = None
+    adaptive_grid = None
+    scheduler = None
     
     try:
         logger.info("=== INICIANDO SCRAPER WAZE OPTIMIZADO ===")
@@ -273,58 +354,97 @@ if __name__ == "__main__":
         # Cargar eventos previos
         load_events()
         
-        # Inicializar WebDriver
-        logger.info("Inicializando Chrome WebDriver...")
-        driver = get_driver()
-        logger.info("WebDriver inicializado correctamente")
+        if GEOCODER_MODE == "offline":
+            logger.info(f"Cargando geocodificador offline desde {OFFLINE_GEOCODER_PATH}...")
+            offline_geocoder = OfflineGeocoder.from_geojson(OFFLINE_GEOCODER_PATH)
+        
+        if EVENT_TRANSPORT == "stream":
+            event_publisher = EventStreamPublisher(connect_to_redis())
+        
+        if GRID_MODE == "adaptive":
+            adaptive_grid = AdaptiveGrid(TARGET_AREA)
+        
+        # Cliente HTTP concurrente; Chrome solo se levanta si Waze rechaza el request plano
+        fetcher = GeorssFetcher(fallback=selenium_fallback)
+        logger.info(f"Fetcher HTTP inicializado ({fetcher.workers} workers, {fetcher.max_per_host} conexiones por host)")
+        
+        # Celdas a consultar: teselas adaptativas o la cuadrícula fija de siempre
+        scheduler = CellScheduler()
+        if adaptive_grid:
+            scheduler.sync(adaptive_grid.start_cycle())
+        else:
+            scheduler.sync(create_grid(TARGET_AREA))
+        logger.info(f"Planificador con {len(scheduler.cells)} celdas, periodo de {CYCLE_PERIOD_SECONDS}s")
+        
+        # Los workers descargan en paralelo las celdas vencidas; el procesamiento queda en este hilo
+        results = queue.Queue()
+        start_workers(scheduler, fetcher.fetch_cell, results, fetcher.workers)
         
         # BUCLE INFINITO - El scraper correrá indefinidamente
-        cycle_count = 0
+        cycle_count = 1
+        total_new_events = 0
+        fetcher.stats.reset()
+        cycle_deadline = time.monotonic() + CYCLE_PERIOD_SECONDS
         while True:
-            cycle_count += 1
-            logger.info(f"\n{'='*20} CICLO {cycle_count} {'='*20}")
-            
-            # Crear cuadrícula de áreas a consultar
-            grid_points = create_grid(TARGET_AREA)
-            logger.info(f"Cuadrícula creada: {len(grid_points)} puntos")
-            
-            total_new_events = 0
+            try:
+                grid_point, data = results.get(timeout=max(0.0, min(1.0, cycle_deadline - time.monotonic())))
+            except queue.Empty:
+                grid_point = None
             
-            # Procesar cada punto de la cuadrícula
-            for i, grid_point in enumerate(grid_points, 1):
-                logger.info(f"\n--- Ciclo {cycle_count} - Punto {i}/{len(grid_points)} ---")
-                
-                # Obtener datos del georss para esta área
-                data = get_georss_data(
-                    driver,
-                    grid_point["lat_max"],
-                    grid_point["lat_min"], 
-                    grid_point["lon_min"],
-                    grid_point["lon_max"]
-                )
-                
+            if grid_point:
+                changes_before = sum(alert_tracker.counts.values())
                 if data:
-                    # Procesar alertas
-                    new_events = process_alerts(data)
+                    # Procesar alertas y publicar los eventos y cambios de la celda
+                    new_events = process_alerts(data, grid_point)
                     total_new_events += new_events
-                    
-                    # Guardar después de cada punto si hay eventos nuevos
-                    if new_events > 0:
-                        save_events()
+                    save_events(new_events)
+                
+                # Churn de la celda: alertas nuevas, actualizadas o expiradas en esta visita
+                churn = sum(alert_tracker.counts.values()) - changes_before
+                scheduler.complete(grid_point["tile_id"], churn)
                 
-                # Pausa entre requests para no sobrecargar el servidor
-                time.sleep(1)
+                # Las teselas saturadas se dividen y sus hijas se consultan de inmediato
+                if adaptive_grid:
+                    alert_count = len(data.get('alerts', [])) if data else 0
+                    children = adaptive_grid.record(grid_point, alert_count)
+                    if children:
+                        scheduler.remove(grid_point["tile_id"])
+                        for child in children:
+                            scheduler.add(child)
             
+            if time.monotonic() < cycle_deadline:
+                continue
+            
+            # Fin del periodo: métricas, snapshots y expiración de alertas viejas
+            if adaptive_grid:
+                adaptive_grid.end_cycle()
+                scheduler.sync(adaptive_grid.start_cycle())
+            fetcher.log_summary(f"Ciclo {cycle_count}")
+            scheduler.log_freshness()
+            geocode_cache.log_stats()
+            geocode_cache.reset_stats()
+            dedupe_index.log_stats()
+            dedupe_index.reset_stats()
+            dedupe_index.save()
+            for change in alert_tracker.expire_stale(datetime.utcnow()):
+                emit_change(change)
+            alert_tracker.log_stats()
+            alert_tracker.reset_stats()
+            alert_tracker.save()
             logger.info(f"\n=== CICLO {cycle_count} COMPLETADO ===")
             logger.info(f"Nuevos eventos encontrados: {total_new_events}")
-            logger.info(f"Total eventos en archivo: {len(scraped_events)}")
+            logger.info(f"Eventos recientes en memoria: {len(scraped_events)}")
             
-            # Guardar resultado final del ciclo
+            # Guardar resultado del periodo (fsync del lote pendiente)
             save_events()
+            event_log.sync()
+            if event_publisher:
+                event_publisher.log_stats()
             
-            # Pausa entre ciclos completos (15 minutos)
-            logger.info(f"Esperando 15 minutos antes del siguiente ciclo...")
-            time.sleep(900)  # 15 minutos = 900 segundos
+            cycle_count += 1
+            total_new_events = 0
+            fetcher.stats.reset()
+            cycle_deadline = time.monotonic() + CYCLE_PERIOD_SECONDS
         
     except KeyboardInterrupt:
         logger.warning("Interrupción por teclado detectada")
@@ -332,6 +452,15 @@ if __name__ == "__main__":
         logger.error(f"Error crítico: {e}")
     finally:
         # Limpieza
+        if scheduler:
+            scheduler.stop()
+        if fetcher:
+            fetcher.close()
+        geocode_cache.close()
+        if event_log:
+            event_log.close()
+        dedupe_index.save()
+        alert_tracker.save()
         if driver:
             logger.info("Cerrando navegador...")
             driver.quit()
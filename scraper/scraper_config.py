@@ -0,0 +1,15 @@
+"""
+Configuración compartida del scraper.
+
+Aquí va lo que necesitan scrape_waze.py y las herramientas de línea de
+comandos del scraper (offline_geocoder.py), para que estas no tengan que
+importar scrape_waze con sus efectos de inicio (logs, estado global).
+"""
+
+# --- Configuración del Área de Santiago ---
+TARGET_AREA = {
+    "lat_max": -33.3503,  # Norte
+    "lat_min": -33.6106,  # Sur
+    "lon_min": -70.7778,  # Oeste
+    "lon_max": -70.4990   # Este
+}
@@ -0,0 +1,249 @@
+"""
+Resúmenes de 02_analyze_data.pig mantenidos de forma incremental.
+
+batch_driver.py reescribe en individual_events solo las particiones dt=/hr=
+nuevas o cambiadas. Este módulo recalcula los conteos de esas particiones,
+guarda el aporte de cada una en MongoDB (waze_data.summary_partitions) y
+suma a los contadores acumulados (waze_data.summary_counters) solo la
+diferencia con el aporte anterior, con $inc, en lugar de reagrupar toda la
+historia. Luego reescribe los cuatro resúmenes en /user/hadoop/waze_analysis
+con el formato de JsonStorage que leen load_pig_results_to_redis.py y
+load_pig_results_to_elasticsearch.py:
+
+    commune_summary  (commune)                        total_incidents
+    type_summary     (standardized_type)              total_occurrences
+    daily_summary    (event_date, type, commune)      incidents_count
+    hourly_summary   (event_hour, type, commune)      incidents_count
+
+La comuna es el sector extraído de la dirección y el tipo es la traducción
+al español; la fecha y la hora salen de report_time. El costo de una corrida
+es proporcional a las particiones cambiadas más la cantidad de grupos.
+
+Las particiones se marcan 'applying' antes de tocar los contadores y cada
+contador guarda la última corrida aplicada: si el proceso se cae a mitad de
+camino, la próxima ejecución termina de aplicar esa corrida sin contar dos
+veces los grupos ya sumados.
+
+Uso: python aggregate_summaries.py [--rebuild]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+from collections import Counter
+from pathlib import Path
+
+import pymongo
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from event_schema import PROCESSED_FIELDS, read_records
+from batch_layout import HDFS_EVENTS_DIR, list_partitions, fetch_partitions, put_tree, remove, move, read_batch
+from enrichment import UNKNOWN_SECTOR, OTHER_TYPE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+MONGO_HOST = os.environ.get("MONGO_HOST", "storage_db")
+HDFS_RESULTS_BASE_DIR = "/user/hadoop/waze_analysis"
+COUNTERS_COLLECTION = "summary_counters"
+PARTITIONS_COLLECTION = "summary_partitions"
+DUPLICATE_KEY = 11000
+
+# Resumen -> (campos del grupo en el JSON de salida, nombre del conteo)
+SUMMARIES = {
+    "commune_summary": (["group::commune"], "total_incidents"),
+    "type_summary": (["group::standardized_type"], "total_occurrences"),
+    "daily_summary": (["group::event_date", "group::standardized_type", "group::commune"], "incidents_count"),
+    "hourly_summary": (["group::event_hour", "group::standardized_type", "group::commune"], "incidents_count"),
+}
+COLUMNS = ["sector", "tipo_evento", "report_time", "hora_reporte"]
+
+
+def connect_to_mongodb():
+    for i in range(10):
+        try:
+            client = pymongo.MongoClient(MONGO_HOST, 27017, serverSelectionTimeoutMS=5000)
+            client.admin.command('ping')
+            return client
+        except ConnectionFailure as err:
+            logger.warning(f"Fallo de conexión a MongoDB: {err}. Reintentando en 10s...")
+            time.sleep(10)
+    return None
+
+
+def group_keys(event):
+    """Grupos (resumen, valores) a los que suma un evento enriquecido."""
+    commune = event["sector"] or UNKNOWN_SECTOR
+    event_type = event["tipo_evento"] or OTHER_TYPE
+    report_time = event["report_time"] or ""
+    yield "commune_summary", (commune,)
+    yield "type_summary", (event_type,)
+    if len(report_time) >= 10:
+        yield "daily_summary", (report_time[:10], event_type, commune)
+    hour = event["hora_reporte"] or report_time[11:13]
+    if hour:
+        yield "hourly_summary", (hour, event_type, commune)
+
+
+def aggregate(events):
+    """Conteos por grupo de un conjunto de eventos."""
+    counts = Counter()
+    total = 0
+    for event in events:
+        total += 1
+        counts.update(group_keys(event))
+    return total, counts
+
+
+def encode(counts):
+    return [[summary, list(values), count] for (summary, values), count in sorted(counts.items())]
+
+
+def decode(groups):
+    return Counter({(summary, tuple(values)): count for summary, values, count in groups})
+
+
+def counter_id(summary, values):
+    return "\x1f".join((summary,) + values)
+
+
+def apply_deltas(collection, deltas, run_id):
+    """Suma el lote a los contadores; los grupos que ya tienen esta corrida aplicada se saltan."""
+    operations = [
+        pymongo.UpdateOne({"_id": counter_id(summary, values), "last_run": {"$ne": run_id}},
+                          {"$inc": {"count": count}, "$set": {"last_run": run_id},
+                           "$setOnInsert": {"summary": summary, "group": list(values)}},
+                          upsert=True)
+        for (summary, values), count in deltas.items()
+    ]
+    if not operations:
+        return 0
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        return result.upserted_count + result.modified_count
+    except BulkWriteError as e:
+        # Con la corrida ya aplicada el filtro no coincide y el upsert choca con el _id existente
+        errors = e.details.get("writeErrors", [])
+        others = [err for err in errors if err.get("code") != DUPLICATE_KEY]
+        if others:
+            raise
+        logger.info(f"{len(errors)} grupos ya tenían aplicada la corrida {run_id}")
+        return e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+
+
+def apply_partitions(db, counts_by_partition, run_id):
+    """Reemplaza el aporte de cada partición y suma a los contadores la diferencia con el anterior."""
+    partitions = db[PARTITIONS_COLLECTION]
+    previous = {doc["_id"]: doc["groups"] for doc in partitions.find({"_id": {"$in": list(counts_by_partition)}})}
+    for partition, counts in counts_by_partition.items():
+        partitions.replace_one({"_id": partition},
+                               {"groups": encode(counts), "previous": previous.get(partition, []),
+                                "run": run_id, "state": "applying"},
+                               upsert=True)
+    return finish_run(db, run_id)
+
+
+def finish_run(db, run_id):
+    """Aplica a los contadores las particiones de `run_id` que quedaron en estado 'applying'."""
+    partitions = db[PARTITIONS_COLLECTION]
+    pending = list(partitions.find({"run": run_id, "state": "applying"}))
+    delta = Counter()
+    for doc in pending:
+        delta.update(decode(doc["groups"]))
+        delta.subtract(decode(doc["previous"]))
+    updated = apply_deltas(db[COUNTERS_COLLECTION], {key: count for key, count in delta.items() if count}, run_id)
+    partitions.update_many({"_id": {"$in": [doc["_id"] for doc in pending]}},
+                           {"$set": {"state": "done"}, "$unset": {"previous": ""}})
+    # Solo después de cerrar la corrida: un contador en cero todavía lleva la marca que evita sumarlo dos veces
+    db[COUNTERS_COLLECTION].delete_many({"count": {"$lte": 0}})
+    return updated
+
+
+def recover(db):
+    for run_id in db[PARTITIONS_COLLECTION].distinct("run", {"state": "applying"}):
+        logger.warning(f"La corrida {run_id} quedó a medio aplicar; se completa antes de seguir")
+        finish_run(db, run_id)
+
+
+def render_summaries(collection):
+    """Líneas JsonStorage de cada resumen a partir de los contadores acumulados."""
+    lines = {summary: [] for summary in SUMMARIES}
+    for doc in collection.find({"count": {"$gt": 0}}, {"summary": 1, "group": 1, "count": 1}).sort("_id", pymongo.ASCENDING):
+        fields, count_name = SUMMARIES[doc["summary"]]
+        record = dict(zip(fields, doc["group"]))
+        record[count_name] = doc["count"]
+        lines[doc["summary"]].append(json.dumps(record, ensure_ascii=False))
+    return lines
+
+
+def write_local(lines, base_dir):
+    for summary, rows in lines.items():
+        directory = os.path.join(base_dir, f"{summary}.json")
+        tmp_directory = f"{directory}._tmp"
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        Path(tmp_directory, "part-r-00000").write_text("".join(r + "\n" for r in rows), encoding="utf-8")
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_directory, directory)
+
+
+def write_summaries(lines):
+    """Sube los cuatro resúmenes a un staging y los reemplaza con un solo -mv."""
+    staging = f"{HDFS_RESULTS_BASE_DIR}/_staging"
+    with tempfile.TemporaryDirectory() as tmp:
+        write_local(lines, os.path.join(tmp, "summaries"))
+        remove([staging])
+        put_tree(os.path.join(tmp, "summaries"), staging)
+    remove([f"{HDFS_RESULTS_BASE_DIR}/{summary}.json" for summary in SUMMARIES])
+    move([f"{staging}/{summary}.json" for summary in SUMMARIES], HDFS_RESULTS_BASE_DIR)
+    remove([staging])
+
+
+def count_partitions(partitions):
+    """{partición: conteos} leyendo de individual_events solo las particiones pedidas."""
+    counts_by_partition = {}
+    total = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for partition, paths in fetch_partitions(HDFS_EVENTS_DIR, partitions, tmp).items():
+            events, counts = aggregate(record for path in paths for record in read_records(path, PROCESSED_FIELDS, COLUMNS))
+            counts_by_partition[partition] = counts
+            total += events
+    return total, counts_by_partition
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Actualiza los resúmenes con las particiones de la última corrida")
+    parser.add_argument("--rebuild", action="store_true", help="Borra los contadores y recalcula con todas las particiones")
+    args = parser.parse_args()
+
+    mongo_client = connect_to_mongodb()
+    if not mongo_client: sys.exit(1)
+    db = mongo_client.waze_data
+    try:
+        batch = None if args.rebuild else read_batch()
+        if batch is None:
+            logger.info("Se recalculan los resúmenes con todas las particiones de individual_events.")
+            db[COUNTERS_COLLECTION].delete_many({})
+            db[PARTITIONS_COLLECTION].delete_many({})
+            batch = {"batch": datetime.utcnow().strftime("%Y%m%dT%H%M%S%f"), "partitions": list(list_partitions(HDFS_EVENTS_DIR))}
+        recover(db)
+        started = time.perf_counter()
+        total, counts_by_partition = count_partitions(batch["partitions"])
+        updated = apply_partitions(db, counts_by_partition, batch["batch"])
+        logger.info(f"Corrida {batch['batch']}: {len(counts_by_partition)} particiones, {total} eventos, "
+                    f"{updated} contadores actualizados en {time.perf_counter() - started:.2f}s")
+        lines = render_summaries(db[COUNTERS_COLLECTION])
+        write_summaries(lines)
+        logger.info("Resúmenes escritos: " + ", ".join(f"{s} ({len(rows)})" for s, rows in lines.items()))
+    finally:
+        mongo_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Driver incremental de filtrado y enriquecimiento por particiones.
+
+Compara los archivos de cada partición dt=/hr= de waze_input con el
+manifiesto de la última corrida exitosa y procesa solo las particiones
+nuevas o cambiadas (las que ya no tienen entrada se borran de la salida).
+Cada partición se escribe completa en un directorio de staging y recién
+entonces reemplaza a la anterior en individual_events; el manifiesto se
+actualiza al final, así que una corrida interrumpida se repite entera.
+
+La lista de particiones queda en BATCH_FILE para los pasos siguientes;
+run_pipeline.sh lo borra al terminar bien. Si sigue ahí en la próxima
+corrida, sus particiones se suman a las nuevas.
+
+El motor es Pig (un solo script generado con un LOAD/STORE por partición
+sobre homogenize_macro.pig, una sola JVM) o filter_homogenize.py. Con
+BATCH_ENGINE=auto se usa Python bajo BATCH_ENGINE_MAX_BYTES de entrada.
+
+Uso: python batch_driver.py [--engine auto|pig|python] [--full]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+from event_schema import EVENT_FORMAT, pig_params
+from filter_homogenize import homogenize, read_local, write_output, output_name
+from batch_layout import (HDFS_INPUT_DIR, HDFS_EVENTS_DIR, HDFS_STAGING_DIR, list_partitions, fetch_partitions,
+                          put_tree, remove, promote, load_manifest, save_manifest, write_batch, read_batch)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+BATCH_ENGINE = os.getenv("BATCH_ENGINE", "auto")
+BATCH_ENGINE_MAX_BYTES = int(os.getenv("BATCH_ENGINE_MAX_BYTES", str(256 * 1024 * 1024)))
+PIG_MACRO = "/pig_scripts/homogenize_macro.pig"
+
+
+def signature(files):
+    return sorted([name, sig] for name, sig in files.items())
+
+
+def plan(current, manifest, full=False):
+    """Particiones a reescribir (entrada nueva o distinta) y a borrar (sin entrada)."""
+    previous = {} if full else manifest["partitions"]
+    changed = sorted(p for p, files in current.items() if previous.get(p) != signature(files))
+    removed = sorted(p for p in previous if p not in current)
+    return changed, removed
+
+
+def input_bytes(current, partitions):
+    return sum(int(sig.split("@")[0]) for p in partitions for sig in current[p].values())
+
+
+def run_python(partitions, staging, event_format=EVENT_FORMAT):
+    """Procesa las particiones en este proceso: un `-get` de los días afectados y un `-put` del resultado."""
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = fetch_partitions(HDFS_INPUT_DIR, partitions, os.path.join(tmp, "input"))
+        output_root = os.path.join(tmp, "output")
+        total = 0
+        for partition, paths in sorted(inputs.items()):
+            directory = os.path.join(output_root, partition)
+            os.makedirs(directory)
+            with open(os.path.join(directory, output_name(event_format)), "wb") as f:
+                total += write_output(homogenize(read_local(paths)), f, event_format)
+        put_tree(output_root, staging)
+    return total
+
+
+def pig_script(current, partitions, staging, event_format=EVENT_FORMAT):
+    """Script de Pig con un LOAD/STORE por partición, leyendo exactamente los archivos del manifiesto."""
+    params = pig_params(event_format)
+    lines = [f"IMPORT '{PIG_MACRO}';"]
+    for i, partition in enumerate(partitions):
+        names = sorted(current[partition])
+        files = names[0] if len(names) == 1 else "{" + ",".join(names) + "}"
+        lines.append(f"raw_{i} = LOAD '{HDFS_INPUT_DIR}/{partition}/{files}' USING {params['LOADER']} AS ({params['RAW_SCHEMA']});")
+        lines.append(f"events_{i} = homogenize(raw_{i});")
+        lines.append(f"STORE events_{i} INTO '{staging}/{partition}' USING {params['STORER']};")
+    return "\n".join(lines) + "\n"
+
+
+def run_pig(current, partitions, staging, event_format=EVENT_FORMAT):
+    with tempfile.NamedTemporaryFile("w", suffix=".pig", encoding="utf-8", delete=False) as f:
+        f.write(pig_script(current, partitions, staging, event_format))
+        script_path = f.name
+    try:
+        subprocess.run(["pig", "-f", script_path], check=True)
+    finally:
+        os.remove(script_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procesa las particiones nuevas o cambiadas de waze_input")
+    parser.add_argument("--engine", choices=["auto", "pig", "python"], default=BATCH_ENGINE)
+    parser.add_argument("--full", action="store_true", help="Reprocesa todas las particiones")
+    args = parser.parse_args()
+
+    full = args.full or os.environ.get("EXPORT_MODE") == "full"
+    current = list_partitions(HDFS_INPUT_DIR)
+    manifest = {"partitions": {}} if full else load_manifest()
+    changed, removed = plan(current, manifest, full)
+    if full:
+        # Salidas de particiones que ya no tienen entrada (la exportación completa borró waze_input)
+        removed = sorted(set(list_partitions(HDFS_EVENTS_DIR)) - set(current))
+    batch_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    # Si el pipeline falló después de la corrida anterior, sus particiones se vuelven a entregar con esta
+    pending = read_batch()
+    pending_partitions = sorted(set(pending["partitions"]) - set(changed) - set(removed)) if pending else []
+    # Una partición borrada en esa corrida que volvió a tener entrada ya no está borrada
+    pending_removed = sorted(set(pending.get("removed", [])) - set(changed)) if pending else []
+    if not changed and not removed:
+        if pending_partitions:
+            logger.info(f"Sin cambios; se reentregan {len(pending_partitions)} particiones de la corrida {pending['batch']}")
+            write_batch(batch_id, pending_partitions, pending_removed)
+        else:
+            logger.info("No hay particiones nuevas ni cambiadas desde la última corrida.")
+        return
+
+    engine = args.engine
+    size = input_bytes(current, changed)
+    if engine == "auto":
+        engine = "python" if size < BATCH_ENGINE_MAX_BYTES else "pig"
+    logger.info(f"Corrida {batch_id}: {len(changed)} particiones a procesar ({size} bytes, motor {engine}), "
+                f"{len(removed)} a borrar; {len(current) - len(changed)} sin cambios")
+
+    started = time.perf_counter()
+    staging = f"{HDFS_STAGING_DIR}/{batch_id}"
+    remove([HDFS_STAGING_DIR])
+    if changed:
+        if engine == "python":
+            events = run_python(changed, staging)
+            logger.info(f"{events} eventos escritos en {len(changed)} particiones")
+        else:
+            run_pig(current, changed, staging)
+    promote(staging, HDFS_EVENTS_DIR, changed, removed)
+    remove([HDFS_STAGING_DIR])
+
+    for partition in changed:
+        manifest["partitions"][partition] = signature(current[partition])
+    for partition in removed:
+        manifest["partitions"].pop(partition, None)
+    manifest["last_batch"] = batch_id
+    save_manifest(manifest)
+    write_batch(batch_id, changed + pending_partitions, sorted(set(removed) | set(pending_removed)))
+    logger.info(f"Corrida {batch_id} completada en {time.perf_counter() - started:.1f}s: {', '.join(changed + removed)}")
+
+
+if __name__ == "__main__":
+    main()
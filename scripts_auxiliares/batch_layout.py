@@ -0,0 +1,191 @@
+"""
+Layout particionado de la capa batch en HDFS.
+
+Entrada y salida se particionan igual, por hora de scraping:
+
+    /user/hadoop/waze_input/dt=YYYY-MM-DD/hr=HH/part-*                    (export_mongo_to_hdfs.py)
+    /user/hadoop/waze_processed/individual_events/dt=YYYY-MM-DD/hr=HH/part-*   (batch_driver.py)
+
+El manifiesto (/user/hadoop/waze_processed/_manifest.json) guarda, por
+partición de entrada, la firma de sus archivos (nombre, tamaño, fecha) con
+la que se generó su salida. batch_driver.py solo procesa las particiones
+cuya firma cambió y deja la lista en BATCH_FILE para que los
+pasos siguientes lean solo esas (sin BATCH_FILE, leen todo).
+
+Cada operación sobre HDFS es un proceso `hdfs dfs` (una JVM): las funciones
+de aquí agrupan el trabajo para lanzar pocas. Con EXPORT_SINK=local se usa
+EXPORT_LOCAL_ROOT como sustituto de HDFS, igual que el exportador.
+"""
+
+import os
+import re
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+HDFS_INPUT_DIR = "/user/hadoop/waze_input"
+HDFS_EVENTS_DIR = "/user/hadoop/waze_processed/individual_events"
+HDFS_STAGING_DIR = "/user/hadoop/waze_processed/_staging"
+MANIFEST_PATH = "/user/hadoop/waze_processed/_manifest.json"
+EXPORT_SINK = os.getenv("EXPORT_SINK", "hdfs")
+EXPORT_LOCAL_ROOT = os.getenv("EXPORT_LOCAL_ROOT", "/tmp/hdfs_standin")
+# Id y particiones de la última corrida del driver, para los pasos que la siguen
+BATCH_FILE = os.getenv("BATCH_FILE", "/tmp/waze_batch.json")
+
+HADOOP_LOG_LINE = re.compile(r"\s(WARN|INFO|DEBUG)\s")
+PARTITION_FILE = re.compile(r"/(dt=\d{4}-\d{2}-\d{2}/hr=\d{2})/(part-[^/]+)$")
+
+
+def local_path(path):
+    return os.path.join(EXPORT_LOCAL_ROOT, path.lstrip("/"))
+
+
+def run_hdfs(args, capture_stdout=False):
+    """Ejecuta `hdfs dfs`; una ruta inexistente no es error, cualquier otro fallo lanza CalledProcessError.
+    Un NameNode caído no debe parecer un directorio vacío: el driver borraría todas las salidas."""
+    result = subprocess.run(["hdfs", "dfs"] + args, stdout=subprocess.PIPE if capture_stdout else None,
+                            stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        # Las líneas de log de Hadoop (p. ej. WARN util.NativeCodeLoader) no son el error
+        errors = [line for line in result.stderr.splitlines() if line.strip() and not HADOOP_LOG_LINE.search(line)]
+        if not errors or not all("No such file or directory" in line for line in errors):
+            raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return result.stdout
+
+
+def list_partitions(base_dir):
+    """{partición: {archivo: firma}} de los archivos part-* bajo `base_dir` (un solo `-ls -R`)."""
+    partitions = {}
+    if EXPORT_SINK == "local":
+        root = Path(local_path(base_dir))
+        entries = [(str(p), f"{p.stat().st_size}@{int(p.stat().st_mtime)}") for p in root.rglob("part-*") if p.is_file()] if root.exists() else []
+    else:
+        listing = run_hdfs(["-ls", "-R", base_dir], capture_stdout=True) or ""
+        entries = []
+        for line in listing.splitlines():
+            columns = line.split(None, 7)
+            # permisos, réplicas, dueño, grupo, tamaño, fecha, hora, ruta
+            if len(columns) == 8 and not columns[0].startswith("d"):
+                entries.append((columns[7], f"{columns[4]}@{columns[5]}T{columns[6]}"))
+    for path, signature in entries:
+        match = PARTITION_FILE.search(path)
+        if match and not path.endswith("._COPYING_"):
+            partitions.setdefault(match.group(1), {})[match.group(2)] = signature
+    return partitions
+
+
+def fetch_partitions(base_dir, partitions, destination):
+    """Copia a `destination` los días que contienen `partitions` con un solo `-get`.
+    Devuelve {partición: [archivos locales]} solo para las particiones pedidas."""
+    days = sorted({partition.split("/")[0] for partition in partitions})
+    if days:
+        if EXPORT_SINK == "local":
+            for day in days:
+                source = local_path(f"{base_dir}/{day}")
+                if os.path.isdir(source):
+                    shutil.copytree(source, os.path.join(destination, day))
+        else:
+            # Los días que ya no existen (particiones borradas) quedan sin archivos
+            run_hdfs(["-get"] + [f"{base_dir}/{day}" for day in days] + [destination])
+    files = {}
+    for partition in partitions:
+        directory = Path(destination, partition)
+        files[partition] = sorted(str(p) for p in directory.glob("part-*") if not p.name.endswith("._COPYING_")) if directory.is_dir() else []
+    return files
+
+
+def put_tree(local_dir, target):
+    """Sube un árbol local completo a `target` (que no debe existir)."""
+    if EXPORT_SINK == "local":
+        shutil.copytree(local_dir, local_path(target))
+    else:
+        subprocess.run(["hdfs", "dfs", "-mkdir", "-p", os.path.dirname(target)], check=True)
+        subprocess.run(["hdfs", "dfs", "-put", local_dir, target], check=True)
+
+
+def remove(paths):
+    if not paths:
+        return
+    if EXPORT_SINK == "local":
+        for path in paths:
+            shutil.rmtree(local_path(path), ignore_errors=True)
+    else:
+        subprocess.run(["hdfs", "dfs", "-rm", "-r", "-f"] + list(paths), check=True)
+
+
+def move(paths, target_dir):
+    """Mueve `paths` dentro de `target_dir` (existente) con un solo `-mv`; cada rename es atómico."""
+    if EXPORT_SINK == "local":
+        for path in paths:
+            os.replace(local_path(path), os.path.join(local_path(target_dir), os.path.basename(path)))
+    else:
+        subprocess.run(["hdfs", "dfs", "-mv"] + list(paths) + [target_dir], check=True)
+
+
+def promote(staging_dir, base_dir, partitions, removed=()):
+    """Reemplaza cada partición de `base_dir` por la de `staging_dir` con un rename por día; las de
+    `removed` (sin entrada) solo se borran. Una partición nunca queda a medio escribir."""
+    by_day = {}
+    for partition in list(partitions) + list(removed):
+        by_day.setdefault(partition.split("/")[0], []).append(partition)
+    if EXPORT_SINK == "local":
+        for day in by_day:
+            os.makedirs(local_path(f"{base_dir}/{day}"), exist_ok=True)
+    else:
+        subprocess.run(["hdfs", "dfs", "-mkdir", "-p"] + [f"{base_dir}/{day}" for day in by_day], check=True)
+    for day, day_partitions in sorted(by_day.items()):
+        remove([f"{base_dir}/{p}" for p in day_partitions])
+        staged = [p for p in day_partitions if p not in removed]
+        if not staged:
+            continue
+        move([f"{staging_dir}/{p}" for p in staged], f"{base_dir}/{day}")
+
+
+def load_manifest():
+    if EXPORT_SINK == "local":
+        path = local_path(MANIFEST_PATH)
+        if not os.path.exists(path):
+            return {"partitions": {}}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    result = subprocess.run(["hdfs", "dfs", "-cat", MANIFEST_PATH], capture_output=True, text=True)
+    return json.loads(result.stdout) if result.returncode == 0 and result.stdout.strip() else {"partitions": {}}
+
+
+def save_manifest(manifest):
+    data = json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8")
+    if EXPORT_SINK == "local":
+        path = local_path(MANIFEST_PATH)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+        return
+    # -put -f escribe a un ._COPYING_ y renombra: el manifiesto anterior sigue válido hasta el final
+    subprocess.run(["hdfs", "dfs", "-put", "-f", "-", MANIFEST_PATH], input=data, check=True)
+
+
+def write_batch(batch_id, partitions, removed=()):
+    """Registra la corrida del driver: su id, las particiones que reescribió o borró y, aparte, las borradas
+    (los pasos que indexan por evento deben borrar sus documentos; los demás las ven como particiones vacías)."""
+    tmp_path = f"{BATCH_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"batch": batch_id, "partitions": sorted(set(partitions) | set(removed)), "removed": sorted(removed)}, f)
+    os.replace(tmp_path, BATCH_FILE)
+
+
+def read_batch():
+    """{"batch", "partitions", "removed"} de la última corrida del driver; None si no corrió."""
+    if not os.path.exists(BATCH_FILE):
+        return None
+    with open(BATCH_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def fetch_batch(destination):
+    """{partición: [archivos locales]} de individual_events para las particiones de la última corrida
+    del driver (todas, si no hay registro)."""
+    batch = read_batch()
+    partitions = batch["partitions"] if batch else list(list_partitions(HDFS_EVENTS_DIR))
+    return fetch_partitions(HDFS_EVENTS_DIR, partitions, destination)
@@ -6,11 +6,12 @@ Carga eventos individuales en Redis organizados por criterios de consulta frecue
 import json
 import redis
 import logging
-from pathlib import Path
-import subprocess
 import os
 from datetime import datetime
 import time
+from event_schema import PROCESSED_FIELDS, read_records
+from batch_layout import HDFS_EVENTS_DIR, fetch_partitions, list_partitions
+from enrichment import with_defaults, UNKNOWN_SECTOR, OTHER_TYPE
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,7 +19,6 @@ logger = logging.getLogger(__name__)
 
 # Configuración
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
-HDFS_PATH = '/user/hadoop/waze_processed/individual_events'
 LOCAL_TEMP_PATH = '/tmp/individual_events_data'
 
 def connect_to_redis():
@@ -36,68 +36,35 @@ def connect_to_redis():
     return None
 
 def download_hdfs_data():
-    """Descarga datos de HDFS al sistema local."""
-    try:
-        # Limpiar directorio temporal si existe
-        import shutil
-        if os.path.exists(LOCAL_TEMP_PATH):
-            shutil.rmtree(LOCAL_TEMP_PATH)
-        
-        # Crear directorio temporal
-        os.makedirs(os.path.dirname(LOCAL_TEMP_PATH), exist_ok=True)
-        
-        # Descargar de HDFS
-        subprocess.run([
-            'hdfs', 'dfs', '-get', HDFS_PATH, LOCAL_TEMP_PATH
-        ], check=True)
-        
-        logger.info(f"Datos descargados de HDFS a {LOCAL_TEMP_PATH}")
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error descargando de HDFS: {e}")
-        return False
+    """Descarga de HDFS todas las particiones de individual_events.
 
-def parse_event_line(line):
-    """Convierte una línea TSV en un diccionario de evento."""
-    fields = line.strip().split('\t')
-    if len(fields) < 11:
-        return None
-    
-    try:
-        return {
-            'event_id': fields[0],
-            'type_original': fields[1],
-            'address': fields[2],
-            'report_time': fields[3],
-            'latitude': float(fields[4]) if fields[4] and fields[4] != 'null' else None,
-            'longitude': float(fields[5]) if fields[5] and fields[5] != 'null' else None,
-            'confidence': int(fields[6]) if fields[6] and fields[6] != 'null' else 0,
-            'reporter': fields[7],
-            'sector': fields[8] if fields[8] and fields[8] != 'null' else 'Desconocido',
-            'calle': fields[9] if fields[9] and fields[9] != 'null' else '',
-            'tipo_evento': fields[10],
-            'hora_reporte': fields[11] if len(fields) > 11 and fields[11] != 'null' else None
-        }
-    except (ValueError, IndexError) as e:
-        logger.warning(f"Error parseando línea: {e}")
-        return None
+    Las claves events:* son una foto completa y se sobrescriben en cada corrida, así que no alcanza con
+    las particiones del último lote de batch_driver.py."""
+    # Limpiar directorio temporal si existe
+    import shutil
+    if os.path.exists(LOCAL_TEMP_PATH):
+        shutil.rmtree(LOCAL_TEMP_PATH)
+    
+    # Crear directorio temporal
+    os.makedirs(LOCAL_TEMP_PATH)
+    
+    # Descargar de HDFS todos los días con un solo -get
+    partitions = fetch_partitions(HDFS_EVENTS_DIR, list(list_partitions(HDFS_EVENTS_DIR)), LOCAL_TEMP_PATH)
+    logger.info(f"{len(partitions)} particiones descargadas de HDFS a {LOCAL_TEMP_PATH}")
+    return partitions
 
 def load_events_from_hdfs():
     """Carga eventos desde los archivos de HDFS."""
-    if not download_hdfs_data():
-        return []
+    partitions = download_hdfs_data()
     
     events = []
     
-    # Leer todos los archivos part-*
-    hdfs_dir = Path(LOCAL_TEMP_PATH)
-    for part_file in hdfs_dir.glob('part-*'):
+    # Leer los archivos part-* de cada partición, de la más nueva a la más antigua (events:recent toma las primeras)
+    part_files = [path for _, paths in sorted(partitions.items(), reverse=True) for path in paths]
+    for part_file in part_files:
         try:
-            with open(part_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    event = parse_event_line(line)
-                    if event:
-                        events.append(event)
+            for record in read_records(part_file, PROCESSED_FIELDS):
+                events.append(with_defaults(record))
         except Exception as e:
             logger.error(f"Error leyendo archivo {part_file}: {e}")
     
@@ -119,8 +86,8 @@ def cache_events_by_criteria(redis_client, events):
     logger.info("Cacheando eventos por sector...")
     events_by_sector = {}
     for event in events:
-        sector = event.get('sector', 'Desconocido')
-        if sector and sector != 'Desconocido':
+        sector = event.get('sector', UNKNOWN_SECTOR)
+        if sector and sector != UNKNOWN_SECTOR:
             if sector not in events_by_sector:
                 events_by_sector[sector] = []
             events_by_sector[sector].append(event)
@@ -138,7 +105,7 @@ def cache_events_by_criteria(redis_client, events):
     logger.info("Cacheando eventos por tipo...")
     events_by_type = {}
     for event in events:
-        tipo = event.get('tipo_evento', 'Otro')
+        tipo = event.get('tipo_evento', OTHER_TYPE)
         if tipo not in events_by_type:
             events_by_type[tipo] = []
         events_by_type[tipo].append(event)
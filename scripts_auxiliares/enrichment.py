@@ -0,0 +1,334 @@
+"""
+Reglas de enriquecimiento de eventos compartidas por las etapas en Python.
+
+Las tablas de palabras clave viven solo aquí:
+
+    PIG_TYPE_RULES     tipo_evento de individual_events (el CASE de homogenize_macro.pig)
+    ES_TYPE_RULES      standardized_type del índice waze-events
+    ES_COMMUNE_RULES   commune del índice waze-events (dirección o ciudad)
+
+Cada tabla se compila una vez en una sola expresión regular: la alternación
+de todas sus palabras clave en orden de prioridad, que `findall` recorre en
+una sola pasada; gana la regla de menor índice entre las claves encontradas,
+igual que la cadena de `if ... in ...` o de WHEN ... MATCHES de antes. Si
+alguna clave contiene a otra o termina con el comienzo de otra (p. ej.
+"las condes" y "santiago"), las coincidencias podrían solaparse y la
+alternación va dentro de una búsqueda anticipada, que prueba cada posición.
+Con textos tan cortos la pasada única no le gana en CPython a las búsquedas
+directas; lo que acelera es la memoización (ENRICHMENT_CACHE_SIZE entradas
+por tabla), porque los tipos y las direcciones se repiten mucho entre
+eventos. `--benchmark` mide las tres variantes.
+
+homogenize_macro.pig mantiene su propio CASE (Pig no ejecuta este módulo);
+`--check` verifica que coincida con PIG_TYPE_RULES y que las etiquetas de
+GOLDEN no cambien.
+
+Uso: python enrichment.py --check | --benchmark [--events 200000]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import logging
+import argparse
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+ENRICHMENT_CACHE_SIZE = int(os.getenv("ENRICHMENT_CACHE_SIZE", "65536"))
+PIG_MACRO = os.getenv("PIG_MACRO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pig_scripts", "homogenize_macro.pig"))
+
+UNKNOWN_SECTOR = "Desconocido"
+OTHER_TYPE = "Otro"
+
+# (etiqueta, palabras clave) en orden de prioridad: gana la primera regla con alguna coincidencia
+PIG_TYPE_RULES = [
+    ("Peligro en Via", ["hazard"]),
+    ("Atasco de Trafico", ["jam"]),
+    ("Accidente", ["accident"]),
+    ("Calle Cerrada", ["roadclosed"]),
+]
+ES_TYPE_RULES = [
+    ("Accidente", ["accident", "crash"]),
+    ("Atasco", ["jam", "traffic"]),
+    ("Corte de Ruta", ["closed", "closure"]),
+    ("Peligro en Via", ["hazard", "police"]),
+]
+ES_COMMUNE_RULES = [
+    ("Las Condes", ["las condes"]),
+    ("Santiago", ["santiago"]),
+    ("Providencia", ["providencia"]),
+]
+
+# Caracteres que quita String.trim() de Java (TRIM de Pig)
+JAVA_WHITESPACE = "".join(chr(c) for c in range(33))
+# Fines de línea de java.util.regex: '.' no los cruza, así que '.*x.*' no calza con un texto que los tenga
+JAVA_LINE_TERMINATORS = re.compile("[\n\r\u0085\u2028\u2029]")
+HOUR = re.compile(r"(\d{2}):", re.ASCII)
+
+
+def overlap_free(keywords):
+    """True si ninguna clave contiene a otra ni termina con el comienzo de otra: sus apariciones no se
+    pueden solapar y `findall` sobre la alternación las encuentra todas."""
+    for a in keywords:
+        for b in keywords:
+            if a != b and (b in a or any(b.startswith(a[i:]) for i in range(1, len(a)))):
+                return False
+    return True
+
+
+class KeywordClassifier:
+    """Etiqueta de la primera regla (en orden) cuya palabra clave aparece en el texto, en minúsculas."""
+
+    def __init__(self, rules, default, whole_line=False, cache_size=ENRICHMENT_CACHE_SIZE):
+        self.rules = rules
+        self.default = default
+        # Con whole_line se imita LOWER(x) MATCHES '.*clave.*' de Pig
+        self.whole_line = whole_line
+        self.labels = [label for label, _ in rules]
+        # Palabra clave -> índice de su regla; el dict conserva el orden de prioridad
+        self.priority = {}
+        for i, (_, keywords) in enumerate(rules):
+            for keyword in keywords:
+                self.priority.setdefault(keyword, i)
+        alternation = "|".join(re.escape(keyword) for keyword in self.priority)
+        self.pattern = re.compile(alternation if overlap_free(self.priority) else f"(?=({alternation}))")
+        self.label = lru_cache(maxsize=cache_size)(self._label)
+
+    def _label(self, text):
+        if not text:
+            return self.default
+        text = text.lower()
+        if self.whole_line and JAVA_LINE_TERMINATORS.search(text):
+            return self.default
+        found = self.pattern.findall(text)
+        if not found:
+            return self.default
+        return self.labels[min(map(self.priority.__getitem__, found))]
+
+    def label_many(self, texts):
+        """Etiquetas de una secuencia de textos (cada valor distinto se clasifica una vez)."""
+        label = self.label
+        return [label(text) for text in texts]
+
+    def naive_label(self, text):
+        """Implementación directa (una búsqueda por palabra clave), como referencia para --check y --benchmark."""
+        if not text:
+            return self.default
+        text = text.lower()
+        if self.whole_line and JAVA_LINE_TERMINATORS.search(text):
+            return self.default
+        for label, keywords in self.rules:
+            if any(keyword in text for keyword in keywords):
+                return label
+        return self.default
+
+
+PIG_TYPES = KeywordClassifier(PIG_TYPE_RULES, OTHER_TYPE, whole_line=True)
+ES_TYPES = KeywordClassifier(ES_TYPE_RULES, OTHER_TYPE)
+ES_COMMUNES = KeywordClassifier(ES_COMMUNE_RULES, "Otra Comuna")
+
+
+# --- API escalar ---
+
+def java_trim(text):
+    return None if text is None else text.strip(JAVA_WHITESPACE)
+
+
+def pig_type(event_type):
+    """tipo_evento de individual_events."""
+    return PIG_TYPES.label(event_type)
+
+
+def es_type(event_type):
+    """standardized_type de waze-events."""
+    return ES_TYPES.label(event_type)
+
+
+def commune(address, city):
+    """commune de waze-events: la primera regla que aparezca en la dirección o en la ciudad."""
+    # \x00 no está en ninguna palabra clave: ninguna coincidencia cruza de la dirección a la ciudad
+    return ES_COMMUNES.label(f"{address or ''}\x00{city or ''}")
+
+
+@lru_cache(maxsize=ENRICHMENT_CACHE_SIZE)
+def split_address(address):
+    """(sector, calle) como TRIM(REGEX_EXTRACT(address, '([^,]+)$')) y '^([^,]+)': null si la dirección
+    termina o empieza con coma."""
+    if address is None:
+        return None, None
+    sector = java_trim(address.rsplit(",", 1)[-1]) if not address.endswith(",") else None
+    calle = java_trim(address.split(",", 1)[0]) if not address.startswith(",") else None
+    return sector, calle
+
+
+def report_hour(report_time):
+    """hora_reporte: REGEX_EXTRACT(report_time, '(\\d{2}):', 1)."""
+    match = HOUR.search(report_time) if report_time is not None else None
+    return match.group(1) if match else None
+
+
+def with_defaults(event):
+    """Valores por defecto de los loaders para los campos que Pig deja en null."""
+    event["confidence"] = event["confidence"] or 0
+    event["sector"] = event["sector"] or UNKNOWN_SECTOR
+    event["calle"] = event["calle"] or ""
+    return event
+
+
+# --- API por lotes ---
+
+def enrich_types(event_types, table=PIG_TYPES):
+    return table.label_many(event_types)
+
+
+def enrich_communes(addresses, cities):
+    return [commune(address, city) for address, city in zip(addresses, cities)]
+
+
+# --- Etiquetas fijadas ---
+
+# (tabla, entrada, etiqueta) con las etiquetas que daban el CASE de Pig y export_mongo_to_elasticsearch.py
+GOLDEN = [
+    ("pig_type", "HAZARD", "Peligro en Via"),
+    ("pig_type", "HAZARD_ON_ROAD_POT_HOLE", "Peligro en Via"),
+    ("pig_type", "WEATHERHAZARD", "Peligro en Via"),
+    ("pig_type", "JAM", "Atasco de Trafico"),
+    ("pig_type", "JAM_HEAVY_TRAFFIC", "Atasco de Trafico"),
+    ("pig_type", "ACCIDENT", "Accidente"),
+    ("pig_type", "ACCIDENT_MAJOR", "Accidente"),
+    ("pig_type", "roadclosed", "Calle Cerrada"),
+    ("pig_type", "ROAD_CLOSED", "Otro"),
+    ("pig_type", "POLICE", "Otro"),
+    ("pig_type", "CONSTRUCTION", "Otro"),
+    ("pig_type", "Traffic jam after crash", "Atasco de Trafico"),
+    ("pig_type", "hazard: road closed", "Peligro en Via"),
+    ("pig_type", "accidentjam", "Atasco de Trafico"),
+    ("pig_type", "JAM\nHAZARD", "Otro"),
+    ("pig_type", "", "Otro"),
+    ("es_type", "HAZARD", "Peligro en Via"),
+    ("es_type", "WEATHERHAZARD", "Peligro en Via"),
+    ("es_type", "JAM", "Atasco"),
+    ("es_type", "JAM_HEAVY_TRAFFIC", "Atasco"),
+    ("es_type", "ACCIDENT_MAJOR", "Accidente"),
+    ("es_type", "ROAD_CLOSED", "Corte de Ruta"),
+    ("es_type", "ROAD_CLOSED_EVENT", "Corte de Ruta"),
+    ("es_type", "roadclosed", "Corte de Ruta"),
+    ("es_type", "POLICE_HIDING", "Peligro en Via"),
+    ("es_type", "CONSTRUCTION", "Otro"),
+    ("es_type", "Traffic jam after crash", "Accidente"),
+    ("es_type", "hazard: road closed", "Corte de Ruta"),
+    ("es_type", "accidentjam", "Accidente"),
+    ("es_type", "trafficrash", "Accidente"),
+    ("es_type", "JAM\nHAZARD", "Atasco"),
+    ("es_type", "", "Otro"),
+    ("commune", ("Av. Apoquindo 3000, Las Condes", "Santiago"), "Las Condes"),
+    ("commune", ("Alameda 100, Santiago", ""), "Santiago"),
+    ("commune", ("Providencia 1234, Providencia", "Santiago"), "Santiago"),
+    ("commune", ("Av. Providencia, Santiago", "Providencia"), "Santiago"),
+    ("commune", ("Santiago Bueras, Maipú", "Maipú"), "Santiago"),
+    ("commune", ("", "Las Condes"), "Las Condes"),
+    ("commune", ("Calle X, Ñuñoa", "Ñuñoa"), "Otra Comuna"),
+    ("commune", ("", ""), "Otra Comuna"),
+    ("split_address", "Av. X 100, Las Condes", ("Las Condes", "Av. X 100")),
+    ("split_address", "  a , b ,  c ", ("c", "a")),
+    ("split_address", "Sin coma", ("Sin coma", "Sin coma")),
+    ("split_address", "termina,", (None, "termina")),
+    ("split_address", ",empieza", ("empieza", None)),
+    ("report_hour", "2024-05-01 13:45:10", "13"),
+    ("report_hour", "sin hora", None),
+]
+SCALAR = {"pig_type": pig_type, "es_type": es_type, "split_address": split_address, "report_hour": report_hour,
+          "commune": lambda args: commune(*args)}
+
+
+def macro_rules(path=PIG_MACRO):
+    """(palabra clave, etiqueta) del CASE de homogenize_macro.pig."""
+    with open(path, "r", encoding="utf-8") as f:
+        return re.findall(r"WHEN LOWER\(type\) MATCHES '\.\*(\w+)\.\*' THEN '([^']+)'", f.read())
+
+
+def check():
+    failures = 0
+    for table, value, expected in GOLDEN:
+        got = SCALAR[table](value)
+        if got != expected:
+            failures += 1
+            logger.error(f"{table}({value!r}) = {got!r}, se esperaba {expected!r}")
+    # La regex combinada debe dar lo mismo que la búsqueda directa también fuera de GOLDEN
+    rng = random.Random(7)
+    keywords = [k for c in (PIG_TYPES, ES_TYPES, ES_COMMUNES) for _, ks in c.rules for k in ks]
+    for _ in range(20000):
+        # Sin separador también, para que las claves se solapen ("trafficrash", "las condesantiago")
+        text = rng.choice(["_", ""]).join(rng.choice(keywords + ["x", "ROAD", "Av. 10", "\n"]) for _ in range(rng.randint(0, 4)))
+        for classifier in (PIG_TYPES, ES_TYPES, ES_COMMUNES):
+            if classifier.label(text) != classifier.naive_label(text):
+                failures += 1
+                logger.error(f"Regex combinada distinta de la referencia para {text!r}")
+    if os.path.exists(PIG_MACRO):
+        expected = [(keywords[0], label) for label, keywords in PIG_TYPE_RULES]
+        if macro_rules() != expected:
+            failures += 1
+            logger.error(f"El CASE de {PIG_MACRO} no coincide con PIG_TYPE_RULES: {macro_rules()}")
+    else:
+        logger.info(f"{PIG_MACRO} no está disponible; no se compara con PIG_TYPE_RULES")
+    if failures:
+        logger.error(f"{failures} diferencias")
+        return False
+    logger.info(f"{len(GOLDEN)} etiquetas fijadas y 20000 textos aleatorios sin diferencias")
+    return True
+
+
+def benchmark(events, distinct):
+    """Eventos sintéticos con `distinct` direcciones distintas: referencia, regex sin caché y con caché."""
+    rng = random.Random(11)
+    types = ["HAZARD_ON_ROAD_POT_HOLE", "JAM_HEAVY_TRAFFIC", "ACCIDENT_MINOR", "ROAD_CLOSED_EVENT", "POLICE_HIDING", "CONSTRUCTION"]
+    places = ["Las Condes", "Santiago", "Providencia", "Ñuñoa", "Maipú", "La Florida", "Vitacura", "Recoleta"]
+    addresses = [f"Calle {i}, {rng.choice(places)}" for i in range(distinct)]
+    rows = [(rng.choice(types), rng.choice(addresses), rng.choice(places)) for _ in range(events)]
+
+    def naive(row):
+        return (PIG_TYPES.naive_label(row[0]), ES_TYPES.naive_label(row[0]),
+                ES_COMMUNES.naive_label(f"{row[1]}\x00{row[2]}"))
+
+    def compiled(row):
+        return PIG_TYPES._label(row[0]), ES_TYPES._label(row[0]), ES_COMMUNES._label(f"{row[1]}\x00{row[2]}")
+
+    def cached(row):
+        return pig_type(row[0]), es_type(row[0]), commune(row[1], row[2])
+
+    results = {}
+    for name, function in (("referencia", naive), ("regex", compiled), ("regex+caché", cached)):
+        started = time.perf_counter()
+        results[name] = [function(row) for row in rows]
+        elapsed = time.perf_counter() - started
+        logger.info(f"{name}: {events} eventos en {elapsed:.3f}s ({events / elapsed:.0f} eventos/s)")
+    if len({tuple(r) for r in results.values()}) != 1:
+        logger.error("Las implementaciones no dan las mismas etiquetas")
+        return False
+    logger.info(f"Caché: {ES_COMMUNES.label.cache_info()}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reglas de enriquecimiento de eventos")
+    parser.add_argument("--check", action="store_true", help="Verifica las etiquetas fijadas y el CASE de Pig")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--distinct", type=int, default=5000, help="Direcciones distintas en el benchmark")
+    args = parser.parse_args()
+    ok = True
+    if args.check:
+        ok = check() and ok
+    if args.benchmark:
+        ok = benchmark(args.events, args.distinct) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    # Solo como script: importado, el logging lo configura la etapa que lo usa
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    main()
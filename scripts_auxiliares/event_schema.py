@@ -0,0 +1,175 @@
+"""
+Esquema único de los eventos en la capa batch.
+
+Define las columnas y tipos de las dos etapas que pasan por HDFS:
+
+    RAW_FIELDS        lo que export_mongo_to_hdfs.py escribe en waze_input
+    PROCESSED_FIELDS  lo que 01_filter_homogenize.pig deja en individual_events
+
+El exportador, el LOAD/STORE de Pig (por -param_file) y los loaders de
+Elasticsearch y Redis salen de aquí, así que agregar o reordenar una columna
+es un cambio en un solo lugar.
+
+Con EVENT_FORMAT=avro las dos etapas se escriben en Avro con compresión por
+bloques (fastavro en Python, AvroStorage en Pig): los tipos viajan en el
+archivo y nadie vuelve a convertir texto. Por defecto se usa TSV.
+
+Uso: python event_schema.py --pig-params
+"""
+
+import os
+import io
+import sys
+import gzip
+import bz2
+import argparse
+
+try:
+    import fastavro
+except ImportError:  # solo hace falta con EVENT_FORMAT=avro
+    fastavro = None
+
+# tsv o avro; el exportador, Pig y los loaders deben usar el mismo valor
+EVENT_FORMAT = os.getenv("EVENT_FORMAT", "tsv")
+
+# (nombre, tipo): string, int o double
+RAW_FIELDS = [
+    ("event_id", "string"),
+    ("type", "string"),
+    ("address", "string"),
+    ("latitude", "double"),
+    ("longitude", "double"),
+    ("report_time", "string"),
+    ("reporter", "string"),
+    ("confidence", "int"),
+    ("city", "string"),
+    ("scrape_timestamp", "string"),
+]
+
+PROCESSED_FIELDS = [
+    ("event_id", "string"),
+    ("type_original", "string"),
+    ("address", "string"),
+    ("report_time", "string"),
+    ("latitude", "double"),
+    ("longitude", "double"),
+    ("confidence", "int"),
+    ("reporter", "string"),
+    ("sector", "string"),
+    ("calle", "string"),
+    ("tipo_evento", "string"),
+    ("hora_reporte", "string"),
+]
+
+PIG_TYPES = {"string": "chararray", "int": "int", "double": "double"}
+# Compresión del exportador -> codec de bloques Avro
+AVRO_CODECS = {"none": "null", "gzip": "deflate", "bz2": "bzip2"}
+
+
+def field_names(fields):
+    return [name for name, _ in fields]
+
+
+def pig_schema(fields):
+    """Esquema para el AS (...) de un LOAD de Pig (sin espacios, para pasarlo por -param_file)."""
+    return ",".join(f"{name}:{PIG_TYPES[kind]}" for name, kind in fields)
+
+
+def avro_schema(name, fields):
+    """Esquema Avro con todos los campos anulables (Pig escribe null donde falta el dato)."""
+    return {
+        "type": "record",
+        "name": name,
+        "fields": [{"name": n, "type": ["null", kind], "default": None} for n, kind in fields],
+    }
+
+
+def coerce(value, kind):
+    """Valor convertido al tipo del esquema; None si falta o no se puede convertir."""
+    if value is None or value == "" or value == "null":
+        return None
+    try:
+        if kind == "string":
+            return str(value)
+        if kind == "int":
+            return int(float(value))
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_record(doc, fields):
+    """Registro tipado con exactamente los campos del esquema."""
+    return {name: coerce(doc.get(name), kind) for name, kind in fields}
+
+
+def to_tsv_row(record, fields):
+    return "\t".join("" if record.get(name) is None else str(record[name]).replace("\t", " ").replace("\n", " ")
+                     for name, _ in fields) + "\n"
+
+
+def parse_tsv_row(line, fields, columns=None):
+    """Registro tipado de una línea TSV; `columns` limita los campos devueltos. None si faltan columnas."""
+    values = line.rstrip("\n").split("\t")
+    if len(values) < len(fields):
+        return None
+    return {name: coerce(value, kind) for (name, kind), value in zip(fields, values)
+            if columns is None or name in columns}
+
+
+def require_fastavro():
+    if fastavro is None:
+        raise RuntimeError("EVENT_FORMAT=avro requiere el paquete fastavro")
+
+
+def avro_writer(stream, name, fields, compression="gzip"):
+    """Escritor Avro por bloques sobre un stream que solo necesita write()."""
+    require_fastavro()
+    return fastavro.write.Writer(stream, fastavro.parse_schema(avro_schema(name, fields)),
+                                 codec=AVRO_CODECS[compression])
+
+
+def read_records(path, fields, columns=None):
+    """Registros tipados de un archivo Avro o TSV (también .gz/.bz2), solo con las columnas pedidas."""
+    with open(path, "rb") as f:
+        yield from read_stream(f, path, fields, columns)
+
+
+def read_stream(stream, name, fields, columns=None):
+    """Como read_records, sobre un stream binario (p. ej. la salida de `hdfs dfs -cat`); `name` da el formato."""
+    if name.endswith(".avro"):
+        require_fastavro()
+        for record in fastavro.reader(stream):
+            yield record if columns is None else {column: record.get(column) for column in columns}
+        return
+    if name.endswith(".gz"):
+        stream = gzip.GzipFile(fileobj=stream)
+    elif name.endswith(".bz2"):
+        stream = bz2.BZ2File(stream)
+    for line in io.TextIOWrapper(stream, encoding="utf-8"):
+        record = parse_tsv_row(line, fields, columns)
+        if record is not None:
+            yield record
+
+
+def pig_params(event_format=EVENT_FORMAT):
+    """Parámetros de 01_filter_homogenize.pig según el formato."""
+    if event_format == "avro":
+        loader, storer = "AvroStorage()", "AvroStorage('individual_events')"
+    else:
+        # PigStorage() separa por tabulador
+        loader = storer = "PigStorage()"
+    return {"RAW_SCHEMA": pig_schema(RAW_FIELDS), "LOADER": loader, "STORER": storer}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esquema de eventos de la capa batch")
+    parser.add_argument("--pig-params", action="store_true", help="Imprime un archivo para pig -param_file")
+    args = parser.parse_args()
+    if args.pig_params:
+        for key, value in pig_params().items():
+            sys.stdout.write(f"{key}={value}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,51 @@
 """
 Script para exportar datos de MongoDB a Elasticsearch para visualización en Kibana.
 Parte del pipeline de análisis de tráfico.
+
+Corre como servicio y mantiene el índice al día con los cambios de
+waze_data.events. Primero copia la colección completa por páginas de _id;
+luego sigue los cambios:
+
+    changestream  change streams de Mongo (requiere replica set): inserciones,
+                  actualizaciones y borrados (p. ej. por el TTL de eventos)
+    poll          cada ES_SYNC_POLL_SECONDS, los documentos con ingested_at
+                  posterior a la marca de agua (no ve borrados); el importer
+                  pone ingested_at con la hora del servidor en cada escritura
+
+Con ES_SYNC_MODE=auto se usan change streams si Mongo los soporta. Los
+cambios se agrupan en lotes de hasta ES_SYNC_BATCH_SIZE que van en una sola
+petición _bulk, con event_id como _id. El avance (resume token o marca de
+agua) se guarda en waze_data.export_state después de cada lote, así que un
+reinicio retoma donde quedó: reindexa a lo más el último lote (change
+streams) o la ventana de ES_SYNC_LOOKBACK_SECONDS (sondeo).
+
+Los documentos que Elasticsearch rechaza no frenan el avance: quedan en
+waze_data.es_sync_failed con el error y se reintentan en cada vuelta, hasta
+ES_SYNC_MAX_RETRIES veces; después quedan ahí para revisarlos a mano.
+
+Tamaño, latencia y retraso de cada lote, y los documentos indexados,
+rechazados y borrados, se exponen en /metrics (METRICS_PORT) con metrics.py
+del importer: el contenedor usa su imagen y lo encuentra con PYTHONPATH=/app.
+
+Con ES_SYNC_SINK=local los lotes se escriben como NDJSON de _bulk en
+ES_SYNC_LOCAL_PATH en lugar de enviarse a Elasticsearch.
+
+Uso: python export_mongo_to_elasticsearch.py [--once] [--reset]
 """
 
 import os
 import sys
 import time
-import logging
 import json
-from datetime import datetime
+import logging
+import argparse
+from datetime import datetime, timedelta
 import pymongo
-from pymongo.errors import ConnectionFailure
-from elasticsearch import Elasticsearch
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError
+from elasticsearch import Elasticsearch, helpers
 from elasticsearch.exceptions import ConnectionError as ESConnectionError, RequestError
+from enrichment import commune, es_type
+from metrics import Counter, Gauge, Histogram, LAG_BUCKETS, start_http_server
 
 # Configuración de logging
 logging.basicConfig(
@@ -27,6 +60,30 @@ logger = logging.getLogger(__name__)
 MONGO_HOST = os.environ.get("MONGO_HOST", "storage_db")
 ELASTICSEARCH_HOST = os.environ.get("ELASTICSEARCH_HOST", "elasticsearch")
 ES_INDEX_NAME = "waze-events"
+ES_SYNC_MODE = os.environ.get("ES_SYNC_MODE", "auto")  # auto | changestream | poll
+ES_SYNC_SINK = os.environ.get("ES_SYNC_SINK", "elasticsearch")  # elasticsearch | local
+ES_SYNC_LOCAL_PATH = os.environ.get("ES_SYNC_LOCAL_PATH", "/tmp/waze_es_sync.ndjson")
+ES_SYNC_BATCH_SIZE = int(os.environ.get("ES_SYNC_BATCH_SIZE", "1000"))
+# Espera máxima para llenar un lote desde el change stream
+ES_SYNC_BATCH_SECONDS = float(os.environ.get("ES_SYNC_BATCH_SECONDS", "2"))
+ES_SYNC_POLL_SECONDS = int(os.environ.get("ES_SYNC_POLL_SECONDS", "15"))
+# ingested_at se fija al escribir, pero escritores en paralelo pueden hacerse visibles fuera de orden:
+# cada sondeo vuelve a mirar esta ventana
+ES_SYNC_LOOKBACK_SECONDS = int(os.environ.get("ES_SYNC_LOOKBACK_SECONDS", "60"))
+ES_SYNC_MAX_RETRIES = int(os.environ.get("ES_SYNC_MAX_RETRIES", "5"))
+STATE_COLLECTION = "export_state"
+STATE_ID = "es_sync"
+FAILED_COLLECTION = "es_sync_failed"
+# Índice para el sondeo; OLD_POLL_INDEX es el de la marca de agua anterior por last_seen_ts
+POLL_INDEX = "ingested_at_id"
+OLD_POLL_INDEX = "last_seen_ts_id"
+CHANGE_STREAM_HISTORY_LOST = 286
+
+SYNC_DOCUMENTS = Counter('waze_es_sync_documents_total', 'Documentos enviados a Elasticsearch por resultado (indexed, rejected, deleted)', labels=('result',))
+BATCH_DOCUMENTS = Histogram('waze_es_sync_batch_documents', 'Documentos por lote _bulk', buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000))
+BATCH_SECONDS = Histogram('waze_es_sync_batch_seconds', 'Latencia de cada lote (conversión y _bulk)')
+SYNC_LAG = Histogram('waze_es_sync_lag_seconds', 'Ahora menos el last_seen_ts más reciente de cada lote', buckets=LAG_BUCKETS)
+LAST_BATCH = Gauge('waze_es_sync_last_batch_timestamp_seconds', 'Fin del último lote enviado')
 
 def connect_to_mongodb():
     """Conectar a MongoDB con reintentos"""
@@ -66,6 +123,7 @@ def create_index_mapping(es):
         "mappings": {
             "properties": {
                 "event_id": {"type": "keyword"},
+                "mongo_id": {"type": "keyword"},
                 "type": {"type": "text", "analyzer": "standard"},
                 "address": {"type": "text", "analyzer": "standard"},
                 "city": {"type": "keyword"},
@@ -85,6 +143,11 @@ def create_index_mapping(es):
     try:
         if es.indices.exists(index=ES_INDEX_NAME):
             logger.info(f"Índice {ES_INDEX_NAME} ya existe")
+            try:
+                # Índices creados antes de que existiera mongo_id (los borrados se buscan por ese campo)
+                es.indices.put_mapping(index=ES_INDEX_NAME, properties={"mongo_id": {"type": "keyword"}})
+            except RequestError as e:
+                logger.warning(f"No se pudo agregar mongo_id al mapping; los borrados no se propagarán: {e}")
         else:
             es.indices.create(index=ES_INDEX_NAME, body=mapping)
             logger.info(f"Índice {ES_INDEX_NAME} creado con mapping")
@@ -94,113 +157,307 @@ def create_index_mapping(es):
             return False
     return True
 
-def process_and_index_events(mongo_client, es):
-    """Procesar eventos de MongoDB e indexarlos en Elasticsearch"""
-    collection = mongo_client.waze_data.events
-    
-    # Obtener eventos desde MongoDB
-    events = list(collection.find({}))
-    if not events:
-        logger.warning("No se encontraron eventos en MongoDB")
-        return 0
-    
-    logger.info(f"Procesando {len(events)} eventos de MongoDB")
-    
-    indexed_count = 0
-    for event in events:
-        try:
-            # Preparar el documento para Elasticsearch
-            doc = {
-                "event_id": event.get("event_id", ""),
-                "type": event.get("type", ""),
-                "address": event.get("address", ""),
-                "city": event.get("city", ""),
-                "scrape_timestamp": event.get("scrape_timestamp", ""),
-                "ingestion_timestamp": datetime.now().isoformat()
-            }
-            
-            # Añadir location si hay coordenadas
-            if "lat" in event and "lon" in event:
-                try:
-                    doc["location"] = {
-                        "lat": float(event["lat"]),
-                        "lon": float(event["lon"])
-                    }
-                except (ValueError, TypeError):
-                    pass
-            
-            # Enriquecer con campo comuna (similar a la lógica de Pig)
-            address = doc["address"].lower()
-            city = doc["city"].lower()
-            
-            if "las condes" in address or "las condes" in city:
-                doc["commune"] = "Las Condes"
-            elif "santiago" in address or "santiago" in city:
-                doc["commune"] = "Santiago"
-            elif "providencia" in address or "providencia" in city:
-                doc["commune"] = "Providencia"
-            else:
-                doc["commune"] = "Otra Comuna"
-            
-            # Estandarizar tipo de evento
-            event_type = doc["type"].lower()
-            if any(word in event_type for word in ["accident", "crash"]):
-                doc["standardized_type"] = "Accidente"
-            elif any(word in event_type for word in ["jam", "traffic"]):
-                doc["standardized_type"] = "Atasco"
-            elif any(word in event_type for word in ["closed", "closure"]):
-                doc["standardized_type"] = "Corte de Ruta"
-            elif any(word in event_type for word in ["hazard", "police"]):
-                doc["standardized_type"] = "Peligro en Via"
-            else:
-                doc["standardized_type"] = "Otro"
-            
-            # Indexar en Elasticsearch
-            es.index(
-                index=ES_INDEX_NAME,
-                id=doc["event_id"],
-                body=doc
-            )
-            indexed_count += 1
-            
-        except Exception as e:
-            logger.error(f"Error procesando evento {event.get('event_id', 'unknown')}: {e}")
-            continue
-    
-    logger.info(f"Indexados {indexed_count} eventos en Elasticsearch")
-    return indexed_count
+def coordinates(event):
+    """(lat, lon) del evento: latitude/longitude del scraper, el punto GeoJSON o lat/lon antiguos."""
+    lat, lon = event.get("latitude"), event.get("longitude")
+    if lat is None or lon is None:
+        point = event.get("location") or {}
+        if isinstance(point, dict) and len(point.get("coordinates") or []) == 2:
+            lon, lat = point["coordinates"]
+        else:
+            lat, lon = event.get("lat"), event.get("lon")
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+def scrape_time(event):
+    """scrape_timestamp sin fracción de segundo, en el formato del mapping (el scraper escribe isoformat())."""
+    moment = event.get("scrape_ts")
+    if isinstance(moment, datetime):
+        return moment.strftime("%Y-%m-%dT%H:%M:%S")
+    text = event.get("scrape_timestamp")
+    return text[:19] if isinstance(text, str) and len(text) >= 19 else None
+
+def to_document(event):
+    """Documento de Elasticsearch de un evento de Mongo."""
+    doc = {
+        "event_id": event.get("event_id") or "",
+        "mongo_id": str(event["_id"]),
+        "type": event.get("type") or "",
+        "address": event.get("address") or "",
+        "city": event.get("city") or "",
+        "scrape_timestamp": scrape_time(event),
+        "ingestion_timestamp": datetime.now().isoformat()
+    }
+    point = coordinates(event)
+    if point:
+        doc["location"] = {"lat": point[0], "lon": point[1]}
+    # Comuna y tipo estandarizado con las tablas de enrichment.py
+    doc["commune"] = commune(doc["address"], doc["city"])
+    doc["standardized_type"] = es_type(doc["type"])
+    return doc
+
+
+class ElasticsearchSink:
+    def __init__(self, es):
+        self.es = es
+
+    def write(self, documents, deleted):
+        """Un _bulk con los documentos; los borrados van por mongo_id (el change stream no trae event_id)."""
+        actions = ({"_index": ES_INDEX_NAME, "_id": doc["event_id"], "_source": doc} for doc in documents)
+        indexed, errors = helpers.bulk(self.es, actions, chunk_size=ES_SYNC_BATCH_SIZE, max_retries=ES_SYNC_MAX_RETRIES,
+                                       raise_on_error=False)
+        if deleted:
+            self.es.delete_by_query(index=ES_INDEX_NAME, query={"terms": {"mongo_id": deleted}}, conflicts="proceed")
+        # Cada error es {"index": {"_id": ..., "status": ..., "error": ...}}
+        rejected = [(item.get("_id"), item.get("error") or item.get("status"))
+                    for error in errors for item in error.values()]
+        return indexed, rejected
+
+
+class LocalSink:
+    """Sustituto de Elasticsearch: agrega cada lote a un archivo NDJSON en formato _bulk."""
+
+    def __init__(self, path=ES_SYNC_LOCAL_PATH):
+        self.path = path
+
+    def write(self, documents, deleted):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for doc in documents:
+                f.write(json.dumps({"index": {"_index": ES_INDEX_NAME, "_id": doc["event_id"]}}) + "\n")
+                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            for mongo_id in deleted:
+                f.write(json.dumps({"delete_by_mongo_id": {"_index": ES_INDEX_NAME, "mongo_id": mongo_id}}) + "\n")
+        return len(documents), []
+
+
+def load_state(db):
+    return db[STATE_COLLECTION].find_one({"_id": STATE_ID}) or {}
+
+def save_state(db, **fields):
+    db[STATE_COLLECTION].update_one({"_id": STATE_ID}, {"$set": fields}, upsert=True)
+
+def record_rejected(db, rejected):
+    """Guarda en FAILED_COLLECTION los documentos rechazados, para reintentarlos en la próxima vuelta."""
+    now = datetime.utcnow()
+    db[FAILED_COLLECTION].bulk_write([
+        pymongo.UpdateOne({"_id": event_id}, {"$set": {"error": str(error)[:1000], "failed_at": now},
+                                              "$inc": {"attempts": 1}}, upsert=True)
+        for event_id, error in rejected], ordered=False)
+
+def index_batch(db, sink, events, deleted=()):
+    """Indexa un lote y registra tamaño, latencia y retraso respecto de last_seen_ts.
+    Devuelve (indexados, event_id rechazados); los rechazados quedan en FAILED_COLLECTION."""
+    started = time.perf_counter()
+    documents = [to_document(event) for event in events if event.get("event_id")]
+    deleted = [str(mongo_id) for mongo_id in deleted]
+    indexed, errors = sink.write(documents, deleted)
+    elapsed = time.perf_counter() - started
+    seen = [event["last_seen_ts"] for event in events if isinstance(event.get("last_seen_ts"), datetime)]
+    lag = f", retraso {(datetime.utcnow() - max(seen)).total_seconds():.0f}s" if seen else ""
+    BATCH_DOCUMENTS.observe(len(documents) + len(deleted))
+    BATCH_SECONDS.observe(elapsed)
+    if seen:
+        SYNC_LAG.observe(max(0.0, (datetime.utcnow() - max(seen)).total_seconds()))
+    SYNC_DOCUMENTS.inc(indexed, result='indexed')
+    SYNC_DOCUMENTS.inc(len(errors), result='rejected')
+    SYNC_DOCUMENTS.inc(len(deleted), result='deleted')
+    LAST_BATCH.set(time.time())
+    logger.info(f"Lote: {indexed} indexados, {len(deleted)} borrados, {len(events) - len(documents)} sin event_id "
+                f"en {elapsed:.2f}s ({len(documents) / elapsed if elapsed > 0 else 0:.0f} docs/s){lag}")
+    if errors:
+        logger.error(f"{len(errors)} documentos rechazados por Elasticsearch (quedan en {FAILED_COLLECTION}); "
+                     f"primero: {errors[0]}")
+        record_rejected(db, errors)
+    return indexed, {event_id for event_id, _ in errors}
+
+def retry_rejected(db, sink):
+    """Vuelve a enviar los documentos rechazados que aún tienen intentos; los que pasan salen de la lista."""
+    failed = db[FAILED_COLLECTION]
+    ids = [doc["_id"] for doc in failed.find({"attempts": {"$lt": ES_SYNC_MAX_RETRIES}}, {"_id": 1})
+           .limit(ES_SYNC_BATCH_SIZE)]
+    if not ids:
+        return
+    # Los que ya no están en Mongo (borrados o vencidos por el TTL) tampoco hay que indexarlos
+    _, rejected = index_batch(db, sink, list(db.events.find({"event_id": {"$in": ids}})))
+    failed.delete_many({"_id": {"$in": [event_id for event_id in ids if event_id not in rejected]}})
+    logger.info(f"Reintento de rechazados: {len(ids) - len(rejected)} de {len(ids)} resueltos")
+
+def change_stream_token(collection):
+    """Resume token actual si la colección admite change streams (replica set); None si no."""
+    try:
+        with collection.watch(max_await_time_ms=1) as stream:
+            stream.try_next()
+            return stream.resume_token
+    except OperationFailure as e:
+        logger.info(f"Change streams no disponibles ({e.code}: {e.details.get('errmsg', e)}); se usa sondeo")
+        return None
+
+def initial_sync(db, sink, state):
+    """Copia la colección completa por páginas de _id; retoma desde la última página guardada."""
+    collection = db.events
+    last_id = state.get("initial_last_id")
+    total = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        events = list(collection.find(query).sort("_id", pymongo.ASCENDING).limit(ES_SYNC_BATCH_SIZE))
+        if not events:
+            break
+        total += index_batch(db, sink, events)[0]
+        last_id = events[-1]["_id"]
+        save_state(db, initial_last_id=last_id)
+    save_state(db, initial_done=True)
+    logger.info(f"Copia inicial completada: {total} eventos")
+
+def tail_changes(db, sink, token, once=False):
+    """Sigue el change stream desde `token` y manda los cambios en lotes."""
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+    with db.events.watch(pipeline, full_document="updateLookup", resume_after=token, max_await_time_ms=500) as stream:
+        while True:
+            # Por _id de Mongo: varios cambios del mismo documento en un lote se quedan con el último
+            changed, deleted = {}, set()
+            deadline = time.monotonic() + ES_SYNC_BATCH_SECONDS
+            while len(changed) + len(deleted) < ES_SYNC_BATCH_SIZE and time.monotonic() < deadline:
+                change = stream.try_next()
+                if change is None:
+                    continue
+                key = change["documentKey"]["_id"]
+                if change["operationType"] == "delete":
+                    changed.pop(key, None)
+                    deleted.add(key)
+                elif change.get("fullDocument"):
+                    deleted.discard(key)
+                    changed[key] = change["fullDocument"]
+            if changed or deleted:
+                index_batch(db, sink, list(changed.values()), sorted(deleted))
+                save_state(db, resume_token=stream.resume_token)
+            retry_rejected(db, sink)
+            if once:
+                return
+
+def poll_changes(db, sink, state, once=False):
+    """Sondea los documentos que el importer escribió (ingested_at) desde la marca de agua."""
+    collection = db.events
+    collection.create_index([("ingested_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], name=POLL_INDEX)
+    if OLD_POLL_INDEX in collection.index_information():
+        collection.drop_index(OLD_POLL_INDEX)
+    watermark = state.get("poll_ingested_at") or datetime.utcnow()
+    sent = {}  # _id -> ingested_at ya enviado dentro de la ventana
+    while True:
+        retry_rejected(db, sink)
+        since = watermark - timedelta(seconds=ES_SYNC_LOOKBACK_SECONDS)
+        query = {"ingested_at": {"$gte": since}}
+        order = [("ingested_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]
+        batch = []
+        for event in collection.find(query).sort(order).batch_size(ES_SYNC_BATCH_SIZE):
+            if sent.get(event["_id"]) == event["ingested_at"]:
+                continue
+            batch.append(event)
+            if len(batch) >= ES_SYNC_BATCH_SIZE:
+                watermark = send_polled(db, sink, batch, sent, watermark)
+                batch = []
+        if batch:
+            watermark = send_polled(db, sink, batch, sent, watermark)
+        # Lo que ya salió de la ventana no vuelve a aparecer en la consulta
+        window = watermark - timedelta(seconds=ES_SYNC_LOOKBACK_SECONDS)
+        for key in [k for k, ingested in sent.items() if ingested < window]:
+            del sent[key]
+        if once:
+            return
+        time.sleep(ES_SYNC_POLL_SECONDS)
+
+def send_polled(db, sink, batch, sent, watermark):
+    """Indexa un lote del sondeo y avanza la marca de agua; los rechazados ya quedaron registrados."""
+    index_batch(db, sink, batch)
+    for event in batch:
+        sent[event["_id"]] = event["ingested_at"]
+    watermark = max(watermark, batch[-1]["ingested_at"])
+    save_state(db, poll_ingested_at=watermark)
+    return watermark
+
+def sync(db, sink, once=False):
+    """Copia inicial (si falta) y seguimiento de cambios con el modo disponible."""
+    state = load_state(db)
+    token = state.get("resume_token")
+    mode = ES_SYNC_MODE
+    if mode != "poll" and token is None:
+        # El token se toma antes de la copia inicial: lo que cambie durante la copia se vuelve a enviar
+        token = change_stream_token(db.events)
+        if token is None and mode == "changestream":
+            raise RuntimeError("ES_SYNC_MODE=changestream requiere un replica set")
+        if token is not None:
+            save_state(db, resume_token=token)
+    if mode == "auto":
+        mode = "changestream" if token is not None else "poll"
+    if mode == "poll" and "poll_ingested_at" not in state:
+        # Igual que el token: la marca de agua parte antes de la copia inicial. poll_ts (last_seen_ts de la
+        # versión anterior) es anterior a cualquier escritura posterior, así que sirve de punto de partida
+        state["poll_ingested_at"] = state.get("poll_ts") or datetime.utcnow()
+        save_state(db, poll_ingested_at=state["poll_ingested_at"])
+    if not state.get("initial_done"):
+        initial_sync(db, sink, state)
+    logger.info(f"Siguiendo cambios de waze_data.events (modo {mode})")
+    if mode == "changestream":
+        tail_changes(db, sink, token, once)
+    else:
+        poll_changes(db, sink, state, once)
 
 def main():
     """Función principal"""
-    logger.info("=== Iniciando exportación MongoDB → Elasticsearch ===")
+    parser = argparse.ArgumentParser(description="Sincroniza waze_data.events con el índice waze-events")
+    parser.add_argument("--once", action="store_true", help="Copia inicial y una pasada de cambios, luego termina")
+    parser.add_argument("--reset", action="store_true", help="Olvida el avance guardado y vuelve a copiar todo")
+    args = parser.parse_args()
+
+    logger.info("=== Iniciando sincronización MongoDB → Elasticsearch ===")
     
     # Conectar a MongoDB
     mongo_client = connect_to_mongodb()
     if not mongo_client:
         sys.exit(1)
+    db = mongo_client.waze_data
     
-    # Conectar a Elasticsearch
-    es = connect_to_elasticsearch()
-    if not es:
-        mongo_client.close()
-        sys.exit(1)
+    if ES_SYNC_SINK == "local":
+        sink = LocalSink()
+    else:
+        # Conectar a Elasticsearch
+        es = connect_to_elasticsearch()
+        if not es:
+            mongo_client.close()
+            sys.exit(1)
+        
+        # Crear índice con mapping
+        if not create_index_mapping(es):
+            mongo_client.close()
+            sys.exit(1)
+        sink = ElasticsearchSink(es)
     
-    # Crear índice con mapping
-    if not create_index_mapping(es):
+    start_http_server()
+    if args.reset:
+        db[STATE_COLLECTION].delete_one({"_id": STATE_ID})
+    try:
+        while True:
+            try:
+                sync(db, sink, args.once)
+                break
+            except OperationFailure as e:
+                if e.code != CHANGE_STREAM_HISTORY_LOST:
+                    raise
+                # El oplog ya no tiene el punto de retoma: se copia todo de nuevo
+                logger.warning("El resume token ya no está en el oplog; se repite la copia inicial")
+                db[STATE_COLLECTION].delete_one({"_id": STATE_ID})
+            except (PyMongoError, ESConnectionError) as e:
+                if args.once:
+                    raise
+                logger.error(f"Error de sincronización: {e}. Reintentando en {ES_SYNC_POLL_SECONDS}s...")
+                time.sleep(ES_SYNC_POLL_SECONDS)
+    finally:
+        # Cerrar conexiones
         mongo_client.close()
-        sys.exit(1)
-    
-    # Procesar e indexar eventos
-    indexed_count = process_and_index_events(mongo_client, es)
-    
-    # Cerrar conexiones
-    mongo_client.close()
-    
-    if indexed_count > 0:
-        logger.info(f"=== Exportación completada: {indexed_count} eventos indexados ===")
-        logger.info(f"Los datos están disponibles en Kibana en el índice '{ES_INDEX_NAME}'")
-    else:
-        logger.warning("=== No se indexaron eventos ===")
 
 if __name__ == "__main__":
     main()
@@ -1,19 +1,42 @@
 import os
 import sys
+import bz2
+import gzip
+import shutil
 import subprocess
 import logging
 import time
+import argparse
+from collections import OrderedDict
+from datetime import datetime, timedelta
 import pymongo
 from pymongo.errors import ConnectionFailure
+from bson import ObjectId
+from event_schema import EVENT_FORMAT, RAW_FIELDS, field_names, to_record, to_tsv_row, avro_writer
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger(__name__)
 
 MONGO_HOST = os.environ.get("MONGO_HOST", "storage_db")
-LOCAL_TSV_PATH = "/tmp/waze_events.tsv"
 HDFS_INPUT_DIR = "/user/hadoop/waze_input"
-HDFS_TARGET_PATH = os.path.join(HDFS_INPUT_DIR, "waze_events.tsv")
+# Reconstrucción completa: se exporta aquí y recién al terminar reemplaza a waze_input
+HDFS_REBUILD_DIR = f"{HDFS_INPUT_DIR}._rebuild"
+HDFS_OLD_INPUT_DIR = f"{HDFS_INPUT_DIR}._old"
+# EXPORT_SINK=local escribe en EXPORT_LOCAL_ROOT en lugar de HDFS (mismas rutas, para pruebas sin Hadoop)
+EXPORT_SINK = os.environ.get("EXPORT_SINK", "hdfs")
+EXPORT_LOCAL_ROOT = os.environ.get("EXPORT_LOCAL_ROOT", "/tmp/hdfs_standin")
+# none, gzip o bz2; Pig descomprime .gz y .bz2 por la extensión (con EVENT_FORMAT=avro es el codec de los bloques)
+EXPORT_COMPRESSION = os.environ.get("EXPORT_COMPRESSION", "gzip")
+# Particiones escribiéndose a la vez (un proceso `hdfs dfs -put` por cada una)
+EXPORT_MAX_OPEN_PARTITIONS = int(os.environ.get("EXPORT_MAX_OPEN_PARTITIONS", "4"))
+EXPORT_BUFFER_BYTES = 64 * 1024
 MIN_EVENTS_TO_PROCESS = 100
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+# Solo se exportan _id con más de estos segundos: una inserción en curso con un _id menor no queda atrás
+EXPORT_SETTLE_SECONDS = int(os.environ.get("EXPORT_SETTLE_SECONDS", "5"))
+# Marca de agua: último _id exportado, guardado en Mongo para que sobreviva al contenedor
+STATE_COLLECTION = "export_state"
+STATE_ID = "hdfs_export"
 
 def connect_to_mongodb():
     for i in range(10):
@@ -28,34 +51,275 @@ def connect_to_mongodb():
 
 def wait_for_data(collection):
     for i in range(60):
-        count = collection.count_documents({})
+        count = collection.estimated_document_count()
         if count >= MIN_EVENTS_TO_PROCESS:
-            logger.info(f"Umbral de {MIN_EVENTS_TO_PROCESS} eventos alcanzado. Exportando {count} documentos.")
-            return list(collection.find({}, {'_id': 0}))
+            logger.info(f"Umbral de {MIN_EVENTS_TO_PROCESS} eventos alcanzado ({count} en la colección).")
+            return True
         logger.info(f"Esperando más datos... {count}/{MIN_EVENTS_TO_PROCESS}. Próxima comprobación en 10s.")
         time.sleep(10)
     logger.error("No se alcanzó el umbral de eventos para procesar. Abortando.")
-    return None
+    return False
+
+def partition_of(doc):
+    """Partición dt=YYYY-MM-DD/hr=HH según la hora de scraping (o la de inserción, si no hay)."""
+    moment = doc.get("scrape_ts")
+    if not isinstance(moment, datetime):
+        try:
+            moment = datetime.fromisoformat(doc.get("scrape_timestamp") or "")
+        except ValueError:
+            moment = doc["_id"].generation_time
+    return f"dt={moment.strftime('%Y-%m-%d')}/hr={moment.strftime('%H')}"
+
+COMPRESSION_SUFFIX = {"none": "", "gzip": ".gz", "bz2": ".bz2"}
+
+def file_suffix():
+    return ".avro" if EVENT_FORMAT == "avro" else f".tsv{COMPRESSION_SUFFIX[EXPORT_COMPRESSION]}"
+
+class HdfsWriter:
+    """Escribe un archivo en HDFS por la entrada estándar de `hdfs dfs -put -f - destino`."""
+
+    def __init__(self, path):
+        self.path = path
+        self.process = subprocess.Popen(["hdfs", "dfs", "-put", "-f", "-", path], stdin=subprocess.PIPE)
+        self.stream = self.process.stdin
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    def seekable(self):
+        # Flujo de solo escritura hacia adelante (fastavro lo consulta antes de escribir la cabecera)
+        return False
+
+    def close(self):
+        self.stream.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"hdfs dfs -put falló para {self.path} (código {self.process.returncode})")
+
+    def abort(self):
+        self.process.kill()
+        self.process.wait()
+
+class LocalWriter:
+    """Equivalente local de HdfsWriter: escribe a un temporal y lo renombra al cerrar."""
+
+    def __init__(self, path):
+        self.path = os.path.join(EXPORT_LOCAL_ROOT, path.lstrip("/"))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.stream = open(f"{self.path}._COPYING_", "wb")
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    def seekable(self):
+        # Flujo de solo escritura hacia adelante (fastavro lo consulta antes de escribir la cabecera)
+        return False
+
+    def close(self):
+        self.stream.close()
+        os.replace(f"{self.path}._COPYING_", self.path)
+
+    def abort(self):
+        self.stream.close()
+        os.remove(f"{self.path}._COPYING_")
+
+def make_dirs(paths):
+    if EXPORT_SINK == "local":
+        for path in paths:
+            os.makedirs(os.path.join(EXPORT_LOCAL_ROOT, path.lstrip("/")), exist_ok=True)
+    else:
+        subprocess.run(["hdfs", "dfs", "-mkdir", "-p"] + paths, check=True)
+
+def remove_files(paths):
+    if EXPORT_SINK == "local":
+        for path in paths:
+            os.remove(os.path.join(EXPORT_LOCAL_ROOT, path.lstrip("/")))
+    elif paths:
+        subprocess.run(["hdfs", "dfs", "-rm", "-f"] + paths, check=True)
+
+def remove_tree(path):
+    if EXPORT_SINK == "local":
+        shutil.rmtree(os.path.join(EXPORT_LOCAL_ROOT, path.lstrip("/")), ignore_errors=True)
+    else:
+        subprocess.run(["hdfs", "dfs", "-rm", "-r", "-f", path], check=True)
+
+def dir_exists(path):
+    if EXPORT_SINK == "local":
+        return os.path.isdir(os.path.join(EXPORT_LOCAL_ROOT, path.lstrip("/")))
+    return subprocess.run(["hdfs", "dfs", "-test", "-d", path]).returncode == 0
+
+def rename(source, target):
+    if EXPORT_SINK == "local":
+        os.rename(os.path.join(EXPORT_LOCAL_ROOT, source.lstrip("/")), os.path.join(EXPORT_LOCAL_ROOT, target.lstrip("/")))
+    else:
+        subprocess.run(["hdfs", "dfs", "-mv", source, target], check=True)
+
+def swap_in_rebuild():
+    """Reemplaza waze_input por la reconstrucción con dos renombres. Es idempotente: si el proceso se
+    corta entre ellos, repetirlo termina el reemplazo sin perder ni waze_input ni la reconstrucción."""
+    if dir_exists(HDFS_REBUILD_DIR):
+        if dir_exists(HDFS_INPUT_DIR):
+            remove_tree(HDFS_OLD_INPUT_DIR)
+            rename(HDFS_INPUT_DIR, HDFS_OLD_INPUT_DIR)
+        rename(HDFS_REBUILD_DIR, HDFS_INPUT_DIR)
+    remove_tree(HDFS_OLD_INPUT_DIR)
+
+def finish_rebuild(db, state):
+    """Completa una reconstrucción ya exportada (marcada en `rebuild`): reemplaza waze_input y recién
+    entonces fija la marca de agua de la reconstrucción. Devuelve el estado resultante."""
+    rebuild = state.get("rebuild")
+    if not rebuild:
+        return state
+    swap_in_rebuild()
+    update = {"$set": {"last_run": rebuild["run"], "exported": rebuild["exported"]}, "$unset": {"rebuild": ""}}
+    if rebuild.get("last_id"):
+        update["$set"]["last_id"] = rebuild["last_id"]
+    else:
+        update["$unset"]["last_id"] = ""
+    db[STATE_COLLECTION].update_one({"_id": STATE_ID}, update)
+    logger.info(f"Reconstrucción {rebuild['run']} en {HDFS_INPUT_DIR}: {rebuild['exported']} documentos.")
+    return db[STATE_COLLECTION].find_one({"_id": STATE_ID}) or {}
+
+class PartitionFile:
+    """Archivo de una partición: registros codificados, comprimidos y enviados en bloques al destino."""
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = LocalWriter(path) if EXPORT_SINK == "local" else HdfsWriter(path)
+        self.avro = None
+        if EVENT_FORMAT == "avro":
+            # Avro comprime por bloques dentro del archivo; el stream va sin comprimir
+            self.compressor = self.writer
+            self.avro = avro_writer(self.writer, "raw_event", RAW_FIELDS, EXPORT_COMPRESSION)
+        elif EXPORT_COMPRESSION == "gzip":
+            self.compressor = gzip.GzipFile(fileobj=self.writer, mode="wb")
+        elif EXPORT_COMPRESSION == "bz2":
+            self.compressor = bz2.BZ2File(self.writer, mode="wb")
+        else:
+            self.compressor = self.writer
+        self.buffer = []
+        self.buffered = 0
+        self.rows = 0
+
+    def write(self, record):
+        self.rows += 1
+        if self.avro is not None:
+            self.avro.write(record)
+            return
+        data = to_tsv_row(record, RAW_FIELDS).encode("utf-8")
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= EXPORT_BUFFER_BYTES:
+            self.flush()
+
+    def flush(self):
+        self.compressor.write(b"".join(self.buffer))
+        self.buffer, self.buffered = [], 0
+
+    def close(self):
+        if self.avro is not None:
+            self.avro.flush()
+        else:
+            self.flush()
+        if self.compressor is not self.writer:
+            self.compressor.close()
+        self.writer.close()
+
+    def abort(self):
+        self.writer.abort()
+
+def export_new_documents(collection, state, run_id, base_dir=HDFS_INPUT_DIR):
+    """Envía a `base_dir`, por partición y sin archivos locales, los documentos posteriores a la marca de agua."""
+    watermark = state.get("last_id")
+    query = {"_id": {"$lt": ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=EXPORT_SETTLE_SECONDS))}}
+    if watermark:
+        query["_id"]["$gt"] = watermark
+    projection = {field: 1 for field in field_names(RAW_FIELDS) + ["scrape_ts"]}
+    suffix = file_suffix()
+    open_files = OrderedDict()  # partición -> PartitionFile, en orden de uso
+    parts_per_partition = {}
+    written = []
+    exported = 0
+    last_id = watermark
+    try:
+        for doc in collection.find(query, projection).sort("_id", pymongo.ASCENDING).batch_size(EXPORT_BATCH_SIZE):
+            partition = partition_of(doc)
+            part = open_files.get(partition)
+            if part is None:
+                if len(open_files) >= EXPORT_MAX_OPEN_PARTITIONS:
+                    oldest = next(iter(open_files))
+                    open_files[oldest].close()
+                    written.append(open_files.pop(oldest).path)
+                # Una partición que vuelve a aparecer después de cerrarse sigue en un archivo nuevo
+                sequence = parts_per_partition.get(partition, 0)
+                parts_per_partition[partition] = sequence + 1
+                if sequence == 0:
+                    make_dirs([f"{base_dir}/{partition}"])
+                part = open_files[partition] = PartitionFile(f"{base_dir}/{partition}/part-{run_id}-{sequence:03d}{suffix}")
+            open_files.move_to_end(partition)
+            part.write(to_record(doc, RAW_FIELDS))
+            exported += 1
+            last_id = doc["_id"]
+        while open_files:
+            oldest = next(iter(open_files))
+            open_files[oldest].close()
+            written.append(open_files.pop(oldest).path)
+    except BaseException:
+        # Sin marca de agua nueva, la próxima corrida reexporta todo: no deben quedar archivos a medias ni duplicados
+        logger.error(f"Exportación interrumpida; se descartan {len(written) + len(open_files)} archivos de la corrida {run_id}")
+        for part in open_files.values():
+            part.abort()
+        remove_files(written)
+        raise
+    if written:
+        logger.info(f"Escritos {len(written)} archivos en {len(parts_per_partition)} particiones: {', '.join(sorted(parts_per_partition))}")
+    return exported, last_id
 
 def main():
+    parser = argparse.ArgumentParser(description="Exporta a HDFS los eventos nuevos de MongoDB")
+    parser.add_argument("--full", action="store_true", help="Reconstrucción completa: borra waze_input y reexporta todo")
+    args = parser.parse_args()
+
     mongo_client = connect_to_mongodb()
     if not mongo_client: sys.exit(1)
-    
-    collection = mongo_client.waze_data.events
-    documents = wait_for_data(collection)
-    mongo_client.close()
 
-    if documents is None: sys.exit(1)
+    db = mongo_client.waze_data
+    collection = db.events
+    if not wait_for_data(collection):
+        mongo_client.close()
+        sys.exit(1)
 
-    expected_fields = ["event_id", "type", "address", "city", "scrape_timestamp"]
-    with open(LOCAL_TSV_PATH, "w", encoding="utf-8") as f:
-        for doc in documents:
-            row = [str(doc.get(field, "")).replace('\t', ' ').replace('\n', ' ') for field in expected_fields]
-            f.write("\t".join(row) + "\n")
-    
-    subprocess.run(["hdfs", "dfs", "-mkdir", "-p", HDFS_INPUT_DIR], check=True)
-    subprocess.run(["hdfs", "dfs", "-put", "-f", LOCAL_TSV_PATH, HDFS_TARGET_PATH], check=True)
-    logger.info(f"Archivo subido a HDFS: {HDFS_TARGET_PATH}.")
+    # Una reconstrucción anterior que se cortó después de exportar se termina antes de seguir
+    state = finish_rebuild(db, db[STATE_COLLECTION].find_one({"_id": STATE_ID}) or {})
+    run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    if args.full or os.environ.get("EXPORT_MODE") == "full":
+        # waze_input y la marca de agua siguen intactos hasta que la reconstrucción está completa
+        logger.info(f"Reconstrucción completa: se exporta todo a {HDFS_REBUILD_DIR} y luego reemplaza a {HDFS_INPUT_DIR}.")
+        remove_tree(HDFS_REBUILD_DIR)
+        make_dirs([HDFS_REBUILD_DIR])
+        exported, last_id = export_new_documents(collection, {}, run_id, HDFS_REBUILD_DIR)
+        # Se anota antes de renombrar: si el proceso se corta, la próxima corrida termina el reemplazo
+        rebuild = {"run": run_id, "last_id": last_id, "exported": exported}
+        db[STATE_COLLECTION].update_one({"_id": STATE_ID}, {"$set": {"rebuild": rebuild}}, upsert=True)
+        finish_rebuild(db, {"rebuild": rebuild})
+        mongo_client.close()
+        return
+
+    exported, last_id = export_new_documents(collection, state, run_id)
+    if exported:
+        # La marca de agua avanza solo después de que HDFS tiene los archivos
+        db[STATE_COLLECTION].update_one({"_id": STATE_ID},
+                                        {"$set": {"last_id": last_id, "last_run": run_id, "exported": exported}},
+                                        upsert=True)
+        logger.info(f"Exportados {exported} documentos nuevos (corrida {run_id}, hasta _id {last_id}).")
+    else:
+        logger.info("No hay documentos nuevos desde la última exportación.")
+    mongo_client.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
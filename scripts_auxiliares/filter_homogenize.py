@@ -0,0 +1,332 @@
+"""
+Motor en Python equivalente a 01_filter_homogenize.pig.
+
+Para los volúmenes de una exportación incremental (decenas de miles de
+eventos) casi todo el tiempo de Pig se va en levantar la JVM y el job de
+MapReduce. Este módulo aplica el mismo filtro, la extracción de sector y
+calle, la traducción del tipo y la hora del reporte como una cadena de
+generadores que recorre la entrada una sola vez, y escribe individual_events
+con el mismo layout (TSV o Avro según EVENT_FORMAT). batch_driver.py lo usa
+por partición; la línea de comandos trabaja sobre archivos locales.
+
+Reproduce la semántica de Pig donde importa: TRIM de Java (quita caracteres
+<= ' '), REGEX_EXTRACT con la primera coincidencia, campos vacíos como null,
+filas cortas completadas con null y los double escritos como Double.toString.
+Las reglas de sector, calle, tipo y hora están en enrichment.py.
+
+Uso:
+    python filter_homogenize.py --local-input DIR --local-output DIR
+    python filter_homogenize.py --local-input DIR --compare SALIDA_PIG
+    python filter_homogenize.py --local-input DIR --benchmark [--repeat 5]
+    python filter_homogenize.py --check-fixture
+    python filter_homogenize.py --record-fixture [RUTA]    # en pig-runner, con Pig instalado
+
+fixtures/filter_homogenize/ guarda una entrada chica con los casos borde
+(tipos y direcciones vacíos o solo espacios, direcciones sin coma, sin sector
+o sin calle, comunas no ASCII, filas cortas, lat/lon vacías, double en
+notación científica, confidence no numérico, un U+2028 dentro del tipo, que
+hace fallar MATCHES, y un CR que corta el registro en dos igual que el
+LineRecordReader de Hadoop) y la salida de homogenize_macro.pig para esa
+entrada. --check-fixture exige
+que este motor la reproduzca exactamente; --record-fixture la vuelve a grabar
+con `pig -x local` cuando cambia la macro (en pig-runner /scripts_auxiliares
+es de solo lectura: se graba en /tmp y se copia con `docker cp`).
+"""
+
+import io
+import os
+import bz2
+import sys
+import gzip
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+from decimal import Decimal
+from pathlib import Path
+from collections import Counter
+
+from event_schema import (EVENT_FORMAT, RAW_FIELDS, PROCESSED_FIELDS, avro_writer, read_records, pig_params,
+                          require_fastavro, fastavro)
+from enrichment import java_trim, pig_type, split_address, report_hour
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger(__name__)
+
+PIG_SCRIPT = "/pig_scripts/01_filter_homogenize.pig"
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures" / "filter_homogenize"
+FIXTURE_INPUT = FIXTURE_DIR / "input.tsv"
+FIXTURE_EXPECTED = FIXTURE_DIR / "expected_pig.tsv"
+
+RAW_INDEX = {name: i for i, (name, _) in enumerate(RAW_FIELDS)}
+
+
+# --- Conversión como PigStorage ---
+
+def pig_value(text, kind):
+    """Valor de un campo TSV con el cast de Pig: vacío o inválido es null; int acepta '3.0'."""
+    if text == "":
+        return None
+    if kind == "string":
+        return text
+    try:
+        return int(text) if kind == "int" else float(text)
+    except ValueError:
+        if kind == "int":
+            try:
+                return int(float(text))
+            except (ValueError, OverflowError):
+                return None
+        return None
+
+
+def load_tsv(lines):
+    """Tuplas tipadas en el orden de RAW_FIELDS; las filas cortas se completan con null como PigStorage."""
+    kinds = [kind for _, kind in RAW_FIELDS]
+    width = len(kinds)
+    for line in lines:
+        values = line.rstrip("\r\n").split("\t")
+        if len(values) < width:
+            values += [""] * (width - len(values))
+        yield tuple(pig_value(v, k) for v, k in zip(values, kinds))
+
+
+def load_avro(records):
+    names = [name for name, _ in RAW_FIELDS]
+    for record in records:
+        yield tuple(record.get(name) for name in names)
+
+
+def pig_double(value):
+    """Texto de un double como lo escribe Pig (Double.toString de Java)."""
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "Infinity" if value > 0 else "-Infinity"
+    if value == 0 or 1e-3 <= abs(value) < 1e7:
+        return repr(value)
+    sign, digits, exponent = Decimal(repr(value)).normalize().as_tuple()
+    digits = "".join(map(str, digits))
+    return f"{'-' if sign else ''}{digits[0]}.{digits[1:] or '0'}E{len(digits) + exponent - 1}"
+
+
+# --- Transformación ---
+
+def homogenize(rows):
+    """Filtra y enriquece tuplas crudas; entrega tuplas en el orden de PROCESSED_FIELDS."""
+    i_id, i_type, i_address = RAW_INDEX["event_id"], RAW_INDEX["type"], RAW_INDEX["address"]
+    i_report, i_lat, i_lon = RAW_INDEX["report_time"], RAW_INDEX["latitude"], RAW_INDEX["longitude"]
+    i_conf, i_reporter = RAW_INDEX["confidence"], RAW_INDEX["reporter"]
+    for row in rows:
+        event_type, address = row[i_type], row[i_address]
+        if event_type is None or not java_trim(event_type) or address is None or not java_trim(address):
+            continue
+        # Reglas de enrichment.py, con caché: tipos y direcciones se repiten entre eventos
+        sector, calle = split_address(address)
+        report_time = row[i_report]
+        yield (row[i_id], event_type, address, report_time, row[i_lat], row[i_lon], row[i_conf],
+               row[i_reporter], sector, calle, pig_type(event_type), report_hour(report_time))
+
+
+def to_tsv(rows):
+    formatters = [pig_double if kind == "double" else str for _, kind in PROCESSED_FIELDS]
+    for row in rows:
+        yield "\t".join("" if v is None else f(v) for f, v in zip(formatters, row)) + "\n"
+
+
+# --- Entrada y salida ---
+
+def open_text(stream, suffix):
+    """Texto de un stream binario según la extensión; varios .gz o .bz2 concatenados se leen seguidos."""
+    if suffix == ".gz":
+        stream = gzip.GzipFile(fileobj=stream)
+    elif suffix == ".bz2":
+        stream = bz2.BZ2File(stream)
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+
+def read_raw(stream, suffix):
+    """Tuplas crudas de un archivo de waze_input (TSV, .gz, .bz2 o .avro)."""
+    if suffix == ".avro":
+        require_fastavro()
+        return load_avro(fastavro.reader(stream))
+    return load_tsv(open_text(stream, suffix))
+
+
+def suffix_of(path):
+    for suffix in (".avro", ".gz", ".bz2"):
+        if path.endswith(suffix):
+            return suffix
+    return ""
+
+
+def local_inputs(target):
+    target = Path(target)
+    if target.is_file():
+        return [str(target)]
+    return sorted(str(p) for p in target.rglob("part-*") if p.is_file() and not p.name.endswith("._COPYING_"))
+
+
+def read_local(paths):
+    for path in paths:
+        with open(path, "rb") as f:
+            yield from read_raw(f, suffix_of(path))
+
+
+def write_output(rows, stream, event_format):
+    """Escribe las tuplas procesadas en `stream` (binario); devuelve cuántas."""
+    count = 0
+    if event_format == "avro":
+        names = [name for name, _ in PROCESSED_FIELDS]
+        writer = avro_writer(stream, "individual_events", PROCESSED_FIELDS)
+        for row in rows:
+            writer.write(dict(zip(names, row)))
+            count += 1
+        writer.flush()
+        return count
+    buffer = []
+    for line in to_tsv(rows):
+        buffer.append(line)
+        count += 1
+        if len(buffer) >= 5000:
+            stream.write("".join(buffer).encode("utf-8"))
+            buffer = []
+    stream.write("".join(buffer).encode("utf-8"))
+    return count
+
+
+def output_name(event_format):
+    return "part-m-00000.avro" if event_format == "avro" else "part-m-00000"
+
+
+def run_local(inputs, output_dir, event_format=EVENT_FORMAT):
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    with open(os.path.join(output_dir, output_name(event_format)), "wb") as f:
+        count = write_output(homogenize(read_local(inputs)), f, event_format)
+    Path(output_dir, "_SUCCESS").touch()
+    return count
+
+
+# --- Equivalencia y benchmark ---
+
+def read_output_lines(output_dir):
+    """Filas de una salida (Pig o este motor) normalizadas a TSV, para comparar sin importar el orden."""
+    lines = Counter()
+    for path in local_inputs(output_dir):
+        if path.endswith(".avro"):
+            names = [name for name, _ in PROCESSED_FIELDS]
+            lines.update(to_tsv(tuple(r.get(n) for n in names) for r in read_records(path, PROCESSED_FIELDS)))
+        else:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                lines.update(line if line.endswith("\n") else line + "\n" for line in f)
+    return lines
+
+
+def compare(inputs, pig_output, event_format=EVENT_FORMAT):
+    """Compara la salida de este motor con una salida grabada de Pig sobre la misma entrada."""
+    with tempfile.TemporaryDirectory() as tmp:
+        run_local(inputs, tmp, event_format)
+        ours = read_output_lines(tmp)
+    expected = read_output_lines(pig_output)
+    missing, extra = expected - ours, ours - expected
+    logger.info(f"Pig: {sum(expected.values())} filas; Python: {sum(ours.values())} filas")
+    for label, rows in (("Solo en Pig", missing), ("Solo en Python", extra)):
+        for line in list(rows)[:10]:
+            logger.error(f"{label}: {line.rstrip()!r}")
+    if missing or extra:
+        logger.error(f"Salidas distintas: {sum(missing.values())} filas solo en Pig, {sum(extra.values())} solo en Python")
+        return False
+    logger.info("Salidas equivalentes")
+    return True
+
+
+def pig_available():
+    return shutil.which("pig") is not None and os.path.exists(PIG_SCRIPT)
+
+
+def run_pig(inputs, output_dir, event_format=EVENT_FORMAT):
+    """Corre 01_filter_homogenize.pig con `pig -x local` (lee y escribe rutas del disco)."""
+    params = [arg for key, value in pig_params(event_format).items() for arg in ("-param", f"{key}={value}")]
+    subprocess.run(["pig", "-x", "local"] + params + ["-param", f"INPUT={','.join(inputs)}",
+                    "-param", f"OUTPUT={output_dir}", "-f", PIG_SCRIPT],
+                   check=True, capture_output=True)
+
+
+def check_fixture():
+    """La salida de este motor sobre la entrada de muestra debe ser idéntica a la grabada de Pig."""
+    return compare([str(FIXTURE_INPUT)], str(FIXTURE_EXPECTED), "tsv")
+
+
+def record_fixture(destination=FIXTURE_EXPECTED):
+    """Vuelve a grabar la salida esperada corriendo la macro de Pig sobre la entrada de muestra."""
+    if not pig_available():
+        logger.error("Pig no está disponible aquí; la muestra se graba en el contenedor pig-runner")
+        return False
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = os.path.join(tmp, "pig")
+        run_pig([str(FIXTURE_INPUT)], output_dir, "tsv")
+        with open(destination, "wb") as out:
+            for path in local_inputs(output_dir):
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, out)
+    logger.info(f"Salida de Pig grabada en {destination}")
+    return True
+
+
+def benchmark(inputs, repeat, event_format=EVENT_FORMAT):
+    """Tiempo de este motor y, si `pig` está instalado, de `pig -x local` sobre la misma entrada."""
+    with tempfile.TemporaryDirectory() as tmp:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            count = run_local(inputs, os.path.join(tmp, "python"), event_format)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        logger.info(f"Python: {count} eventos en {best:.3f}s (mejor de {repeat}), {count / best:.0f} eventos/s")
+        if not pig_available():
+            logger.info("Pig no está disponible aquí; el benchmark contra Pig se corre en el contenedor pig-runner")
+            return
+        started = time.perf_counter()
+        run_pig(inputs, os.path.join(tmp, "pig"), event_format)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Pig (-x local): {elapsed:.3f}s, {elapsed / best:.1f}x más lento")
+        compare(inputs, os.path.join(tmp, "pig"), event_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filtrado y homogeneización de eventos sin Pig")
+    parser.add_argument("--local-input", help="Directorio o archivo local de entrada")
+    parser.add_argument("--local-output", help="Directorio local de salida")
+    parser.add_argument("--compare", metavar="SALIDA_PIG", help="Compara contra una salida grabada de Pig")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check-fixture", action="store_true", help="Verifica contra la salida de Pig grabada en fixtures/")
+    parser.add_argument("--record-fixture", nargs="?", const=str(FIXTURE_EXPECTED), metavar="RUTA",
+                        help="Graba la salida de Pig para la muestra de fixtures/")
+    args = parser.parse_args()
+
+    if args.record_fixture:
+        sys.exit(0 if record_fixture(args.record_fixture) else 1)
+    if args.check_fixture:
+        sys.exit(0 if check_fixture() else 1)
+    if not args.local_input:
+        parser.error("--local-input es obligatorio salvo con --check-fixture o --record-fixture")
+
+    inputs = local_inputs(args.local_input)
+    if args.compare:
+        sys.exit(0 if compare(inputs, args.compare) else 1)
+    if args.benchmark:
+        benchmark(inputs, args.repeat)
+    elif args.local_output:
+        started = time.perf_counter()
+        count = run_local(inputs, args.local_output)
+        logger.info(f"{count} eventos escritos en {args.local_output} en {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
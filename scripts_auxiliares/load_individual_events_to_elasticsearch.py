@@ -1,24 +1,48 @@
 #!/usr/bin/env python3
 """
 Carga eventos individuales enriquecidos a Elasticsearch
+
+Los documentos usan event_id como _id: volver a cargar una partición
+reemplaza sus eventos en lugar de duplicarlos. Cada documento guarda su
+partición dt=/hr=; los de las particiones que batch_driver.py borró (ya sin
+entrada) se eliminan con un delete_by_query antes de indexar. Las acciones salen de un
+generador y se envían en lotes de ES_BULK_CHUNK_SIZE con ES_BULK_WORKERS
+hilos y a lo más dos lotes por hilo en vuelo, así que la memoria no depende
+del tamaño de la carga. Los documentos rechazados (429) se reintentan con
+espera exponencial; al final se informan docs/s, latencia por lote y los
+errores por tipo.
+
+Uso: python load_individual_events_to_elasticsearch.py [--recreate]
 """
 
-import json
-import subprocess
 import os
+import sys
+import time
 import logging
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from elasticsearch import Elasticsearch
-from pathlib import Path
+from itertools import islice
+from elasticsearch import Elasticsearch, ApiError
+from event_schema import PROCESSED_FIELDS, read_records
+from batch_layout import HDFS_EVENTS_DIR, fetch_batch, fetch_partitions, list_partitions, read_batch
+from enrichment import with_defaults
 
 # Configuración
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 ELASTICSEARCH_HOST = os.getenv('ELASTICSEARCH_HOST', 'localhost')
-HDFS_PATH = '/user/hadoop/waze_processed/individual_events'
 LOCAL_TEMP_PATH = '/tmp/individual_events_data'
 INDEX_NAME = 'waze-individual-events'
+ES_BULK_CHUNK_SIZE = int(os.getenv('ES_BULK_CHUNK_SIZE', '1000'))
+ES_BULK_WORKERS = int(os.getenv('ES_BULK_WORKERS', '4'))
+ES_BULK_MAX_RETRIES = int(os.getenv('ES_BULK_MAX_RETRIES', '5'))
+ES_BULK_INITIAL_BACKOFF = float(os.getenv('ES_BULK_INITIAL_BACKOFF', '1'))
+# Respuestas que indican sobrecarga del clúster: se reintenta en lugar de contarlas como error
+RETRY_STATUSES = {429, 503}
 
 def connect_to_elasticsearch():
     """Conecta a Elasticsearch con reintentos."""
@@ -34,59 +58,46 @@ def connect_to_elasticsearch():
                 return es_client
         except Exception as e:
             logger.warning(f"Fallo de conexión a Elasticsearch: {e}. Reintentando...")
-            import time
             time.sleep(5)
     logger.error("No se pudo conectar a Elasticsearch después de varios intentos.")
     return None
 
-def download_hdfs_data():
-    """Descarga datos de HDFS."""
-    try:
-        # Limpiar directorio temporal si existe
-        import shutil
-        if os.path.exists(LOCAL_TEMP_PATH):
-            shutil.rmtree(LOCAL_TEMP_PATH)
-            
-        os.makedirs(os.path.dirname(LOCAL_TEMP_PATH), exist_ok=True)
-        subprocess.run(['hdfs', 'dfs', '-get', HDFS_PATH, LOCAL_TEMP_PATH], check=True)
-        logger.info(f"Datos descargados de HDFS a {LOCAL_TEMP_PATH}")
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error descargando de HDFS: {e}")
-        return False
+def download_hdfs_data(all_partitions=False):
+    """Descarga de HDFS las particiones de la última corrida de batch_driver.py (o todas)."""
+    # Limpiar directorio temporal si existe
+    import shutil
+    if os.path.exists(LOCAL_TEMP_PATH):
+        shutil.rmtree(LOCAL_TEMP_PATH)
+    os.makedirs(LOCAL_TEMP_PATH)
+    if all_partitions:
+        partitions = fetch_partitions(HDFS_EVENTS_DIR, list(list_partitions(HDFS_EVENTS_DIR)), LOCAL_TEMP_PATH)
+    else:
+        partitions = fetch_batch(LOCAL_TEMP_PATH)
+    logger.info(f"{len(partitions)} particiones descargadas de HDFS a {LOCAL_TEMP_PATH}")
+    return partitions
 
-def parse_event_line(line):
-    """Convierte línea TSV a documento Elasticsearch."""
-    fields = line.strip().split('\t')
-    if len(fields) < 11:
-        return None
-    
-    try:
-        # Extraer coordenadas
-        lat = float(fields[4]) if fields[4] and fields[4] != 'null' else None
-        lon = float(fields[5]) if fields[5] and fields[5] != 'null' else None
-        
-        doc = {
-            'event_id': fields[0],
-            'type_original': fields[1],
-            'address': fields[2],
-            'report_time': fields[3],
-            'coordinates': {
-                'lat': lat,
-                'lon': lon
-            } if lat and lon else None,
-            'confidence': int(fields[6]) if fields[6] and fields[6] != 'null' else 0,
-            'reporter': fields[7],
-            'sector': fields[8] if fields[8] and fields[8] != 'null' else 'Desconocido',
-            'calle': fields[9] if fields[9] and fields[9] != 'null' else '',
-            'tipo_evento': fields[10],
-            'hora_reporte': fields[11] if len(fields) > 11 and fields[11] != 'null' else None,
-            '@timestamp': datetime.now().isoformat()
-        }
-        return doc
-    except (ValueError, IndexError) as e:
-        logger.warning(f"Error parseando línea: {e}")
-        return None
+def to_document(event, partition):
+    """Convierte un evento tipado de individual_events (de `partition`) a documento Elasticsearch."""
+    event = with_defaults(event)
+    lat, lon = event['latitude'], event['longitude']
+    return {
+        'event_id': event['event_id'],
+        'type_original': event['type_original'],
+        'address': event['address'],
+        'report_time': event['report_time'],
+        'coordinates': {
+            'lat': lat,
+            'lon': lon
+        } if lat is not None and lon is not None else None,
+        'confidence': event['confidence'],
+        'reporter': event['reporter'],
+        'sector': event['sector'],
+        'calle': event['calle'],
+        'tipo_evento': event['tipo_evento'],
+        'hora_reporte': event['hora_reporte'],
+        'partition': partition,
+        '@timestamp': datetime.now().isoformat()
+    }
 
 def create_index_if_not_exists(es_client):
     """Crea el índice si no existe."""
@@ -105,57 +116,193 @@ def create_index_if_not_exists(es_client):
                     "calle": {"type": "text"},
                     "tipo_evento": {"type": "keyword"},
                     "hora_reporte": {"type": "keyword"},
+                    "partition": {"type": "keyword"},
                     "@timestamp": {"type": "date"}
                 }
             }
         }
         es_client.indices.create(index=INDEX_NAME, body=mapping)
         logger.info(f"Índice '{INDEX_NAME}' creado con mapping optimizado.")
+    else:
+        # Índices creados antes de que existiera `partition` (los documentos viejos no lo tienen:
+        # --recreate los recarga con él)
+        es_client.indices.put_mapping(index=INDEX_NAME, properties={"partition": {"type": "keyword"}})
 
-def load_events_to_elasticsearch(es_client):
-    """Carga eventos individuales a Elasticsearch."""
-    if not download_hdfs_data():
+class BulkStats:
+    """Contadores de la carga, compartidos entre los hilos."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.latencies = []
+        self.results = Counter()
+        self.errors = Counter()
+        self.retries = 0
+
+    def record(self, latency, results, errors, retries):
+        with self.lock:
+            self.latencies.append(latency)
+            self.results.update(results)
+            self.errors.update(errors)
+            self.retries += retries
+
+    def summary(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            latencies = sorted(self.latencies)
+            batches = len(latencies)
+            indexed = sum(self.results.values())
+
+            def percentile(p):
+                if not latencies:
+                    return 0.0
+                return latencies[min(batches - 1, int(p * batches))]
+
+            return {
+                "indexed": indexed,
+                "created": self.results["created"],
+                "updated": self.results["updated"] + self.results["noop"],
+                "failed": sum(self.errors.values()),
+                "errors": dict(self.errors),
+                "retries": self.retries,
+                "batches": batches,
+                "elapsed_seconds": round(elapsed, 2),
+                "docs_per_second": round(indexed / elapsed, 2) if elapsed > 0 else 0,
+                "latency_p50": round(percentile(0.50), 3),
+                "latency_p95": round(percentile(0.95), 3),
+                "latency_max": round(latencies[-1], 3) if latencies else 0.0,
+            }
+
+
+def generate_actions(partitions, read_errors):
+    """Acciones de indexado de las particiones descargadas, una a la vez."""
+    for partition, part_files in sorted(partitions.items()):
+        for part_file in part_files:
+            try:
+                for event in read_records(part_file, PROCESSED_FIELDS):
+                    if not event['event_id']:
+                        read_errors['sin_event_id'] += 1
+                        continue
+                    yield event['event_id'], to_document(event, partition)
+            except Exception as e:
+                logger.error(f"Error leyendo archivo {part_file} ({partition}): {e}")
+                read_errors['lectura'] += 1
+
+
+def chunked(actions, size):
+    actions = iter(actions)
+    while True:
+        chunk = list(islice(actions, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def send_chunk(es_client, chunk, stats):
+    """Envía un lote con la API _bulk; reintenta con espera exponencial los documentos rechazados."""
+    started = time.perf_counter()
+    results, errors = Counter(), Counter()
+    pending = chunk
+    retries = 0
+    for attempt in range(ES_BULK_MAX_RETRIES + 1):
+        if attempt:
+            retries += len(pending)
+            time.sleep(ES_BULK_INITIAL_BACKOFF * 2 ** (attempt - 1))
+        operations = []
+        for doc_id, document in pending:
+            operations.append({"index": {"_index": INDEX_NAME, "_id": doc_id}})
+            operations.append(document)
+        try:
+            response = es_client.bulk(operations=operations,
+                                      filter_path="items.*.status,items.*.result,items.*.error.type")
+        except ApiError as e:
+            if e.meta.status in RETRY_STATUSES:
+                continue
+            errors[f"http_{e.meta.status}"] += len(pending)
+            pending = []
+            break
+        rejected = []
+        for action, item in zip(pending, response["items"]):
+            result = item["index"]
+            if result["status"] < 300:
+                results[result.get("result", "created")] += 1
+            elif result["status"] in RETRY_STATUSES:
+                rejected.append(action)
+            else:
+                errors[result.get("error", {}).get("type", f"http_{result['status']}")] += 1
+        pending = rejected
+        if not pending:
+            break
+    if pending:
+        errors["rechazado_tras_reintentos"] += len(pending)
+    stats.record(time.perf_counter() - started, results, errors, retries)
+
+
+def delete_partitions(es_client, removed):
+    """Borra los documentos de las particiones eliminadas; devuelve False si alguno no se pudo borrar."""
+    response = es_client.delete_by_query(index=INDEX_NAME, query={"terms": {"partition": removed}},
+                                         conflicts="proceed", refresh=True)
+    logger.info(f"{response['deleted']} eventos borrados de {len(removed)} particiones eliminadas: {', '.join(removed)}")
+    if response.get("failures"):
+        logger.error(f"{len(response['failures'])} eventos no se pudieron borrar; primero: {response['failures'][0]}")
         return False
+    return True
+
+def load_events_to_elasticsearch(es_client, all_partitions=False):
+    """Carga eventos individuales a Elasticsearch."""
+    partitions = download_hdfs_data(all_partitions)
     
     create_index_if_not_exists(es_client)
     
-    # Leer eventos y prepararlos para bulk insert
-    documents = []
-    hdfs_dir = Path(LOCAL_TEMP_PATH)
+    # Con todas las particiones el índice se recreó: no queda nada de las borradas
+    batch = None if all_partitions else read_batch()
+    removed = batch.get("removed", []) if batch else []
+    deleted = delete_partitions(es_client, removed) if removed else True
     
-    for part_file in hdfs_dir.glob('part-*'):
-        try:
-            with open(part_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    doc = parse_event_line(line)
-                    if doc:
-                        documents.append({
-                            "_index": INDEX_NAME,
-                            "_source": doc
-                        })
-        except Exception as e:
-            logger.error(f"Error leyendo archivo {part_file}: {e}")
+    stats = BulkStats()
+    read_errors = Counter()
+    actions = generate_actions(partitions, read_errors)
+    # Como mucho dos lotes por hilo en memoria: el generador se consume a medida que se envía
+    with ThreadPoolExecutor(max_workers=ES_BULK_WORKERS) as pool:
+        in_flight = set()
+        for chunk in chunked(actions, ES_BULK_CHUNK_SIZE):
+            if len(in_flight) >= 2 * ES_BULK_WORKERS:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            in_flight.add(pool.submit(send_chunk, es_client, chunk, stats))
+        for future in in_flight:
+            future.result()
     
-    # Bulk insert
-    if documents:
-        from elasticsearch.helpers import bulk
-        try:
-            bulk(es_client, documents)
-            logger.info(f"Se han indexado {len(documents)} eventos individuales en Elasticsearch.")
-            return True
-        except Exception as e:
-            logger.error(f"Error en bulk insert: {e}")
-            return False
-    else:
+    summary = stats.summary()
+    if read_errors:
+        logger.error(f"Eventos o archivos no leídos: {dict(read_errors)}")
+    if not summary["batches"]:
         logger.warning("No se encontraron documentos para indexar.")
+        return deleted and not read_errors
+    logger.info(f"Indexados {summary['indexed']} eventos ({summary['created']} nuevos, {summary['updated']} reemplazados) "
+                f"en {summary['elapsed_seconds']}s: {summary['docs_per_second']} docs/s, {summary['batches']} lotes de "
+                f"hasta {ES_BULK_CHUNK_SIZE} con {ES_BULK_WORKERS} hilos, latencia p50={summary['latency_p50']}s "
+                f"p95={summary['latency_p95']}s max={summary['latency_max']}s, {summary['retries']} reintentos")
+    if summary["failed"]:
+        logger.error(f"{summary['failed']} eventos no se indexaron: {summary['errors']}")
         return False
+    return deleted
 
 def main():
+    parser = argparse.ArgumentParser(description="Carga individual_events en Elasticsearch")
+    parser.add_argument("--recreate", action="store_true",
+                        help="Borra el índice y carga todas las particiones (limpia duplicados de cargas sin _id)")
+    args = parser.parse_args()
+
     es_client = connect_to_elasticsearch()
     if not es_client:
         return False
+    if args.recreate:
+        es_client.indices.delete(index=INDEX_NAME, ignore_unavailable=True)
+        logger.info(f"Índice '{INDEX_NAME}' borrado; se recarga completo.")
     
-    return load_events_to_elasticsearch(es_client)
+    return load_events_to_elasticsearch(es_client, all_partitions=args.recreate)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(0 if main() else 1)
@@ -10,11 +10,19 @@ until hdfs dfsadmin -safemode get | grep -q 'OFF'; do
 done
 echo "Hadoop Namenode está listo."
 
-echo "2. Exportando datos de MongoDB a HDFS..."
+echo "2. Exportando datos nuevos de MongoDB a HDFS..."
+# EXPORT_MODE=full reconstruye waze_input completo; por defecto solo se exporta lo nuevo desde la marca de agua
 python3 /scripts_auxiliares/export_mongo_to_hdfs.py
 
-echo "3. Ejecutando script Pig (Filtrado y Enriquecimiento)..."
-pig -f /pig_scripts/01_filter_homogenize.pig
+echo "3. Filtrando y enriqueciendo las particiones dt=/hr= nuevas o cambiadas..."
+# Compara waze_input con el manifiesto de la última corrida; BATCH_ENGINE=auto usa Python bajo
+# BATCH_ENGINE_MAX_BYTES y Pig (un solo script sobre homogenize_macro.pig) por encima
+BATCH_FILE=${BATCH_FILE:-/tmp/waze_batch.json}
+python3 /scripts_auxiliares/batch_driver.py
+if [ ! -f "$BATCH_FILE" ]; then
+  echo "--- Sin particiones nuevas ni cambiadas desde la última corrida; nada que procesar ---"
+  exit 0
+fi
 
 echo "4. Cargando eventos individuales a Elasticsearch..."
 python3 /scripts_auxiliares/load_individual_events_to_elasticsearch.py
@@ -22,4 +30,14 @@ python3 /scripts_auxiliares/load_individual_events_to_elasticsearch.py
 echo "5. Cargando eventos en caché Redis por criterios..."
 python3 /scripts_auxiliares/cache_events_by_criteria.py
 
+echo "6. Actualizando los resúmenes (comuna, tipo, diario, por hora) con las particiones del lote..."
+python3 /scripts_auxiliares/aggregate_summaries.py
+
+echo "7. Cargando resúmenes a Redis y Elasticsearch..."
+python3 /scripts_auxiliares/load_pig_results_to_redis.py
+python3 /scripts_auxiliares/load_pig_results_to_elasticsearch.py
+
+# El lote ya llegó a todos los pasos; si algo falló antes, la próxima corrida lo vuelve a entregar
+rm -f "$BATCH_FILE"
+
 echo "--- Pipeline finalizado con éxito ---"
\ No newline at end of file
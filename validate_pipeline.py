@@ -200,31 +200,32 @@ def test_scraper_data():
         log_error("Scraper no está corriendo")
         return False
     
-    # Verificar que existe el archivo de datos
+    # Verificar que existen segmentos del log de eventos (el scraper ya no escribe waze_events.json)
     success, output, _ = run_command(
-        "docker-compose exec -T scraper test -f /app/data/waze_events.json"
+        "docker-compose exec -T scraper sh -c 'ls /app/data/events/segment-*.jsonl'"
     )
     
     if not success:
-        log_warn("Archivo de datos del scraper no existe aún")
+        log_warn("El log de eventos del scraper no tiene segmentos aún")
         return False
+    segments = len(output.split())
     
-    # Verificar contenido del archivo
+    # Verificar contenido de los segmentos
     success, output, _ = run_command(
-        "docker-compose exec -T scraper wc -l /app/data/waze_events.json"
+        "docker-compose exec -T scraper sh -c 'cat /app/data/events/segment-*.jsonl | wc -l'"
     )
     
     if success:
         try:
             lines = int(output.strip().split()[0])
             if lines > 0:
-                log_info(f"✓ Archivo del scraper tiene {lines} líneas")
+                log_info(f"✓ Log del scraper tiene {lines} eventos en {segments} segmentos")
                 return True
             else:
-                log_warn("Archivo del scraper está vacío")
+                log_warn("Los segmentos del log del scraper están vacíos")
                 return False
         except (ValueError, IndexError):
-            log_warn("No se pudo verificar el contenido del archivo del scraper")
+            log_warn("No se pudo verificar el contenido del log del scraper")
             return False
     
     return False